@@ -0,0 +1,187 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework import authentication, exceptions
+
+
+class SessionAuthentication(authentication.SessionAuthentication):
+    """
+    DRF's session authentication with an `aauthenticate` counterpart for async views.
+    """
+
+    async def aauthenticate(self, request):
+        user = await request._request.auser()
+        if not user or not user.is_active:
+            return None
+
+        self.enforce_csrf(request)
+        return (user, None)
+
+
+class TokenAuthentication(authentication.TokenAuthentication):
+    """
+    DRF's token authentication with an `aauthenticate` counterpart for async views.
+    """
+
+    def authenticate(self, request):
+        key = self.get_key(request)
+        if key is None:
+            return None
+        return self.authenticate_credentials(key)
+
+    async def aauthenticate(self, request):
+        key = self.get_key(request)
+        if key is None:
+            return None
+        return await self.aauthenticate_credentials(key)
+
+    def get_key(self, request):
+        """
+        Returns the token key from the "Authorization" header, or `None` when the
+        header doesn't carry a token.
+        """
+        auth = authentication.get_authorization_header(request).split()
+
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+
+        if len(auth) == 1:
+            msg = _("Invalid token header. No credentials provided.")
+            raise exceptions.AuthenticationFailed(msg)
+        elif len(auth) > 2:
+            msg = _("Invalid token header. Token string should not contain spaces.")
+            raise exceptions.AuthenticationFailed(msg)
+
+        try:
+            return auth[1].decode()
+        except UnicodeError:
+            msg = _(
+                "Invalid token header. Token string should not contain invalid characters."
+            )
+            raise exceptions.AuthenticationFailed(msg)
+
+    async def aauthenticate_credentials(self, key):
+        model = self.get_model()
+        try:
+            token = await model.objects.select_related("user").aget(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_("Invalid token."))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_("User inactive or deleted."))
+
+        return (token.user, token)
+
+
+class TokenCache:
+    """
+    An in-process LRU cache of authenticated tokens whose entries expire after a TTL,
+    optionally backed by a cache shared between processes.
+
+    Configured by `settings.TOKEN_AUTH_CACHE`. Tokens are cached with their user, so
+    both have to be invalidated on change, see `broker.users.models`. Other processes
+    only drop their in-process entry when it expires.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        alias = settings.TOKEN_AUTH_CACHE["CACHE_ALIAS"]
+        return caches[alias] if alias else None
+
+    def get(self, key):
+        token = self._get_local(key)
+        if token is None and self.shared is not None:
+            token = self.shared.get(self._shared_key(key))
+            if token is not None:
+                self._set_local(key, token)
+        return token
+
+    async def aget(self, key):
+        token = self._get_local(key)
+        if token is None and self.shared is not None:
+            token = await self.shared.aget(self._shared_key(key))
+            if token is not None:
+                self._set_local(key, token)
+        return token
+
+    def set(self, key, token):
+        self._set_local(key, token)
+        if self.shared is not None:
+            self.shared.set(self._shared_key(key), token, self._timeout)
+
+    async def aset(self, key, token):
+        self._set_local(key, token)
+        if self.shared is not None:
+            await self.shared.aset(self._shared_key(key), token, self._timeout)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        if self.shared is not None:
+            self.shared.delete_many([self._shared_key(key) for key in keys])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def _timeout(self):
+        return settings.TOKEN_AUTH_CACHE["TIMEOUT"]
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, token = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return token
+
+    def _set_local(self, key, token):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self._timeout, token)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.TOKEN_AUTH_CACHE["MAX_SIZE"]:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _shared_key(key):
+        # Tokens are credentials, keep them out of the cache keys.
+        return "auth-token:" + hashlib.sha256(key.encode()).hexdigest()
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that skips the token and user query for tokens in
+    `token_cache`.
+    """
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, token)
+        return (token.user, token)
+
+    async def aauthenticate_credentials(self, key):
+        token = await token_cache.aget(key)
+        if token is None:
+            user, token = await super().aauthenticate_credentials(key)
+            await token_cache.aset(key, token)
+        return (token.user, token)
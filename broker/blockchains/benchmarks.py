@@ -0,0 +1,391 @@
+"""
+In-process benchmarks of the TX and wallet hot paths, run by `run_benchmarks`.
+
+A benchmark sets up its data and returns a round: a callable doing `number`
+operations, timed over several rounds. Rates are compared with the baselines
+stored in `benchmarks.json` next to this module.
+"""
+
+import asyncio
+import json
+import statistics
+import threading
+import time
+from decimal import Decimal
+from pathlib import Path
+
+import uuid_utils as uuid
+from django.core.management import call_command
+from django.db import connections
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from broker.renderers import JSONRenderer
+from broker.users.models import User
+
+from .models import TX, Wallet
+from .serializers import TXSerializer, WalletSerializer
+from .views import TXViewSet, WalletViewSet
+
+BASELINES_PATH = Path(__file__).with_name("benchmarks.json")
+
+# name: (function, unit, default number of operations per round)
+BENCHMARKS = {}
+
+
+def benchmark(name: str, unit: str, number: int):
+    def register(function):
+        BENCHMARKS[name] = (function, unit, number)
+        return function
+
+    return register
+
+
+def create_user() -> User:
+    user = User(username=f"benchmark_{uuid.uuid7().hex}")
+    user.set_unusable_password()
+    user.save()
+    return user
+
+
+def new_txid() -> str:
+    return uuid.uuid7().hex.rjust(64, "0")
+
+
+def create_wallets(user: User, count: int) -> list[Wallet]:
+    return [
+        Wallet.objects.create(
+            user=user, label=f"Benchmark {position}", balance=Decimal("1000000")
+        )
+        for position in range(count)
+    ]
+
+
+def create_txs_in_threads(wallets: list[Wallet], threads: int, number: int) -> int:
+    """
+    Creates `number` TXs from `threads` threads, thread `i` into wallet
+    `i % len(wallets)`.
+    """
+
+    def create(wallet, count):
+        try:
+            for _ in range(count):
+                TX.objects.create(
+                    wallet=wallet,
+                    txid=new_txid(),
+                    amount=Decimal("0.000000000000000001"),
+                )
+        finally:
+            connections.close_all()
+
+    workers = [
+        threading.Thread(
+            target=create,
+            args=(
+                Wallet.objects.get(pk=wallets[position % len(wallets)].pk),
+                number // threads + (position < number % threads),
+            ),
+        )
+        for position in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return number
+
+
+@benchmark("tx.create.contended", unit="TXs", number=400)
+def tx_create_contended(number, threads):
+    """
+    `TXManager.create` from all threads into the same wallet, whose balance row
+    they queue up for.
+    """
+    wallets = create_wallets(create_user(), 1)
+    return lambda: create_txs_in_threads(wallets, threads, number)
+
+
+@benchmark("tx.create.spread", unit="TXs", number=400)
+def tx_create_spread(number, threads):
+    """
+    `TXManager.create` from every thread into a wallet of its own.
+    """
+    wallets = create_wallets(create_user(), threads)
+    return lambda: create_txs_in_threads(wallets, threads, number)
+
+
+@benchmark("serializer.tx.validate", unit="TXs", number=2000)
+def tx_serializer_validate(number, threads):
+    (wallet,) = create_wallets(create_user(), 1)
+    data = {"wallet": wallet.pk, "txid": "0" * 64, "amount": "12.345678901234567890"}
+
+    def validate():
+        for _ in range(number):
+            TXSerializer(data=data).is_valid(raise_exception=True)
+        return number
+
+    return validate
+
+
+@benchmark("serializer.wallet.validate", unit="wallets", number=2000)
+def wallet_serializer_validate(number, threads):
+    user = create_user()
+    data = {"user": user.pk, "label": "Savings", "balance": "12.5", "status": "A"}
+
+    def validate():
+        for _ in range(number):
+            WalletSerializer(data=data).is_valid(raise_exception=True)
+        return number
+
+    return validate
+
+
+def render_page(viewset, instances, number):
+    """
+    Serializes and renders a page of `instances`, `number` resource objects each.
+    """
+    request = Request(APIRequestFactory().get("/"))
+    view = viewset(action="list", request=request, format_kwarg=None, kwargs={})
+    renderer = JSONRenderer()
+    renderer_context = {"view": view, "request": request, "args": (), "kwargs": {}}
+
+    def render():
+        data = {
+            "results": view.get_serializer(instances, many=True).data,
+            "links": {"first": "http://testserver/", "next": None, "prev": None},
+        }
+        renderer.render(data, renderer.media_type, renderer_context)
+        return number
+
+    return render
+
+
+@benchmark("serializer.tx.render", unit="TXs", number=1000)
+def tx_serializer_render(number, threads):
+    wallet_id = str(uuid.uuid7())
+    txs = [
+        TX(
+            id=str(uuid.uuid7()),
+            wallet_id=wallet_id,
+            txid=f"{position:064x}",
+            amount=Decimal("-0.000000000000000001") * position,
+        )
+        for position in range(number)
+    ]
+    return render_page(TXViewSet, txs, number)
+
+
+@benchmark("serializer.wallet.render", unit="wallets", number=1000)
+def wallet_serializer_render(number, threads):
+    wallets = [
+        Wallet(
+            id=str(uuid.uuid7()),
+            user_id=uuid.uuid4(),
+            label=f"Wallet {position}",
+            balance=Decimal("12345678.123456789012345678"),
+        )
+        for position in range(number)
+    ]
+    return render_page(WalletViewSet, wallets, number)
+
+
+@benchmark("permissions.wallet", unit="checks", number=20000)
+def wallet_permissions(number, threads):
+    """
+    The permission checks of updating a wallet, and of creating a TX into it.
+    """
+    user = create_user()
+    (wallet,) = create_wallets(user, 1)
+    views = []
+    for viewset, action in ((WalletViewSet, "partial_update"), (TXViewSet, "create")):
+        request = APIRequestFactory().post("/")
+        force_authenticate(request, user=user)
+        request = Request(request)
+        request.user  # Authenticated up front, like the view does.
+        views.append(
+            viewset(action=action, request=request, format_kwarg=None, kwargs={})
+        )
+
+    def check():
+        for position in range(number):
+            view = views[position % 2]
+            view.check_permissions(view.request)
+            view.check_object_permissions(view.request, wallet)
+        return number
+
+    return check
+
+
+async def call_asgi(application, method, path, query="", body=b"", headers=()):
+    """
+    Runs a request through the ASGI `application` in memory, returns its status and
+    body.
+    """
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [
+            (b"host", b"testserver"),
+            (b"content-length", str(len(body)).encode()),
+            *headers,
+        ],
+        "client": ("127.0.0.1", 0),
+        "server": ("testserver", 80),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    disconnected = asyncio.Event()
+    response = {"body": b""}
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    await application(scope, receive, send)
+    disconnected.set()
+    return response["status"], response["body"]
+
+
+def asgi_requests(number, request):
+    """
+    Returns a round of `number` requests through the ASGI app of `broker.asgi`,
+    made by `request(application, position)`.
+    """
+    from broker.asgi import application
+
+    async def requests():
+        for position in range(number):
+            status, body = await request(application, position)
+            if status >= 400:
+                raise AssertionError(f"The request answered {status}: {body[:500]}")
+        return number
+
+    return lambda: asyncio.run(requests())
+
+
+def get_auth_header(user: User):
+    return (b"authorization", f"Token {user.auth_token.key}".encode())
+
+
+@benchmark("asgi.wallet.retrieve", unit="requests", number=200)
+def asgi_wallet_retrieve(number, threads):
+    user = create_user()
+    (wallet,) = create_wallets(user, 1)
+    headers = [get_auth_header(user)]
+    return asgi_requests(
+        number,
+        lambda application, position: call_asgi(
+            application, "GET", f"/api/v1/wallets/{wallet.pk}/", headers=headers
+        ),
+    )
+
+
+@benchmark("asgi.wallet.transactions", unit="requests", number=200)
+def asgi_wallet_transactions(number, threads):
+    user = create_user()
+    (wallet,) = create_wallets(user, 1)
+    for _ in range(50):
+        TX.objects.create(wallet=wallet, txid=new_txid(), amount=Decimal("1"))
+    headers = [get_auth_header(user)]
+    return asgi_requests(
+        number,
+        lambda application, position: call_asgi(
+            application,
+            "GET",
+            f"/api/v1/wallets/{wallet.pk}/transactions/",
+            query="page%5Bsize%5D=20",
+            headers=headers,
+        ),
+    )
+
+
+@benchmark("asgi.tx.create", unit="requests", number=200)
+def asgi_tx_create(number, threads):
+    user = create_user()
+    (wallet,) = create_wallets(user, 1)
+    headers = [
+        get_auth_header(user),
+        (b"content-type", b"application/vnd.api+json"),
+    ]
+
+    def create(application, position):
+        body = {
+            "data": {
+                "type": "TX",
+                "attributes": {
+                    "wallet": str(wallet.pk),
+                    "txid": new_txid(),
+                    "amount": "0.5",
+                },
+            }
+        }
+        return call_asgi(
+            application,
+            "POST",
+            "/api/v1/transactions/",
+            body=json.dumps(body).encode(),
+            headers=headers,
+        )
+
+    return asgi_requests(number, create)
+
+
+def run_benchmark(name, rounds=5, threads=8, scale=1.0):
+    """
+    Runs the benchmark `name` for a warm-up round and `rounds` timed ones. Returns
+    its median, lowest and highest rates in operations per second.
+
+    The data it created is flushed afterwards, so it needs a database of its own,
+    like the test databases `run_benchmarks` sets up.
+    """
+    function, unit, number = BENCHMARKS[name]
+    try:
+        run = function(max(1, round(number * scale)), threads)
+        run()
+        rates = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            operations = run()
+            rates.append(operations / (time.perf_counter() - start))
+    finally:
+        call_command("flush", interactive=False, verbosity=0)
+    return {
+        "unit": unit,
+        "rate": statistics.median(rates),
+        "min": min(rates),
+        "max": max(rates),
+    }
+
+
+def compare(results: dict, baselines: dict, tolerance: float) -> dict:
+    """
+    Returns the change of the rate of every benchmark of `results` from its
+    baseline, and whether it regressed by more than `tolerance`, a fraction.
+    """
+    comparison = {}
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            comparison[name] = {"baseline": None, "change": None, "regressed": False}
+            continue
+        change = result["rate"] / baseline["rate"] - 1
+        comparison[name] = {
+            "baseline": baseline["rate"],
+            "change": change,
+            "regressed": change < -tolerance,
+        }
+    return comparison
@@ -0,0 +1,20 @@
+import uuid
+
+from rest_framework import serializers
+
+
+class WalletRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Resolves a wallet id to an unsaved `Wallet` stub instead of fetching the row.
+
+    Used on the TX write path, where the wallet's existence and balance are
+    checked by the conditional update in `TXManager.create`.
+    """
+
+    def to_internal_value(self, data):
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        try:
+            return self.get_queryset().model(pk=uuid.UUID(str(data)))
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
@@ -0,0 +1,31 @@
+import django_filters
+from django_uuid7 import UUID7Field
+
+from .models import TX
+
+
+class UUIDInFilter(django_filters.BaseInFilter, django_filters.UUIDFilter):
+    pass
+
+
+class TXFilterSet(django_filters.FilterSet):
+    """
+    Filters TXs by `filter[wallet]`, `filter[wallet.in]`, amount ranges like
+    `filter[amount.gte]` and id ranges like `filter[id.gt]`.
+
+    The wallet is matched by id rather than resolved to a row, and ids compare in
+    UUID7 time order, so every filter seeks on an index of `TX`.
+    """
+
+    wallet = django_filters.UUIDFilter(field_name="wallet_id")
+    wallet__in = UUIDInFilter(field_name="wallet_id", lookup_expr="in")
+
+    class Meta:
+        model = TX
+        fields = {
+            "id": ["exact", "lt", "lte", "gt", "gte"],
+            "amount": ["exact", "lt", "lte", "gt", "gte"],
+        }
+        filter_overrides = {
+            UUID7Field: {"filter_class": django_filters.UUIDFilter},
+        }
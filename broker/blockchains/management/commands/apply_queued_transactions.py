@@ -0,0 +1,69 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from broker.db import ContentionError
+
+from ...models import QueuedTX
+
+
+class Command(BaseCommand):
+    help = (
+        "Applies the TXs queued by write-behind ingestion, see TX_WRITE_BEHIND. "
+        "Every wallet's TXs are applied in batches, each in one transaction with a "
+        "single balance update. Any number of workers can run: a wallet's advisory "
+        "lock keeps it to one of them at a time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Queued TXs applied per wallet and transaction.",
+        )
+        parser.add_argument(
+            "--wallets",
+            type=int,
+            default=100,
+            help="Wallets with queued TXs looked up per round.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Keep running, polling the queue this many seconds after it ran dry.",
+        )
+
+    def handle(self, *args, batch_size, wallets, interval, **options):
+        while True:
+            applied, rejected = self.drain(batch_size, wallets)
+            if applied or rejected:
+                self.stdout.write(f"Applied {applied} TXs, rejected {rejected}.")
+            if not interval:
+                return
+            time.sleep(interval)
+
+    @staticmethod
+    def drain(batch_size, wallets):
+        """
+        Applies queued TXs until none are left but those of wallets other workers
+        hold. Returns the numbers of applied and rejected TXs.
+
+        A wallet whose batch still conflicted after its retries is left for the
+        next round.
+        """
+        applied = rejected = 0
+        while True:
+            progress = False
+            for wallet_id in QueuedTX.objects.pending_wallets(wallets):
+                try:
+                    result = QueuedTX.objects.apply(wallet_id, batch_size)
+                except ContentionError:
+                    continue
+                if result is not None:
+                    applied += result[0]
+                    rejected += result[1]
+                    progress = True
+            if not progress:
+                return applied, rejected
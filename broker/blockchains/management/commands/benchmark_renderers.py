@@ -0,0 +1,80 @@
+import time
+from decimal import Decimal
+
+import uuid_utils as uuid
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework_json_api.renderers import JSONRenderer
+
+from broker.renderers import JSONRenderer as FastJSONRenderer
+
+from ...models import TX, Wallet
+from ...views import TXViewSet, WalletViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures how many pages of TXs and wallets per second the JSON:API renderer "
+        "of `rest_framework_json_api` and `broker.renderers.JSONRenderer` render, "
+        "and checks that both render the same bytes. No database is needed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--page-size", type=int, default=1000, help="Resource objects per page."
+        )
+        parser.add_argument(
+            "--rounds", type=int, default=50, help="Pages rendered per renderer."
+        )
+
+    def handle(self, *args, page_size, rounds, **options):
+        wallets = [
+            Wallet(
+                id=str(uuid.uuid7()),
+                user_id=position,
+                label=f"Wallet {position} – “savings”",
+                balance=Decimal("12345678.123456789012345678"),
+            )
+            for position in range(page_size)
+        ]
+        txs = [
+            TX(
+                id=str(uuid.uuid7()),
+                wallet_id=wallets[position].id,
+                txid=f"{position:064x}",
+                amount=Decimal("-0.000000000000000001") * position,
+            )
+            for position in range(page_size)
+        ]
+
+        for viewset, instances in ((TXViewSet, txs), (WalletViewSet, wallets)):
+            data, renderer_context = self.serialize(viewset, instances)
+            results = {}
+            for renderer in (JSONRenderer(), FastJSONRenderer()):
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    content = renderer.render(
+                        data, renderer.media_type, renderer_context
+                    )
+                duration = time.perf_counter() - start
+                results[type(renderer).__module__] = content
+                self.stdout.write(
+                    f"{viewset.__name__:<14} {type(renderer).__module__:<32} "
+                    f"{rounds / duration:8.1f} pages/s "
+                    f"{rounds * page_size / duration:10.0f} objects/s "
+                    f"{len(content) / 1024:8.0f} KiB"
+                )
+            if len(set(results.values())) != 1:
+                raise CommandError(f"The renderers disagree on {viewset.__name__}.")
+
+    @staticmethod
+    def serialize(viewset, instances):
+        request = Request(APIRequestFactory().get("/"))
+        view = viewset(action="list", request=request, format_kwarg=None, kwargs={})
+        serializer = view.get_serializer(instances, many=True)
+        data = {
+            "results": serializer.data,
+            "links": {"first": "http://testserver/", "next": None, "prev": None},
+        }
+        return data, {"view": view, "request": request, "args": (), "kwargs": {}}
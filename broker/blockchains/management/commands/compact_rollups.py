@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...models import WalletDailyRollup
+
+
+class Command(BaseCommand):
+    help = (
+        "Folds the rollup deltas appended by TX inserts into the daily rollups of "
+        "their wallets. Stats read the deltas not folded yet as well, so their cost "
+        "grows with the TXs since the last run: schedule it, or keep it running with "
+        "--interval. Any number of workers can run, each skips the deltas another one "
+        "holds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10_000,
+            help="Rollup deltas folded per transaction.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Keep running, starting a new run this many seconds after the last.",
+        )
+
+    def handle(self, *args, batch_size, interval, **options):
+        while True:
+            compacted = folded = WalletDailyRollup.objects.compact(batch_size)
+            while folded == batch_size:
+                folded = WalletDailyRollup.objects.compact(batch_size)
+                compacted += folded
+            if compacted:
+                self.stdout.write(f"Folded {compacted} rollup deltas.")
+            if not interval:
+                return
+            time.sleep(interval)
@@ -0,0 +1,331 @@
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.core.validators import RegexValidator
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connections, router, transaction
+import uuid_utils as uuid
+
+from ...models import TX, BalanceCheckpoint, UniqueTXID, Wallet, WalletSlot
+
+STAGING_TABLE = "import_tx_staging"
+PENDING_TABLE = "import_tx_pending"
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads historical TXs from CSV or NDJSON files. Rows are copied into a staging "
+        "table, merged into the TX table skipping known txids, and the balances of the "
+        "affected wallets are updated in the same statement. Imported TXs keep their "
+        "ids, those below the watermark of a wallet's reconciliation checkpoint are "
+        "added to it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", type=Path)
+        parser.add_argument(
+            "--format",
+            choices=("csv", "ndjson"),
+            help="File format, guessed from the file extension by default.",
+        )
+        parser.add_argument(
+            "--wallet",
+            help="Wallet of the rows without a wallet column, like those of an export.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report what would be imported and the wallets that would go negative.",
+        )
+        parser.add_argument(
+            "--progress-every",
+            type=int,
+            default=100_000,
+            help="Report progress every this many rows.",
+        )
+
+    def handle(self, *args, paths, format, wallet, dry_run, progress_every, **options):
+        self.started_at = time.monotonic()
+        self.progress_every = progress_every
+        self.connection = connections[router.db_for_write(TX)]
+        # Matched directly, running the field validators costs more than the COPY.
+        self.txid_regex = next(
+            validator.regex
+            for validator in TX._meta.get_field("txid").validators
+            if isinstance(validator, RegexValidator)
+        )
+        self.tables = {
+            "tx": TX._meta.db_table,
+            "txid": UniqueTXID._meta.db_table,
+            "wallet": Wallet._meta.db_table,
+            "slot": WalletSlot._meta.db_table,
+            "staging": STAGING_TABLE,
+            "pending": PENDING_TABLE,
+            "checkpoint": BalanceCheckpoint._meta.db_table,
+        }
+
+        with transaction.atomic(using=self.connection.alias):
+            with self.connection.cursor() as cursor:
+                self.cursor = cursor
+                staged = self.stage(paths, format, wallet)
+                pending, unknown_wallets = self.select_pending()
+                self.stdout.write(
+                    f"Staged {staged} rows: {pending} new, "
+                    f"{staged - pending - unknown_wallets} with known or repeated txids, "
+                    f"{unknown_wallets} of unknown wallets."
+                )
+
+                if not dry_run:
+                    self.lock_wallets()
+                negative = self.get_negative_balances()
+                if dry_run:
+                    self.report_negative_balances(negative)
+                    transaction.set_rollback(True, using=self.connection.alias)
+                    return
+                if negative:
+                    self.report_negative_balances(negative)
+                    raise CommandError("Nothing was imported.")
+
+                try:
+                    inserted, wallet_ids, sharded_ids = self.merge()
+                except IntegrityError as e:
+                    raise CommandError(
+                        "A TX id of the files is taken or repeated, nothing was "
+                        "imported."
+                    ) from e
+                # A concurrent writer may have taken some txids since the check above.
+                if self.get_negative_balances(applied=True):
+                    raise CommandError(
+                        "Wallets would go negative after concurrent writes, nothing "
+                        "was imported."
+                    )
+                for sharded in Wallet.objects.filter(pk__in=sharded_ids):
+                    Wallet.objects.reshard(sharded, sharded.slot_count)
+                self.update_checkpoints()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {inserted} TXs into {len(wallet_ids)} wallets in "
+                f"{time.monotonic() - self.started_at:.1f}s."
+            )
+        )
+
+    def stage(self, paths, format, wallet):
+        """
+        Copies the rows of every file into the staging table and returns their number.
+        """
+        self.cursor.execute(
+            """
+            CREATE TEMPORARY TABLE {staging} (
+                seq bigint NOT NULL,
+                id varchar NOT NULL,
+                wallet_id varchar NOT NULL,
+                txid varchar(100) NOT NULL,
+                amount numeric(26, 18) NOT NULL
+            ) ON COMMIT DROP
+            """.format(**self.tables)
+        )
+
+        staged = 0
+        with self.cursor.copy(
+            "COPY {staging} (seq, id, wallet_id, txid, amount) FROM STDIN".format(
+                **self.tables
+            )
+        ) as copy:
+            for path in paths:
+                for line, record in self.read(path, format):
+                    copy.write_row((staged, *self.clean(path, line, record, wallet)))
+                    staged += 1
+                    if staged % self.progress_every == 0:
+                        self.report_progress(staged)
+        self.cursor.execute("ANALYZE {staging}".format(**self.tables))
+        return staged
+
+    def read(self, path, format):
+        format = format or path.suffix.lstrip(".").lower()
+        if format not in ("csv", "ndjson", "jsonl"):
+            raise CommandError(f"{path}: unknown format, pass --format.")
+
+        with path.open(newline="") as file:
+            if format == "csv":
+                # Line 1 is the header.
+                yield from enumerate(csv.DictReader(file), start=2)
+                return
+            for line, text in enumerate(file, start=1):
+                if text.strip():
+                    try:
+                        yield line, json.loads(text, parse_float=Decimal)
+                    except ValueError as e:
+                        raise CommandError(f"{path}:{line}: {e}") from e
+
+    def clean(self, path, line, record, wallet):
+        """
+        Returns the staging columns of a record, raising `CommandError` for an invalid
+        one so nothing of a broken file gets imported.
+        """
+        try:
+            wallet_id = record.get("wallet") or record.get("wallet_id") or wallet
+            if not wallet_id:
+                raise ValidationError("Missing wallet.")
+            tx_id = record.get("id") or uuid.uuid7()
+            txid = record.get("txid") or ""
+            if not self.txid_regex.match(txid):
+                raise ValidationError("Invalid txid.")
+            amount = Decimal(str(record.get("amount")))
+            if not amount.is_finite():
+                raise ValidationError("Invalid amount.")
+            return (
+                str(uuid.UUID(str(tx_id))),
+                str(uuid.UUID(str(wallet_id))),
+                txid,
+                amount,
+            )
+        except (ValidationError, ValueError, InvalidOperation) as e:
+            message = "; ".join(getattr(e, "messages", [str(e)]))
+            raise CommandError(f"{path}:{line}: {message}") from e
+
+    def select_pending(self):
+        """
+        Keeps the first row of every txid that is new and of a known wallet. Returns
+        the number of pending rows and of rows with an unknown wallet.
+        """
+        self.cursor.execute(
+            """
+            CREATE TEMPORARY TABLE {pending} ON COMMIT DROP AS
+            SELECT DISTINCT ON (s.txid) s.id, s.wallet_id, s.txid, s.amount
+            FROM {staging} s
+            JOIN {wallet} w ON w.id = s.wallet_id
+            WHERE NOT EXISTS (SELECT 1 FROM {txid} t WHERE t.txid = s.txid)
+            ORDER BY s.txid, s.seq
+            """.format(**self.tables)
+        )
+        pending = self.cursor.rowcount
+        self.cursor.execute(
+            """
+            SELECT count(*) FROM {staging} s
+            WHERE NOT EXISTS (SELECT 1 FROM {wallet} w WHERE w.id = s.wallet_id)
+            """.format(**self.tables)
+        )
+        (unknown_wallets,) = self.cursor.fetchone()
+        self.cursor.execute("ANALYZE {pending}".format(**self.tables))
+        return pending, unknown_wallets
+
+    def lock_wallets(self):
+        # In id order, like the other writers, so they can't deadlock with the import.
+        self.cursor.execute(
+            """
+            SELECT w.id FROM {wallet} w
+            WHERE w.id IN (SELECT wallet_id FROM {pending})
+            ORDER BY w.id
+            FOR UPDATE
+            """.format(**self.tables)
+        )
+
+    def get_negative_balances(self, applied=False):
+        """
+        Returns the wallets of the pending rows whose total balance, slots included,
+        is negative once the rows are applied, as `(wallet_id, balance)` pairs. Pass
+        `applied` when the merge already added the rows to the balances.
+        """
+        self.cursor.execute(
+            """
+            SELECT d.wallet_id, w.balance + coalesce(s.balance, 0) + d.delta AS total
+            FROM (
+                SELECT wallet_id, {delta} AS delta FROM {pending} GROUP BY wallet_id
+            ) d
+            JOIN {wallet} w ON w.id = d.wallet_id
+            LEFT JOIN (
+                SELECT wallet_id, sum(balance) AS balance FROM {slot} GROUP BY wallet_id
+            ) s ON s.wallet_id = d.wallet_id
+            WHERE w.balance + coalesce(s.balance, 0) + d.delta < 0
+            ORDER BY d.wallet_id
+            """.format(delta="0" if applied else "sum(amount)", **self.tables)
+        )
+        return self.cursor.fetchall()
+
+    def merge(self):
+        """
+        Claims the txids of the pending rows, then inserts the rows and adds each
+        wallet's net delta to its balance in a single statement. Returns the number
+        of inserted TXs, the ids of the updated wallets and the ids of those that are
+        sharded.
+
+        Every claimed row must be inserted, an id that is already taken raises
+        `IntegrityError` instead of leaving its txid claimed without a TX.
+        """
+        # Skips the txids a concurrent writer took since `select_pending`, the
+        # partitioned TX table can't arbitrate on txids itself.
+        self.cursor.execute(
+            """
+            WITH claimed AS (
+                INSERT INTO {txid} (txid, tx_id)
+                SELECT txid, id FROM {pending}
+                ON CONFLICT DO NOTHING
+                RETURNING txid
+            )
+            DELETE FROM {pending} p
+            WHERE NOT EXISTS (SELECT 1 FROM claimed c WHERE c.txid = p.txid)
+            """.format(**self.tables)
+        )
+        self.cursor.execute(
+            """
+            WITH inserted AS (
+                INSERT INTO {tx} (id, wallet_id, txid, amount)
+                SELECT id, wallet_id, txid, amount FROM {pending}
+                RETURNING wallet_id, amount
+            ), deltas AS (
+                SELECT wallet_id, sum(amount) AS delta, count(*) AS inserted
+                FROM inserted
+                GROUP BY wallet_id
+            )
+            UPDATE {wallet} w
+            SET balance = w.balance + deltas.delta, version = w.version + 1
+            FROM deltas
+            WHERE w.id = deltas.wallet_id
+            RETURNING w.id, w.slot_count, deltas.inserted
+            """.format(**self.tables)
+        )
+        rows = self.cursor.fetchall()
+        inserted = sum(row[2] for row in rows)
+        return (
+            inserted,
+            [row[0] for row in rows],
+            [row[0] for row in rows if row[1]],
+        )
+
+    def update_checkpoints(self):
+        """
+        Adds the imported TXs to the checkpoints whose watermark is past their ids,
+        `reconcile_balances` only reads the TXs above it. Dropping the checkpoints
+        instead would sum the wallets again without their detached partitions.
+        """
+        # Re-evaluated against a checkpoint a concurrent run advanced in the meantime,
+        # that run couldn't see the uncommitted TXs.
+        self.cursor.execute(
+            """
+            UPDATE {checkpoint} c
+            SET tx_sum = c.tx_sum + (
+                SELECT coalesce(sum(p.amount), 0) FROM {pending} p
+                WHERE p.wallet_id = c.wallet_id AND p.id <= c.watermark
+            )
+            WHERE c.wallet_id IN (SELECT wallet_id FROM {pending})
+            """.format(**self.tables)
+        )
+
+    def report_progress(self, staged):
+        elapsed = time.monotonic() - self.started_at
+        self.stdout.write(f"Staged {staged} rows ({staged / elapsed:,.0f} rows/s)")
+
+    def report_negative_balances(self, negative):
+        if not negative:
+            self.stdout.write("No wallet would go negative.")
+            return
+        self.stdout.write(
+            self.style.WARNING(f"{len(negative)} wallets would go negative:")
+        )
+        for wallet_id, balance in negative:
+            self.stdout.write(f"  {wallet_id}: {balance}")
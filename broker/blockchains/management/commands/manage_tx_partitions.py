@@ -0,0 +1,107 @@
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+from django.utils import timezone as django_timezone
+
+from ...models import TX, BalanceCheckpoint, uuid7_floor
+from ...partitions import (
+    DEFAULT_PARTITION,
+    add_months,
+    create_partition,
+    detach_partition,
+    get_partitions,
+    month_start,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates the monthly partitions of the TX table ahead of time, and detaches "
+        "the partitions of old months. Run it at least monthly, TXs of a month "
+        "without a partition go to the default partition. The TXs of a partition are "
+        "added to the reconciliation checkpoints of their wallets before it is "
+        "detached, reconcile_balances no longer sees them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ahead",
+            type=int,
+            default=3,
+            help="Months after the current one to create partitions for.",
+        )
+        parser.add_argument(
+            "--retain",
+            type=int,
+            default=None,
+            help="Detach the partitions of months ending more than this many months "
+            "before the current one. Nothing is detached by default.",
+        )
+        parser.add_argument(
+            "--archive-schema",
+            help="Move detached partitions to this schema instead of leaving them "
+            "next to the TX table.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10_000,
+            help="TXs added to a wallet's checkpoint per transaction before detaching.",
+        )
+        parser.add_argument(
+            "--month",
+            help="The current month as YYYY-MM, the one of today by default.",
+        )
+
+    def handle(
+        self, *args, ahead, retain, archive_schema, month, batch_size, **options
+    ):
+        if month:
+            try:
+                current = datetime.strptime(month, "%Y-%m").replace(tzinfo=timezone.utc)
+            except ValueError as e:
+                raise CommandError("--month must be formatted as YYYY-MM.") from e
+        else:
+            current = month_start(django_timezone.now())
+        connection = connections[router.db_for_write(TX)]
+
+        for months in range(ahead + 1):
+            name = create_partition(connection, add_months(current, months))
+            if name is not None:
+                self.stdout.write(f"Created partition {name}.")
+
+        if retain is None:
+            return
+        cutoff = uuid7_floor(add_months(current, -retain))
+        for partition in get_partitions(connection):
+            if partition.name == DEFAULT_PARTITION or partition.upper is None:
+                continue
+            if partition.upper <= cutoff:
+                self.checkpoint(connection, partition, batch_size)
+                detach_partition(connection, partition, archive_schema)
+                self.stdout.write(f"Detached partition {partition.name}.")
+
+    def checkpoint(self, connection, partition, batch_size):
+        """
+        Adds the TXs of the partition to the checkpoints of their wallets that don't
+        include them yet, like `reconcile_balances` would.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT DISTINCT t.wallet_id
+                FROM {connection.ops.quote_name(partition.name)} t
+                LEFT JOIN {BalanceCheckpoint._meta.db_table} c
+                    ON c.wallet_id = t.wallet_id
+                WHERE t.id > coalesce(c.watermark, '')
+                """
+            )
+            wallet_ids = [row[0] for row in cursor.fetchall()]
+
+        for wallet_id in sorted(wallet_ids):
+            caught_up = False
+            while not caught_up:
+                _, caught_up = BalanceCheckpoint.objects.advance(
+                    wallet_id, partition.upper, batch_size
+                )
@@ -0,0 +1,126 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError
+from django.utils import timezone
+
+from ...models import (
+    TX,
+    BalanceCheckpoint,
+    BalanceDrift,
+    BalanceError,
+    ReconciliationRun,
+    Wallet,
+    uuid7_floor,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Checks wallet balances against the sum of their TXs. Only the TXs created "
+        "since the last run are read, each wallet keeps the sum of the TXs before them "
+        "in a checkpoint. Differences are recorded as balance drifts. This relies on "
+        "TXs being created with ids that grow over time: a TX inserted with an id "
+        "below a watermark that passed, older than --lag, is never added to the "
+        "checkpoint. Writers that insert TXs with ids of their own, like "
+        "import_transactions, add those below a checkpoint's watermark to it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Correct the balances of the wallets that drifted.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10_000,
+            help="TXs read per wallet and transaction.",
+        )
+        parser.add_argument(
+            "--lag",
+            type=float,
+            default=60,
+            help="Seconds TXs are left alone for, so transactions still in flight "
+            "can't commit a TX behind the watermark.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Keep running, starting a new run this many seconds after the last.",
+        )
+
+    def handle(self, *args, fix, batch_size, lag, interval, **options):
+        while True:
+            self.reconcile(fix, batch_size, timedelta(seconds=lag))
+            if not interval:
+                return
+            time.sleep(interval)
+
+    def reconcile(self, fix, batch_size, lag):
+        last_run = (
+            ReconciliationRun.objects.filter(finished_at__isnull=False)
+            .order_by("-started_at")
+            .first()
+        )
+        run = ReconciliationRun.objects.create(
+            watermark=uuid7_floor(timezone.now() - lag)
+        )
+
+        # The wallets with new TXs, found through the primary key index, and the
+        # wallets that were never reconciled.
+        new_txs = TX.objects.filter(id__lt=run.watermark)
+        if last_run is not None:
+            new_txs = new_txs.filter(id__gt=last_run.watermark)
+        wallet_ids = set(
+            new_txs.order_by().values_list("wallet_id", flat=True).distinct()
+        )
+        wallet_ids.update(
+            Wallet.objects.filter(checkpoint__isnull=True).values_list("id", flat=True)
+        )
+
+        for wallet_id in sorted(wallet_ids, key=str):
+            try:
+                caught_up = False
+                while not caught_up:
+                    checkpoint, caught_up = BalanceCheckpoint.objects.advance(
+                        wallet_id, run.watermark, batch_size
+                    )
+                drift = BalanceDrift.objects.detect(checkpoint)
+            except (Wallet.DoesNotExist, IntegrityError):
+                # Deleted since it was listed.
+                continue
+
+            run.wallets += 1
+            if drift is None:
+                continue
+            run.drifts += 1
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Wallet {wallet_id} is off by {drift.difference} at {drift.watermark}"
+                )
+            )
+
+        run.finished_at = timezone.now()
+        run.save(update_fields=["wallets", "drifts", "finished_at"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Reconciled {run.wallets} wallets, {run.drifts} drifted."
+            )
+        )
+
+        if fix:
+            # Drifts of earlier runs included, their wallets may not have changed since.
+            for drift in BalanceDrift.objects.filter(fixed_at__isnull=True):
+                try:
+                    BalanceDrift.objects.fix(drift)
+                    self.stdout.write(f"Fixed the balance of wallet {drift.wallet_id}")
+                except BalanceError as e:
+                    self.stdout.write(
+                        self.style.ERROR(
+                            f"Could not fix wallet {drift.wallet_id}: {e.messages[0]}"
+                        )
+                    )
@@ -0,0 +1,155 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from ...benchmarks import BASELINES_PATH, BENCHMARKS, compare, run_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the TX and wallet hot paths in process: TX creation from "
+        "concurrent threads, serializer validation and rendering, permission checks "
+        "and requests through the ASGI app. Rates are compared with the stored "
+        "baselines, and the command fails when one regressed. The benchmarks run on "
+        "test databases, set up and destroyed like the ones of the test suite."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "names",
+            nargs="*",
+            help="Benchmarks to run, or prefixes of their names. All by default: "
+            + ", ".join(BENCHMARKS),
+        )
+        parser.add_argument(
+            "--rounds", type=int, default=5, help="Timed rounds per benchmark."
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=8,
+            help="Threads creating TXs in the TX creation benchmarks.",
+        )
+        parser.add_argument(
+            "--scale",
+            type=float,
+            default=1.0,
+            help="Multiplies the operations of every round.",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.2,
+            help="Slowdown from the baseline, as a fraction, counted as a regression.",
+        )
+        parser.add_argument(
+            "--baselines",
+            type=Path,
+            default=BASELINES_PATH,
+            help="JSON file of the baselines.",
+        )
+        parser.add_argument(
+            "--save-baselines",
+            action="store_true",
+            help="Store the rates of this run as the baselines of their benchmarks.",
+        )
+        parser.add_argument(
+            "--report", type=Path, help="Write the results as JSON to this file."
+        )
+        parser.add_argument(
+            "--keepdb",
+            action="store_true",
+            help="Keep the test databases between runs.",
+        )
+
+    def handle(
+        self,
+        *args,
+        names,
+        rounds,
+        threads,
+        scale,
+        tolerance,
+        baselines,
+        save_baselines,
+        report,
+        keepdb,
+        **options,
+    ):
+        selected = [
+            name
+            for name in BENCHMARKS
+            if not names or any(name.startswith(prefix) for prefix in names)
+        ]
+        if not selected:
+            raise CommandError(f"No benchmark matches {', '.join(names)}.")
+        if "silk" in settings.INSTALLED_APPS:
+            self.stderr.write(
+                "Silk records every request, the baselines were taken with "
+                "DJANGO_CONFIGURATION=Production."
+            )
+
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0, interactive=False, keepdb=keepdb)
+        old_config = runner.setup_databases()
+        try:
+            results = {}
+            for name in selected:
+                results[name] = run_benchmark(name, rounds, threads, scale)
+                self.stdout.write(
+                    f"{name:<28} {results[name]['rate']:12.1f} "
+                    f"{results[name]['unit']}/s"
+                )
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+        stored = json.loads(baselines.read_text()) if baselines.exists() else {}
+        comparison = compare(results, stored, tolerance)
+        self.stdout.write("")
+        self.stdout.write(
+            f"{'Benchmark':<28} {'Rate':>12} {'Baseline':>12} {'Change':>8}"
+        )
+        for name, result in results.items():
+            change = comparison[name]
+            if change["baseline"] is None:
+                baseline, status = "-", "new"
+            else:
+                baseline = f"{change['baseline']:12.1f}"
+                status = f"{change['change']:+8.1%}"
+                if change["regressed"]:
+                    status += " REGRESSED"
+            self.stdout.write(
+                f"{name:<28} {result['rate']:12.1f} {baseline:>12} {status}"
+            )
+
+        if report:
+            report.write_text(
+                json.dumps(
+                    {
+                        name: {**result, **comparison[name]}
+                        for name, result in results.items()
+                    },
+                    indent=2,
+                )
+            )
+        if save_baselines:
+            stored.update(
+                {
+                    name: {"unit": result["unit"], "rate": round(result["rate"], 1)}
+                    for name, result in results.items()
+                }
+            )
+            baselines.write_text(json.dumps(stored, indent=2) + "\n")
+            self.stdout.write(f"Saved the baselines to {baselines}.")
+            return
+
+        regressed = [name for name in results if comparison[name]["regressed"]]
+        if regressed:
+            raise CommandError(
+                f"Regressed by more than {tolerance:.0%}: {', '.join(regressed)}."
+            )
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:12
+
+import django.core.validators
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blockchains', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wallet',
+            name='slot_count',
+            field=models.PositiveSmallIntegerField(db_comment='The number of balance slots of a sharded wallet, 0 when not sharded.', default=0, validators=[django.core.validators.MaxValueValidator(64)]),
+        ),
+        migrations.CreateModel(
+            name='WalletSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField(db_comment='The position of the slot within its wallet.')),
+                ('balance', models.DecimalField(db_comment="The part of a sharded wallet's balance held by this slot.", decimal_places=18, max_digits=26, validators=[django.core.validators.MinValueValidator(Decimal('0.0'), message='Balance cannot be less than 0')])),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slots', to='blockchains.wallet')),
+            ],
+            options={
+                'ordering': ('wallet', 'index'),
+                'constraints': [models.UniqueConstraint(fields=('wallet', 'index'), name='blockchains_walletslot_unique_index'), models.CheckConstraint(condition=models.Q(('balance__gte', 0)), name='blockchains_walletslot_balance_gte_0')],
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:27
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blockchains', '0002_wallet_slots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceCheckpoint',
+            fields=[
+                ('wallet', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='checkpoint', serialize=False, to='blockchains.wallet')),
+                ('watermark', models.CharField(blank=True, db_comment='The id of the newest TX included in tx_sum.', default='', max_length=36)),
+                ('tx_sum', models.DecimalField(db_comment="The sum of the amounts of the wallet's TXs up to the watermark.", decimal_places=18, default=Decimal('0'), max_digits=38)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BalanceDrift',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('watermark', models.CharField(db_comment='The id of the newest TX the balances cover.', max_length=36)),
+                ('expected', models.DecimalField(db_comment="The sum of the wallet's TXs up to the watermark.", decimal_places=18, max_digits=38)),
+                ('actual', models.DecimalField(db_comment="The wallet's balance without the TXs after the watermark.", decimal_places=18, max_digits=38)),
+                ('detected_at', models.DateTimeField(auto_now_add=True)),
+                ('fixed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ('-detected_at',),
+            },
+        ),
+        migrations.CreateModel(
+            name='ReconciliationRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('watermark', models.CharField(db_comment='TXs with smaller ids were covered by the run.', max_length=36)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('wallets', models.PositiveIntegerField(default=0)),
+                ('drifts', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ('-started_at',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='tx',
+            index=models.Index(fields=['wallet', 'id'], name='blockchains_tx_wallet_id_idx'),
+        ),
+        migrations.AddField(
+            model_name='balancedrift',
+            name='wallet',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='drifts', to='blockchains.wallet'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blockchains', '0003_reconciliation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wallet',
+            name='version',
+            field=models.PositiveBigIntegerField(db_comment='Bumped on every change of the wallet row, see Wallet.etag.', default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name='walletslot',
+            name='version',
+            field=models.PositiveBigIntegerField(db_comment="Bumped on every change of the slot's balance.", default=0),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:43
+
+import django.db.models.deletion
+import django_uuid7.fields
+import uuid_utils
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blockchains', '0004_wallet_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedTX',
+            fields=[
+                ('id', django_uuid7.fields.UUID7Field(default=uuid_utils.uuid7, primary_key=True, serialize=False)),
+                ('txid', models.CharField(max_length=100)),
+                ('amount', models.DecimalField(decimal_places=18, max_digits=26)),
+                ('status', models.CharField(choices=[('Q', 'Queued'), ('A', 'Applied'), ('R', 'Rejected')], default='Q', max_length=1)),
+                ('errors', models.JSONField(blank=True, db_comment='Why the TX was rejected, by field.', null=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('wallet', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='queued_txs', to='blockchains.wallet')),
+            ],
+            options={
+                'ordering': ('id',),
+                'indexes': [models.Index(condition=models.Q(('status', 'Q')), fields=['wallet', 'id'], name='blockchains_queuedtx_queue_idx')],
+            },
+        ),
+    ]
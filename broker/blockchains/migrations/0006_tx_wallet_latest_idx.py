@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blockchains', '0005_queued_tx'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='tx',
+            name='blockchains_tx_wallet_id_idx',
+        ),
+        migrations.AlterField(
+            model_name='tx',
+            name='wallet',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, to='blockchains.wallet'),
+        ),
+        migrations.AddIndex(
+            model_name='tx',
+            index=models.Index(fields=['wallet', '-id'], include=('txid', 'amount'), name='blockchains_tx_wallet_id_idx'),
+        ),
+    ]
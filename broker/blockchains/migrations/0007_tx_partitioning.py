@@ -0,0 +1,147 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:55
+
+from datetime import datetime, timezone
+
+import django.core.validators
+from django.db import migrations, models
+
+# Everything up to the end of the month the migration runs in stays in one partition,
+# `manage_tx_partitions` adds monthly ones after it. TXs past the last partition land
+# in the default partition until one is created for their month.
+TX_TABLE = "blockchains_tx"
+INITIAL_PARTITION = "blockchains_tx_initial"
+DEFAULT_PARTITION = "blockchains_tx_default"
+WALLET_INDEX = "blockchains_tx_wallet_id_idx"
+
+# Registers the txid of every TX, raising a unique violation for a taken one. A txid
+# already registered for the same TX, like by `import_transactions`, is let through.
+REGISTER_TXID = """
+CREATE FUNCTION blockchains_tx_register_txid() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO blockchains_uniquetxid AS u (txid, tx_id) VALUES (NEW.txid, NEW.id)
+    ON CONFLICT (txid) DO UPDATE SET tx_id = EXCLUDED.tx_id
+    WHERE u.tx_id = EXCLUDED.tx_id;
+    IF NOT FOUND THEN
+        RAISE unique_violation USING
+            MESSAGE = 'duplicate txid ' || NEW.txid,
+            CONSTRAINT = 'blockchains_uniquetxid_pkey';
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER blockchains_tx_register_txid BEFORE INSERT ON blockchains_tx
+FOR EACH ROW EXECUTE FUNCTION blockchains_tx_register_txid();
+"""
+
+
+def next_month_floor():
+    """
+    The smallest UUID7 string of the month after the current one.
+    """
+    now = datetime.now(timezone.utc)
+    if now.month == 12:
+        moment = datetime(now.year + 1, 1, 1, tzinfo=timezone.utc)
+    else:
+        moment = datetime(now.year, now.month + 1, 1, tzinfo=timezone.utc)
+    timestamp = f"{int(moment.timestamp() * 1000):012x}"
+    return f"{timestamp[:8]}-{timestamp[8:]}-0000-0000-000000000000"
+
+
+def partition_tx(apps, schema_editor):
+    """
+    Turns the TX table into the initial partition of a table partitioned by id range.
+
+    Only the primary key and the wallet index carry over to the partition, the
+    indexes the partitioned table doesn't have are dropped, and the txids are
+    copied to `UniqueTXID`.
+    """
+    quote = schema_editor.quote_name
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, TX_TABLE)
+
+    schema_editor.execute(
+        f"ALTER TABLE {quote(TX_TABLE)} RENAME TO {quote(INITIAL_PARTITION)}"
+    )
+    foreign_key = None
+    for name, constraint in constraints.items():
+        if constraint["primary_key"]:
+            schema_editor.execute(
+                f"ALTER TABLE {quote(INITIAL_PARTITION)} RENAME CONSTRAINT "
+                f"{quote(name)} TO {quote(INITIAL_PARTITION + '_pkey')}"
+            )
+        elif name == WALLET_INDEX:
+            schema_editor.execute(
+                f"ALTER INDEX {quote(name)} "
+                f"RENAME TO {quote(INITIAL_PARTITION + '_wallet_id_idx')}"
+            )
+        elif constraint["index"]:
+            schema_editor.execute(f"DROP INDEX {quote(name)}")
+        else:
+            if constraint["foreign_key"]:
+                foreign_key = name
+            schema_editor.execute(
+                f"ALTER TABLE {quote(INITIAL_PARTITION)} DROP CONSTRAINT {quote(name)}"
+            )
+
+    schema_editor.execute(
+        f"CREATE TABLE {quote(TX_TABLE)} (LIKE {quote(INITIAL_PARTITION)} "
+        "INCLUDING DEFAULTS INCLUDING COMMENTS) PARTITION BY RANGE (id)"
+    )
+    schema_editor.execute(
+        f"ALTER TABLE {quote(TX_TABLE)} ADD CONSTRAINT "
+        f"{quote(TX_TABLE + '_pkey')} PRIMARY KEY (id)"
+    )
+    schema_editor.execute(
+        f"ALTER TABLE {quote(TX_TABLE)} ADD CONSTRAINT {quote(foreign_key)} "
+        "FOREIGN KEY (wallet_id) REFERENCES blockchains_wallet (id) "
+        "DEFERRABLE INITIALLY DEFERRED"
+    )
+    schema_editor.execute(
+        f"CREATE INDEX {quote(WALLET_INDEX)} ON {quote(TX_TABLE)} "
+        "(wallet_id, id DESC) INCLUDE (txid, amount)"
+    )
+    schema_editor.execute(
+        "INSERT INTO blockchains_uniquetxid (txid, tx_id) "
+        f"SELECT txid, id FROM {quote(INITIAL_PARTITION)}"
+    )
+    schema_editor.execute(
+        f"ALTER TABLE {quote(TX_TABLE)} ATTACH PARTITION {quote(INITIAL_PARTITION)} "
+        f"FOR VALUES FROM (MINVALUE) TO ({schema_editor.quote_value(next_month_floor())})"
+    )
+    schema_editor.execute(
+        f"CREATE TABLE {quote(DEFAULT_PARTITION)} PARTITION OF {quote(TX_TABLE)} DEFAULT"
+    )
+    schema_editor.execute(REGISTER_TXID)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blockchains', '0006_tx_wallet_latest_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UniqueTXID',
+            fields=[
+                ('txid', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('tx_id', models.CharField(db_comment='The id of the TX, which locates its partition.', max_length=36)),
+            ],
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='tx',
+                    name='txid',
+                    field=models.CharField(db_comment='The unique transaction identifier (hash) from the blockchain.', editable=False, max_length=100, validators=[django.core.validators.RegexValidator('^[xa-fA-F0-9-]{64,100}$')]),
+                ),
+            ],
+            database_operations=[
+                # Not reversible: the TXs of every partition would have to be copied
+                # back into a single table.
+                migrations.RunPython(partition_tx),
+            ],
+        ),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:58
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+# The day (UTC) of the millisecond timestamp a UUID7 string starts with.
+UUID7_DATE = """
+CREATE FUNCTION blockchains_uuid7_date(id varchar) RETURNS date AS $$
+    SELECT (to_timestamp(
+        ('x' || lpad(translate(left(id, 13), '-', ''), 16, '0'))::bit(64)::bigint
+        / 1000.0
+    ) AT TIME ZONE 'UTC')::date
+$$ LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE;
+"""
+
+# Adds the TXs of `{txs}` to the rollups of their days, then sets the closing
+# balances from the earliest day touched on: the wallet's total balance, which
+# already includes the TXs, less what the later days added.
+ROLL_UP = """
+INSERT INTO blockchains_walletdailyrollup AS r
+    (wallet_id, day, inflow, outflow, tx_count, closing_balance)
+SELECT
+    wallet_id,
+    blockchains_uuid7_date(id),
+    sum(greatest(amount, 0)),
+    sum(greatest(-amount, 0)),
+    count(*),
+    0
+FROM {txs}
+GROUP BY 1, 2
+ON CONFLICT (wallet_id, day) DO UPDATE SET
+    inflow = r.inflow + EXCLUDED.inflow,
+    outflow = r.outflow + EXCLUDED.outflow,
+    tx_count = r.tx_count + EXCLUDED.tx_count;
+
+UPDATE blockchains_walletdailyrollup r
+SET closing_balance = w.balance - l.later + coalesce(
+    (SELECT sum(s.balance) FROM blockchains_walletslot s WHERE s.wallet_id = w.id), 0
+)
+FROM (
+    SELECT
+        d.id,
+        coalesce(sum(d.inflow - d.outflow) OVER (
+            PARTITION BY d.wallet_id ORDER BY d.day DESC
+            ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+        ), 0) AS later
+    FROM blockchains_walletdailyrollup d
+    JOIN (
+        SELECT wallet_id, min(blockchains_uuid7_date(id)) AS day
+        FROM {txs}
+        GROUP BY wallet_id
+    ) t ON t.wallet_id = d.wallet_id AND d.day >= t.day
+) l,
+blockchains_wallet w
+WHERE r.id = l.id AND w.id = r.wallet_id;
+"""
+
+ROLL_UP_TRIGGER = f"""
+CREATE FUNCTION blockchains_tx_roll_up() RETURNS trigger AS $$
+BEGIN
+{ROLL_UP.format(txs="new_txs")}
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER blockchains_tx_roll_up AFTER INSERT ON blockchains_tx
+REFERENCING NEW TABLE AS new_txs
+FOR EACH STATEMENT EXECUTE FUNCTION blockchains_tx_roll_up();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blockchains', '0007_tx_partitioning'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('inflow', models.DecimalField(db_comment="The sum of the day's positive amounts.", decimal_places=18, default=Decimal('0'), max_digits=38)),
+                ('outflow', models.DecimalField(db_comment="The sum of the day's negative amounts, as a positive number.", decimal_places=18, default=Decimal('0'), max_digits=38)),
+                ('tx_count', models.PositiveIntegerField(default=0)),
+                ('closing_balance', models.DecimalField(db_comment="The wallet's total balance at the end of the day.", decimal_places=18, default=Decimal('0'), max_digits=38)),
+                ('wallet', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='blockchains.wallet')),
+            ],
+            options={
+                'ordering': ('wallet', 'day'),
+                'constraints': [models.UniqueConstraint(fields=('wallet', 'day'), name='blockchains_walletdailyrollup_unique_day')],
+            },
+        ),
+        migrations.RunSQL(
+            UUID7_DATE, "DROP FUNCTION blockchains_uuid7_date(varchar);"
+        ),
+        migrations.RunSQL(
+            ROLL_UP_TRIGGER,
+            "DROP TRIGGER blockchains_tx_roll_up ON blockchains_tx;"
+            "DROP FUNCTION blockchains_tx_roll_up();",
+        ),
+        # The rollups of the TXs inserted so far.
+        migrations.RunSQL(ROLL_UP.format(txs="blockchains_tx"), migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blockchains', '0009_wallet_user_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queuedtx',
+            name='tx',
+            field=models.ForeignKey(blank=True, db_comment='The TX it was applied as.', db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='blockchains.tx'),
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:49
+
+import importlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+initial_rollups = importlib.import_module(
+    "broker.blockchains.migrations.0008_wallet_daily_rollup"
+)
+
+# Appends the TXs of each insert statement, summed up by wallet and day, as deltas:
+# no row is shared with other statements, so the TXs of a sharded wallet don't
+# queue up on the row of their day. `WalletDailyRollupManager.compact` folds them.
+ROLL_UP_TRIGGER = """
+CREATE OR REPLACE FUNCTION blockchains_tx_roll_up() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO blockchains_walletrollupdelta
+        (wallet_id, day, inflow, outflow, tx_count)
+    SELECT
+        wallet_id,
+        blockchains_uuid7_date(id),
+        sum(greatest(amount, 0)),
+        sum(greatest(-amount, 0)),
+        count(*)
+    FROM new_txs
+    GROUP BY 1, 2;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+# Folds the pending deltas back into the rollups.
+FOLD_DELTAS = """
+INSERT INTO blockchains_walletdailyrollup AS r
+    (wallet_id, day, inflow, outflow, tx_count, closing_balance)
+SELECT wallet_id, day, sum(inflow), sum(outflow), sum(tx_count), 0
+FROM blockchains_walletrollupdelta
+GROUP BY wallet_id, day
+ON CONFLICT (wallet_id, day) DO UPDATE SET
+    inflow = r.inflow + EXCLUDED.inflow,
+    outflow = r.outflow + EXCLUDED.outflow,
+    tx_count = r.tx_count + EXCLUDED.tx_count;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blockchains', '0010_queued_tx_applied_tx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletRollupDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('inflow', models.DecimalField(decimal_places=18, max_digits=38)),
+                ('outflow', models.DecimalField(decimal_places=18, max_digits=38)),
+                ('tx_count', models.PositiveIntegerField()),
+                ('wallet', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='blockchains.wallet')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['wallet', 'day'], name='blockchains_rollupdelta_idx')],
+            },
+        ),
+        migrations.RunSQL(
+            ROLL_UP_TRIGGER,
+            # The trigger of 0008, which also recomputes the closing balances.
+            "DROP TRIGGER blockchains_tx_roll_up ON blockchains_tx;"
+            "DROP FUNCTION blockchains_tx_roll_up();"
+            + initial_rollups.ROLL_UP_TRIGGER
+            + FOLD_DELTAS,
+        ),
+        # Closing balances are computed when stats are read, from the current
+        # balance, so balance updates, fixes and reshards can't leave them stale.
+        migrations.RemoveField(
+            model_name='walletdailyrollup',
+            name='closing_balance',
+        ),
+    ]
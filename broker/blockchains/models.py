@@ -1,22 +1,328 @@
-from decimal import Decimal
-from django.core.validators import MinValueValidator, RegexValidator
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import ROUND_DOWN, Decimal
+from functools import partial
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator, RegexValidator
 from django_uuid7 import UUID7Field
 from django.dispatch import receiver
 from django.db.models.signals import pre_save
-from django.db import models, transaction
+from django.db import (
+    DataError,
+    IntegrityError,
+    connections,
+    models,
+    router,
+    transaction,
+)
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 import uuid_utils as uuid
 
+from broker.db import atomic_with_retries
+from broker.metrics import balance_lock_wait
+
+DUPLICATE_TXID_MESSAGE = _("TX with this txid already exists.")
+# The smallest step of a balance, matching `decimal_places=18`
+BALANCE_QUANTUM = Decimal("1e-18")
+# The upper bound of `Wallet.slot_count`
+MAX_WALLET_SLOTS = 64
+
+
+def net_delta(amounts: list[Decimal]) -> tuple[Decimal, Decimal]:
+    """
+    Returns the sum of `amounts` and the lowest running sum when applying them in turn,
+    so that `balance + floor >= 0` means no amount takes the balance below zero.
+    """
+    delta = floor = Decimal(0)
+    for amount in amounts:
+        delta += amount
+        floor = min(floor, delta)
+    return delta, floor
+
+
+def uuid7_floor(moment: datetime) -> str:
+    """
+    Returns the smallest id string of the millisecond of `moment`. Ids are stored as
+    canonical UUID7 strings, which compare in time order, so `id < uuid7_floor(moment)`
+    selects the TXs created before `moment`.
+    """
+    timestamp = f"{int(moment.timestamp() * 1000):012x}"
+    return f"{timestamp[:8]}-{timestamp[8:]}-0000-0000-000000000000"
+
+
+class BalanceError(ValidationError):
+    """
+    Raised when applying TX amounts would take a wallet's balance out of range.
+    `position` is the index of the first offending amount.
+    """
+
+    def __init__(self, message, position=0):
+        super().__init__({"balance": message})
+        self.position = position
+
+
+class StaleWalletError(Exception):
+    """
+    Raised when saving a wallet that changed since it was read, see `Wallet.save`.
+    """
+
 
 class TXManager(models.Manager):
     def create(self, wallet: "Wallet", **kwargs):
-        with transaction.atomic():
-            # Lock the related wallet row to prevent race conditions during the update.
-            wallet = Wallet.objects.select_for_update().get(pk=wallet.id)
-            # If the transaction is new (being created), just add its amount to the wallet's balance.
-            wallet.balance += kwargs.get("amount")
-            wallet.save()
-            return super().create(wallet=wallet, **kwargs)
+        """
+        Applies the TX's amount to the wallet's balance and inserts it. Conflicts
+        with concurrent writers are retried, see `atomic_with_retries`.
+        """
+        return atomic_with_retries(
+            "tx.create",
+            lambda: self._create(wallet, **kwargs),
+            using=router.db_for_write(self.model),
+        )
+
+    def _create(self, wallet: "Wallet", **kwargs):
+        amounts = [kwargs.get("amount")]
+        while True:
+            # No savepoint: the update and the insert are the only two statements,
+            # and a failed insert marks the enclosing transaction for rollback anyway.
+            with transaction.atomic(savepoint=False):
+                with balance_lock_wait.labels(row="wallet").time():
+                    row = self._update_balance(wallet.pk, amounts)
+                if row is not None:
+                    wallet.balance, wallet.version = row
+                    return self._insert(wallet=wallet, **kwargs)
+            # Nothing was written, so the transaction is still usable for the check.
+            if self._check_balance(wallet.pk, amounts):
+                with transaction.atomic():
+                    with balance_lock_wait.labels(row="slot").time():
+                        WalletSlot.objects.apply(wallet.pk, amounts)
+                    return self._insert(wallet=wallet, **kwargs)
+
+    def bulk_create_per_wallet(self, txs: list["TX"]) -> dict[int, ValidationError]:
+        """
+        Inserts `txs` grouped by wallet, applying each wallet's net delta with a single
+        conditional update and a single bulk insert.
+
+        A wallet's group is all-or-nothing: if any of its TXs is rejected, none of them
+        is stored. Returns the errors keyed by the position of the TX in `txs`.
+        """
+        errors = {}
+        groups = defaultdict(list)
+        for position, tx in enumerate(txs):
+            groups[tx.wallet_id].append(position)
+
+        # One lookup for the whole batch instead of a unique check per row;
+        # adding every txid as we go also catches duplicates within the batch.
+        seen = set(
+            UniqueTXID.objects.filter(txid__in={tx.txid for tx in txs}).values_list(
+                "txid", flat=True
+            )
+        )
+        for position, tx in enumerate(txs):
+            if tx.txid in seen:
+                errors[position] = ValidationError({"txid": DUPLICATE_TXID_MESSAGE})
+            seen.add(tx.txid)
+
+        rejected = ValidationError(
+            _("Rejected together with another TX of the same wallet."),
+            code="wallet_rejected",
+        )
+        # Update wallets in a stable order so concurrent batches can't deadlock.
+        for wallet_id in sorted(groups, key=str):
+            positions = groups[wallet_id]
+            if not any(position in errors for position in positions):
+                try:
+                    atomic_with_retries(
+                        "tx.bulk_create",
+                        partial(
+                            self._bulk_create_group,
+                            wallet_id,
+                            [txs[position] for position in positions],
+                        ),
+                        using=router.db_for_write(self.model),
+                    )
+                except Wallet.DoesNotExist:
+                    errors.update(
+                        dict.fromkeys(
+                            positions,
+                            ValidationError({"wallet": _("Wallet does not exist.")}),
+                        )
+                    )
+                except BalanceError as e:
+                    errors[positions[e.position]] = e
+                except IntegrityError:
+                    # A concurrent writer took some of the txids after the lookup
+                    # above, only their TXs are at fault.
+                    taken = set(
+                        UniqueTXID.objects.filter(
+                            txid__in={txs[position].txid for position in positions}
+                        ).values_list("txid", flat=True)
+                    )
+                    if not taken:
+                        raise
+                    for position in positions:
+                        if txs[position].txid in taken:
+                            errors[position] = ValidationError(
+                                {"txid": DUPLICATE_TXID_MESSAGE}
+                            )
+            if any(position in errors for position in positions):
+                for position in positions:
+                    errors.setdefault(position, rejected)
+        return errors
+
+    def _bulk_create_group(self, wallet_id, txs: list["TX"]):
+        amounts = [tx.amount for tx in txs]
+        while self._update_balance(wallet_id, amounts) is None:
+            if self._check_balance(wallet_id, amounts):
+                WalletSlot.objects.apply(wallet_id, amounts)
+                break
+        self.bulk_create(txs)
+
+    def _insert(self, **kwargs):
+        try:
+            return super().create(**kwargs)
+        except IntegrityError as e:
+            raise ValidationError({"txid": DUPLICATE_TXID_MESSAGE}) from e
+
+    @staticmethod
+    def _update_balance(
+        wallet_id, amounts: list[Decimal]
+    ) -> tuple[Decimal, int] | None:
+        """
+        Adds `amounts` to the wallet's balance and bumps its version with one
+        conditional statement. Returns the new balance and version, or `None` when
+        the update matched no row.
+
+        The update only matches an unsharded wallet whose balance stays non-negative
+        after every amount in turn, so no row lock is held across round-trips.
+        """
+        delta, floor = net_delta(amounts)
+        connection = connections[router.db_for_write(Wallet)]
+        table = connection.ops.quote_name(Wallet._meta.db_table)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {table} SET balance = balance + %s, version = version + 1 "
+                    "WHERE id = %s AND slot_count = 0 AND balance + %s >= 0 "
+                    "RETURNING balance, version",
+                    [delta, str(wallet_id), floor],
+                )
+                row = cursor.fetchone()
+        except DataError as e:
+            # The column's precision is exceeded (numeric field overflow).
+            raise BalanceError(
+                _("Balance exceeds the maximum allowed value."), len(amounts) - 1
+            ) from e
+        return row
+
+    @staticmethod
+    def _check_balance(wallet_id, amounts: list[Decimal]) -> bool:
+        """
+        Explains why `_update_balance` matched no row by raising `Wallet.DoesNotExist`
+        or a `BalanceError` for the first amount that can't be applied.
+
+        Returns `True` when the wallet is sharded and the amounts go to its slots, and
+        `False` when they fit by now, i.e. a concurrent TX topped the wallet up.
+        """
+        row = (
+            Wallet.objects.db_manager(router.db_for_write(Wallet))
+            .filter(pk=wallet_id)
+            .values_list("balance", "slot_count")
+            .first()
+        )
+        if row is None:
+            raise Wallet.DoesNotExist
+        balance, slot_count = row
+        if slot_count:
+            return True
+        balance_field = Wallet._meta.get_field("balance")
+        for position, amount in enumerate(amounts):
+            balance += amount
+            try:
+                balance_field.run_validators(balance)
+            except ValidationError as e:
+                raise BalanceError(e.messages, position) from e
+        return False
+
+
+class WalletQuerySet(models.QuerySet):
+    def with_balance(self):
+        """
+        Annotates `slots_balance`, the part of a sharded wallet's balance held by its
+        slots, so `Wallet.total_balance` doesn't need a query per wallet.
+        """
+        slots = (
+            WalletSlot.objects.filter(wallet=models.OuterRef("pk"))
+            .order_by()
+            .values("wallet")
+            .annotate(total=models.Sum("balance"))
+            .values("total")
+        )
+        return self.annotate(slots_balance=models.Subquery(slots))
+
+    def with_version(self):
+        """
+        Annotates `slots_version`, the sum of the versions of a sharded wallet's
+        slots, so `Wallet.etag` doesn't need a query per wallet.
+        """
+        slots = (
+            WalletSlot.objects.filter(wallet=models.OuterRef("pk"))
+            .order_by()
+            .values("wallet")
+            .annotate(total=models.Sum("version"))
+            .values("total")
+        )
+        return self.annotate(slots_version=models.Subquery(slots))
+
+    def owned_by(self, user):
+        """
+        Narrows the wallets to the ones of `user`, through the `(user, id)` index, or
+        leaves them all to staff users.
+        """
+        if user.is_staff:
+            return self
+        return self.filter(user_id=user.pk)
+
+
+class WalletManager(models.Manager.from_queryset(WalletQuerySet)):
+    def reshard(self, wallet: "Wallet", slot_count: int):
+        """
+        Spreads the wallet's balance evenly across `slot_count` slots, or folds it back
+        onto the wallet row when `slot_count` is 0.
+        """
+        return atomic_with_retries(
+            "wallet.reshard",
+            lambda: self._reshard(wallet, slot_count),
+            using=router.db_for_write(self.model),
+        )
+
+    def _reshard(self, wallet: "Wallet", slot_count: int):
+        locked = self.select_for_update().get(pk=wallet.pk)
+        slots = WalletSlot.objects.select_for_update().filter(wallet=locked)
+        total = locked.balance + sum(slot.balance for slot in slots)
+        slots.delete()
+
+        if slot_count:
+            share = (total / slot_count).quantize(BALANCE_QUANTUM, rounding=ROUND_DOWN)
+            WalletSlot.objects.bulk_create(
+                WalletSlot(
+                    wallet=locked,
+                    index=index,
+                    # The rounding remainder goes to the first slot.
+                    balance=total - share * (slot_count - 1) if index == 0 else share,
+                )
+                for index in range(slot_count)
+            )
+            wallet.balance, wallet.slots_balance = Decimal(0), total
+        else:
+            wallet.balance, wallet.slots_balance = total, None
+        wallet.slot_count = slot_count
+        # The new slots start over at version 0.
+        wallet.version, wallet.slots_version = locked.version + 1, None
+        self.filter(pk=wallet.pk).update(
+            balance=wallet.balance, slot_count=slot_count, version=wallet.version
+        )
+        return wallet
 
 
 class Wallet(models.Model):
@@ -29,7 +335,10 @@ class Wallet(models.Model):
     id = UUID7Field(
         primary_key=True, default=lambda: str(uuid.uuid7())
     )  # the field is locked to uuid module
-    user = models.ForeignKey("users.User", editable=False, on_delete=models.PROTECT)
+    # Indexed by `blockchains_wallet_user_id_idx`, which leads with the user.
+    user = models.ForeignKey(
+        "users.User", editable=False, on_delete=models.PROTECT, db_index=False
+    )
     label = models.CharField(
         max_length=255, db_comment="A human-readable name for the wallet."
     )
@@ -47,15 +356,183 @@ class Wallet(models.Model):
         max_length=1,
         db_comment="The current status of the wallet.",
     )
+    slot_count = models.PositiveSmallIntegerField(
+        default=0,
+        validators=[MaxValueValidator(MAX_WALLET_SLOTS)],
+        db_comment="The number of balance slots of a sharded wallet, 0 when not sharded.",
+    )
+    version = models.PositiveBigIntegerField(
+        default=1,
+        editable=False,
+        db_comment="Bumped on every change of the wallet row, see Wallet.etag.",
+    )
+
+    objects = WalletManager()
 
     def __str__(self):
         return self.label
 
+    @property
+    def total_balance(self) -> Decimal:
+        """
+        The balance as clients see it: the wallet row plus the slots of a sharded wallet.
+        """
+        if not self.slot_count:
+            return self.balance
+        slots_balance = getattr(self, "slots_balance", None)
+        if slots_balance is None:
+            slots_balance = self.slots.aggregate(total=models.Sum("balance"))["total"]
+        return self.balance + (slots_balance or 0)
+
+    @property
+    def etag(self) -> str:
+        """
+        The entity tag of the wallet as clients see it. Changes with its version and,
+        for a sharded wallet, with the versions of its slots: TXs only bump the
+        slot they go to, so they don't queue up on the wallet row.
+        """
+        slots_version = None
+        if self.slot_count:
+            slots_version = getattr(self, "slots_version", None)
+            if slots_version is None:
+                slots_version = self.slots.aggregate(total=models.Sum("version"))[
+                    "total"
+                ]
+        if slots_version:
+            return f'"{self.version}.{slots_version}"'
+        return f'"{self.version}"'
+
+    def save(self, *args, **kwargs):
+        """
+        Bumps the version of the wallet. An existing wallet is only updated if its
+        version is still the one it was read with, otherwise `StaleWalletError` is
+        raised, so concurrent writers can't overwrite each other without row locks.
+        """
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "version"}
+        self.version += 1
+        try:
+            super().save(*args, **kwargs)
+        except StaleWalletError:
+            self.version -= 1
+            # Raised by `_do_update` after a successful statement, so the enclosing
+            # transaction is still usable.
+            connection = connections[kwargs.get("using") or router.db_for_write(Wallet)]
+            if connection.in_atomic_block:
+                transaction.set_rollback(False, using=connection.alias)
+            raise
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        # Only match the row at the version `save` bumped from.
+        base_qs = base_qs.filter(version=self.version - 1)
+        updated = super()._do_update(
+            base_qs, using, pk_val, values, update_fields, forced_update
+        )
+        if (
+            not updated
+            and base_qs.model._base_manager.using(using).filter(pk=pk_val).exists()
+        ):
+            raise StaleWalletError(f"Wallet {pk_val} changed since it was read.")
+        return updated
+
     def __repr__(self):
         return f"<Wallet: {self.id} - {self.label}: {self.balance}>"
 
     class Meta:
         ordering = ("id",)
+        indexes = [
+            # A user's wallets in id order, see `WalletQuerySet.owned_by`.
+            models.Index(fields=("user", "id"), name="blockchains_wallet_user_id_idx"),
+        ]
+
+
+class WalletSlotManager(models.Manager):
+    def apply(self, wallet_id, amounts: list[Decimal]):
+        """
+        Adds `amounts` to one slot of a sharded wallet.
+
+        Slots held by concurrent TXs are skipped, so TXs of a hot wallet don't queue up
+        on a single row lock. When no free slot can take the amounts, every slot is
+        locked and the amounts are spread across them, which keeps the wallet's total
+        from going below zero.
+        """
+        delta, floor = net_delta(amounts)
+        connection = connections[router.db_for_write(WalletSlot)]
+        table = connection.ops.quote_name(WalletSlot._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET balance = balance + %s, version = version + 1 "
+                "WHERE id = ("
+                f"SELECT id FROM {table} WHERE wallet_id = %s AND balance + %s >= 0 "
+                "ORDER BY balance DESC LIMIT 1 FOR UPDATE SKIP LOCKED) RETURNING id",
+                [delta, str(wallet_id), floor],
+            )
+            if cursor.fetchone() is not None:
+                return
+
+        # Lock in index order so concurrent fallbacks can't deadlock.
+        slots = list(
+            self.select_for_update().filter(wallet_id=wallet_id).order_by("index")
+        )
+        balance = sum(slot.balance for slot in slots)
+        balance_field = WalletSlot._meta.get_field("balance")
+        for position, amount in enumerate(amounts):
+            balance += amount
+            try:
+                balance_field.run_validators(balance)
+            except ValidationError as e:
+                raise BalanceError(e.messages, position) from e
+
+        if delta >= 0:
+            slots[0].balance += delta
+        else:
+            # Drain the fullest slots first.
+            remainder = -delta
+            for slot in sorted(slots, key=lambda slot: slot.balance, reverse=True):
+                taken = min(slot.balance, remainder)
+                slot.balance -= taken
+                remainder -= taken
+        for slot in slots:
+            slot.version += 1
+        self.bulk_update(slots, ["balance", "version"])
+
+
+class WalletSlot(models.Model):
+    wallet = models.ForeignKey(Wallet, related_name="slots", on_delete=models.CASCADE)
+    index = models.PositiveSmallIntegerField(
+        db_comment="The position of the slot within its wallet."
+    )
+    balance = models.DecimalField(
+        max_digits=26,
+        decimal_places=18,
+        validators=[
+            MinValueValidator(Decimal("0.0"), message="Balance cannot be less than 0")
+        ],
+        db_comment="The part of a sharded wallet's balance held by this slot.",
+    )
+    version = models.PositiveBigIntegerField(
+        default=0, db_comment="Bumped on every change of the slot's balance."
+    )
+
+    objects = WalletSlotManager()
+
+    def __repr__(self):
+        return f"<WalletSlot: {self.wallet_id} #{self.index}: {self.balance}>"
+
+    class Meta:
+        ordering = ("wallet", "index")
+        constraints = [
+            models.UniqueConstraint(
+                fields=("wallet", "index"), name="blockchains_walletslot_unique_index"
+            ),
+            models.CheckConstraint(
+                condition=models.Q(balance__gte=0),
+                name="blockchains_walletslot_balance_gte_0",
+            ),
+        ]
 
 
 @receiver(pre_save, sender=Wallet)
@@ -64,14 +541,20 @@ def ensure_balance_is_positive(sender, instance: Wallet, *args, **kwargs):
 
 
 class TX(models.Model):
+    """
+    The table is range partitioned by month of the id, see `partitions`. The
+    partitions can't enforce the uniqueness of txids across each other, `UniqueTXID`
+    does.
+    """
+
     id = UUID7Field(
         primary_key=True, default=lambda: str(uuid.uuid7())
     )  # the field is locked to uuid module
-    wallet = models.ForeignKey(Wallet, on_delete=models.PROTECT)
+    # Indexed by `blockchains_tx_wallet_id_idx`, which leads with the wallet.
+    wallet = models.ForeignKey(Wallet, on_delete=models.PROTECT, db_index=False)
     txid = models.CharField(
         max_length=100,
         validators=[RegexValidator(r"^[xa-fA-F0-9-]{64,100}$")],
-        unique=True,
         editable=False,
         db_comment="The unique transaction identifier (hash) from the blockchain.",
     )
@@ -92,3 +575,573 @@ class TX(models.Model):
 
     class Meta:
         ordering = ("-id",)
+        indexes = [
+            # The latest TXs of a wallet, read from the index alone.
+            models.Index(
+                fields=("wallet", "-id"),
+                include=("txid", "amount"),
+                name="blockchains_tx_wallet_id_idx",
+            ),
+        ]
+
+
+class QueuedTXManager(models.Manager):
+    # The first key of the advisory locks taken on wallets, the second is the
+    # wallet's, so they can't collide with locks taken for anything else.
+    ADVISORY_LOCK_NAMESPACE = 1
+
+    def pending_wallets(self, limit: int) -> list:
+        """
+        Returns the ids of up to `limit` wallets with queued TXs, the ones waiting
+        the longest first.
+        """
+        return list(
+            self.filter(status=QueuedTX.Status.QUEUED)
+            .order_by()
+            .values("wallet_id")
+            .annotate(oldest=models.Min("id"))
+            .order_by("oldest")
+            .values_list("wallet_id", flat=True)[:limit]
+        )
+
+    def apply(self, wallet_id, batch_size: int) -> tuple[int, int] | None:
+        """
+        Applies up to `batch_size` of the wallet's queued TXs, oldest first, in one
+        transaction with a single balance update, see `TXManager.bulk_create_per_wallet`.
+
+        Unlike a bulk request, the queued TXs were accepted one by one, so a TX that
+        can't be applied is rejected on its own and the others are applied without
+        it. Returns the numbers of applied and rejected TXs, or `None` when another
+        worker holds the wallet's advisory lock.
+        """
+        using = router.db_for_write(self.model)
+        with transaction.atomic(using=using):
+            with connections[using].cursor() as cursor:
+                cursor.execute(
+                    "SELECT pg_try_advisory_xact_lock(%s, hashtext(%s))",
+                    [self.ADVISORY_LOCK_NAMESPACE, str(wallet_id)],
+                )
+                (locked,) = cursor.fetchone()
+            if not locked:
+                return None
+
+            queued = list(
+                self.using(using)
+                .filter(wallet_id=wallet_id, status=QueuedTX.Status.QUEUED)
+                .order_by("id")[:batch_size]
+            )
+            # Applied TXs get ids of their own, newer than any reconciliation
+            # watermark that passed while they were queued, see `QueuedTX.tx`.
+            txs = [
+                TX(
+                    wallet_id=item.wallet_id,
+                    txid=item.txid,
+                    amount=item.amount,
+                )
+                for item in queued
+            ]
+            errors = {}
+            pending = list(range(len(txs)))
+            while pending:
+                tx_errors = TX.objects.bulk_create_per_wallet(
+                    [txs[position] for position in pending]
+                )
+                # Drop the TXs at fault and retry the ones rejected together with them.
+                failed = {
+                    pending[index]: error
+                    for index, error in tx_errors.items()
+                    if getattr(error, "code", None) != "wallet_rejected"
+                }
+                errors.update(failed)
+                pending = [position for position in pending if position not in failed]
+                if not tx_errors:
+                    break
+
+            processed_at = timezone.now()
+            for position, item in enumerate(queued):
+                item.processed_at = processed_at
+                if position in errors:
+                    error = errors[position]
+                    item.status = QueuedTX.Status.REJECTED
+                    item.errors = (
+                        error.message_dict
+                        if hasattr(error, "error_dict")
+                        else {NON_FIELD_ERRORS: error.messages}
+                    )
+                else:
+                    item.status = QueuedTX.Status.APPLIED
+                    item.tx = txs[position]
+            self.using(using).bulk_update(
+                queued, ["status", "errors", "processed_at", "tx"]
+            )
+        return len(queued) - len(errors), len(errors)
+
+
+class QueuedTX(models.Model):
+    """
+    A TX accepted for write-behind ingestion, see `settings.TX_WRITE_BEHIND`, that
+    a worker applies to its wallet later on. An applied TX is found through `tx`.
+    """
+
+    class Status(models.TextChoices):
+        QUEUED = "Q", _("Queued")
+        APPLIED = "A", _("Applied")
+        REJECTED = "R", _("Rejected")
+
+    id = UUID7Field(primary_key=True, default=lambda: str(uuid.uuid7()))
+    # Not a constraint: queuing is a single insert, a missing wallet is found, and
+    # the TX rejected, when it is applied.
+    wallet = models.ForeignKey(
+        Wallet,
+        related_name="queued_txs",
+        on_delete=models.CASCADE,
+        db_constraint=False,
+    )
+    txid = models.CharField(max_length=100)
+    amount = models.DecimalField(max_digits=26, decimal_places=18)
+    status = models.CharField(
+        max_length=1, choices=Status.choices, default=Status.QUEUED
+    )
+    errors = models.JSONField(
+        null=True, blank=True, db_comment="Why the TX was rejected, by field."
+    )
+    processed_at = models.DateTimeField(null=True, blank=True)
+    # A new id rather than the queued one: reconciliation expects TX ids to grow, see
+    # `BalanceCheckpointManager.advance`, and a TX can wait in the queue for long.
+    tx = models.ForeignKey(
+        TX,
+        null=True,
+        blank=True,
+        related_name="+",
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        db_comment="The TX it was applied as.",
+    )
+
+    objects = QueuedTXManager()
+
+    def __repr__(self):
+        return f"<QueuedTX: {self.id} - {self.txid}: {self.amount} ({self.status})>"
+
+    class Meta:
+        ordering = ("id",)
+        indexes = [
+            # Only the queued TXs are ever looked up by wallet, by the workers.
+            models.Index(
+                fields=("wallet", "id"),
+                name="blockchains_queuedtx_queue_idx",
+                condition=models.Q(status="Q"),
+            ),
+        ]
+
+
+class UniqueTXID(models.Model):
+    """
+    The txids of all TXs, detached partitions included, so a txid can't be reused.
+
+    Every insert into the TX table registers its txid here through a trigger, which
+    raises a unique violation for a txid that is taken, see migration 0007.
+    """
+
+    txid = models.CharField(max_length=100, primary_key=True)
+    tx_id = models.CharField(
+        max_length=36, db_comment="The id of the TX, which locates its partition."
+    )
+
+    def __repr__(self):
+        return f"<UniqueTXID: {self.txid} - {self.tx_id}>"
+
+
+class WalletDailyRollupManager(models.Manager):
+    BUCKETS = ("day", "week", "month")
+
+    def get_stats(
+        self, wallet_id, bucket: str = "day", start: date = None, end: date = None
+    ) -> list[dict]:
+        """
+        Returns the wallet's TXs between the days `start` and `end`, both included,
+        summed up by day, week or month, oldest first. Periods without TXs are left
+        out, their closing balance is the one of the period before.
+
+        Days are read from the rollups and the deltas not compacted yet. Closing
+        balances are the wallet's total balance less the TXs of the later days, in
+        the same statement, so they follow balance updates, fixes and reshards.
+        """
+        connection = connections[router.db_for_read(self.model)]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT day, inflow, outflow, tx_count, closing_balance
+                FROM (
+                    SELECT
+                        day,
+                        inflow,
+                        outflow,
+                        tx_count,
+                        w.balance + coalesce((
+                            SELECT sum(balance) FROM {WalletSlot._meta.db_table}
+                            WHERE wallet_id = w.id
+                        ), 0) - coalesce(sum(inflow - outflow) OVER (
+                            ORDER BY day DESC
+                            ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+                        ), 0) AS closing_balance
+                    FROM (
+                        SELECT day, sum(inflow) AS inflow, sum(outflow) AS outflow,
+                            sum(tx_count) AS tx_count
+                        FROM (
+                            SELECT day, inflow, outflow, tx_count
+                            FROM {self.model._meta.db_table} WHERE wallet_id = %(wallet)s
+                            UNION ALL
+                            SELECT day, inflow, outflow, tx_count
+                            FROM {WalletRollupDelta._meta.db_table}
+                            WHERE wallet_id = %(wallet)s
+                        ) rows
+                        WHERE %(start)s::date IS NULL OR day >= %(start)s
+                        GROUP BY day
+                    ) days,
+                    {Wallet._meta.db_table} w
+                    WHERE w.id = %(wallet)s
+                ) closing
+                WHERE %(end)s::date IS NULL OR day <= %(end)s
+                ORDER BY day
+                """,
+                {"wallet": str(wallet_id), "start": start, "end": end},
+            )
+            days = cursor.fetchall()
+
+        stats = {}
+        for day, inflow, outflow, tx_count, closing_balance in days:
+            if bucket == "week":
+                period = day - timedelta(days=day.weekday())
+            elif bucket == "month":
+                period = day.replace(day=1)
+            else:
+                period = day
+            period_stats = stats.setdefault(
+                period,
+                {
+                    "id": f"{wallet_id}:{bucket}:{period.isoformat()}",
+                    "bucket": bucket,
+                    "start": period,
+                    "inflow": Decimal(0),
+                    "outflow": Decimal(0),
+                    "tx_count": 0,
+                },
+            )
+            period_stats["inflow"] += inflow
+            period_stats["outflow"] += outflow
+            period_stats["tx_count"] += tx_count
+            period_stats["closing_balance"] = closing_balance
+        return list(stats.values())
+
+    def compact(self, batch_size: int) -> int:
+        """
+        Folds at most `batch_size` deltas into the rollups of their days and returns
+        how many it folded. Deltas locked by another compaction are skipped.
+        """
+        connection = connections[router.db_for_write(self.model)]
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH moved AS (
+                    DELETE FROM {WalletRollupDelta._meta.db_table}
+                    WHERE id IN (
+                        SELECT id FROM {WalletRollupDelta._meta.db_table}
+                        ORDER BY id
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING wallet_id, day, inflow, outflow, tx_count
+                ),
+                folded AS (
+                    INSERT INTO {self.model._meta.db_table} AS r
+                        (wallet_id, day, inflow, outflow, tx_count)
+                    SELECT wallet_id, day, sum(inflow), sum(outflow), sum(tx_count)
+                    FROM moved
+                    GROUP BY wallet_id, day
+                    -- The same order in every compaction, so they can't deadlock.
+                    ORDER BY wallet_id, day
+                    ON CONFLICT (wallet_id, day) DO UPDATE SET
+                        inflow = r.inflow + EXCLUDED.inflow,
+                        outflow = r.outflow + EXCLUDED.outflow,
+                        tx_count = r.tx_count + EXCLUDED.tx_count
+                )
+                SELECT count(*) FROM moved
+                """,
+                [batch_size],
+            )
+            return cursor.fetchone()[0]
+
+
+class WalletDailyRollup(models.Model):
+    """
+    The TXs of a wallet on one day (UTC) of their ids, summed up, so stats over a
+    period read a row per day instead of every TX.
+
+    A trigger on every insert into the TX table, however the TXs are written,
+    appends `WalletRollupDelta` rows, see migration 0011. Rollups are only written
+    when the `compact_rollups` command folds the deltas, so TXs never wait on the
+    row of their day.
+    """
+
+    # Indexed by the unique constraint, which leads with the wallet.
+    wallet = models.ForeignKey(
+        Wallet,
+        related_name="daily_rollups",
+        on_delete=models.CASCADE,
+        db_index=False,
+    )
+    day = models.DateField()
+    inflow = models.DecimalField(
+        max_digits=38,
+        decimal_places=18,
+        default=Decimal(0),
+        db_comment="The sum of the day's positive amounts.",
+    )
+    outflow = models.DecimalField(
+        max_digits=38,
+        decimal_places=18,
+        default=Decimal(0),
+        db_comment="The sum of the day's negative amounts, as a positive number.",
+    )
+    tx_count = models.PositiveIntegerField(default=0)
+
+    objects = WalletDailyRollupManager()
+
+    def __repr__(self):
+        return (
+            f"<WalletDailyRollup: {self.wallet_id} @ {self.day}: "
+            f"+{self.inflow} -{self.outflow}>"
+        )
+
+    class Meta:
+        ordering = ("wallet", "day")
+        constraints = [
+            models.UniqueConstraint(
+                fields=("wallet", "day"),
+                name="blockchains_walletdailyrollup_unique_day",
+            ),
+        ]
+
+
+class WalletRollupDelta(models.Model):
+    """
+    The TXs of one insert statement on one day, waiting to be folded into the
+    wallet's `WalletDailyRollup` of the day, see `WalletDailyRollupManager.compact`.
+    """
+
+    wallet = models.ForeignKey(
+        Wallet,
+        related_name="+",
+        on_delete=models.CASCADE,
+        db_index=False,
+    )
+    day = models.DateField()
+    inflow = models.DecimalField(max_digits=38, decimal_places=18)
+    outflow = models.DecimalField(max_digits=38, decimal_places=18)
+    tx_count = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=("wallet", "day"), name="blockchains_rollupdelta_idx"),
+        ]
+
+
+class BalanceCheckpointManager(models.Manager):
+    def advance(
+        self, wallet_id, until: str, batch_size: int
+    ) -> tuple["BalanceCheckpoint", bool]:
+        """
+        Adds at most `batch_size` of the wallet's TXs newer than its watermark and
+        older than the id `until` to its checkpoint. Returns the checkpoint and whether
+        it caught up with `until`.
+        """
+        connection = connections[router.db_for_write(self.model)]
+        with transaction.atomic(using=connection.alias):
+            checkpoint, created = self.select_for_update().get_or_create(
+                wallet_id=wallet_id
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    SELECT max(id), coalesce(sum(amount), 0), count(*)
+                    FROM (
+                        SELECT id, amount FROM {TX._meta.db_table}
+                        WHERE wallet_id = %s AND id > %s AND id < %s
+                        ORDER BY id
+                        LIMIT %s
+                    ) batch
+                    """,
+                    [str(wallet_id), checkpoint.watermark, until, batch_size],
+                )
+                last_id, amount, count = cursor.fetchone()
+            if count:
+                checkpoint.watermark = last_id
+                checkpoint.tx_sum += amount
+                checkpoint.save(update_fields=["watermark", "tx_sum"])
+        return checkpoint, count < batch_size
+
+    def get_balance_at(self, wallet_id, watermark: str) -> Decimal:
+        """
+        Returns the wallet's total balance without the TXs newer than `watermark`.
+        A single statement, so the balance and the TXs come from the same snapshot.
+        """
+        connection = connections[router.db_for_write(self.model)]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT w.balance
+                    + coalesce((
+                        SELECT sum(balance) FROM {WalletSlot._meta.db_table}
+                        WHERE wallet_id = w.id
+                    ), 0)
+                    - coalesce((
+                        SELECT sum(amount) FROM {TX._meta.db_table}
+                        WHERE wallet_id = w.id AND id > %s
+                    ), 0)
+                FROM {Wallet._meta.db_table} w
+                WHERE w.id = %s
+                """,
+                [watermark, str(wallet_id)],
+            )
+            row = cursor.fetchone()
+        if row is None:
+            raise Wallet.DoesNotExist
+        return row[0]
+
+
+class BalanceCheckpoint(models.Model):
+    """
+    The sum of a wallet's TXs up to a watermark, so reconciling the wallet only has to
+    read the TXs that came after it.
+    """
+
+    wallet = models.OneToOneField(
+        Wallet, primary_key=True, related_name="checkpoint", on_delete=models.CASCADE
+    )
+    watermark = models.CharField(
+        max_length=36,
+        blank=True,
+        default="",
+        db_comment="The id of the newest TX included in tx_sum.",
+    )
+    tx_sum = models.DecimalField(
+        max_digits=38,
+        decimal_places=18,
+        default=Decimal(0),
+        db_comment="The sum of the amounts of the wallet's TXs up to the watermark.",
+    )
+
+    objects = BalanceCheckpointManager()
+
+    def __repr__(self):
+        return (
+            f"<BalanceCheckpoint: {self.wallet_id} @ {self.watermark}: {self.tx_sum}>"
+        )
+
+
+class BalanceDriftManager(models.Manager):
+    def detect(self, checkpoint: BalanceCheckpoint) -> "BalanceDrift | None":
+        """
+        Records a drift if the wallet's balance at the checkpoint's watermark differs
+        from the sum of its TXs. A drift that is still open with the same difference
+        is returned instead of being recorded again.
+        """
+        actual = BalanceCheckpoint.objects.get_balance_at(
+            checkpoint.wallet_id, checkpoint.watermark
+        )
+        if actual == checkpoint.tx_sum:
+            return None
+
+        drift = (
+            self.filter(wallet_id=checkpoint.wallet_id, fixed_at__isnull=True)
+            .order_by("-detected_at")
+            .first()
+        )
+        if drift is not None and drift.difference == actual - checkpoint.tx_sum:
+            return drift
+        return self.create(
+            wallet_id=checkpoint.wallet_id,
+            watermark=checkpoint.watermark,
+            expected=checkpoint.tx_sum,
+            actual=actual,
+        )
+
+    def fix(self, drift: "BalanceDrift"):
+        """
+        Corrects the wallet's balance by the drift as it stands now and marks the
+        drift fixed.
+        """
+        with transaction.atomic():
+            wallet = Wallet.objects.select_for_update().get(pk=drift.wallet_id)
+            actual = BalanceCheckpoint.objects.get_balance_at(
+                wallet.pk, drift.watermark
+            )
+            correction = drift.expected - actual
+            if correction:
+                if wallet.total_balance + correction < 0:
+                    raise BalanceError(_("Balance cannot be less than 0"))
+                Wallet.objects.filter(pk=wallet.pk).update(
+                    balance=models.F("balance") + correction,
+                    version=models.F("version") + 1,
+                )
+                if wallet.slot_count:
+                    wallet.refresh_from_db()
+                    Wallet.objects.reshard(wallet, wallet.slot_count)
+            drift.fixed_at = timezone.now()
+            drift.save(update_fields=["fixed_at"])
+
+
+class BalanceDrift(models.Model):
+    """
+    A difference between a wallet's balance and the sum of its TXs found by the
+    reconciliation.
+    """
+
+    wallet = models.ForeignKey(Wallet, related_name="drifts", on_delete=models.CASCADE)
+    watermark = models.CharField(
+        max_length=36, db_comment="The id of the newest TX the balances cover."
+    )
+    expected = models.DecimalField(
+        max_digits=38,
+        decimal_places=18,
+        db_comment="The sum of the wallet's TXs up to the watermark.",
+    )
+    actual = models.DecimalField(
+        max_digits=38,
+        decimal_places=18,
+        db_comment="The wallet's balance without the TXs after the watermark.",
+    )
+    detected_at = models.DateTimeField(auto_now_add=True)
+    fixed_at = models.DateTimeField(null=True, blank=True)
+
+    objects = BalanceDriftManager()
+
+    @property
+    def difference(self) -> Decimal:
+        return self.actual - self.expected
+
+    def __repr__(self):
+        return f"<BalanceDrift: {self.wallet_id} @ {self.watermark}: {self.difference}>"
+
+    class Meta:
+        ordering = ("-detected_at",)
+
+
+class ReconciliationRun(models.Model):
+    """
+    A pass of the reconciliation. The watermark of the last finished run bounds the
+    TXs the next one has to look at to find the wallets that changed.
+    """
+
+    watermark = models.CharField(
+        max_length=36, db_comment="TXs with smaller ids were covered by the run."
+    )
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    wallets = models.PositiveIntegerField(default=0)
+    drifts = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ("-started_at",)
@@ -0,0 +1,51 @@
+from rest_framework.exceptions import ParseError
+from rest_framework_json_api import exceptions
+from rest_framework_json_api.utils import get_resource_name
+
+from broker.parsers import JSONParser
+
+
+class BulkJSONParser(JSONParser):
+    """
+    Parses a JSON:API document whose primary data is a list of resource objects.
+
+    .. code:: json
+
+        {
+            "data": [
+                {"type": "TX", "attributes": {"wallet": "...", "txid": "...", "amount": "1.5"}},
+                {"type": "TX", "attributes": {"wallet": "...", "txid": "...", "amount": "-0.5"}}
+            ]
+        }
+
+    Every resource object is flattened the same way `JSONParser` flattens a single one,
+    so the view receives a list of plain dicts in document order.
+    """
+
+    def parse_data(self, result, parser_context):
+        if not isinstance(result, dict) or not isinstance(result.get("data"), list):
+            raise ParseError(
+                "Received document does not contain a list of primary data"
+            )
+
+        resource_name = get_resource_name(parser_context or {})
+        parsed_data = []
+        for data in result["data"]:
+            if not isinstance(data, dict):
+                raise ParseError(
+                    "Received data contains one or more malformed JSON:API Resource Object(s)"
+                )
+            if data.get("type") != resource_name:
+                raise exceptions.Conflict(
+                    "The resource object's type ({data_type}) is not the type that "
+                    "constitute the collection represented by the endpoint "
+                    "({resource_type}).".format(
+                        data_type=data.get("type"), resource_type=resource_name
+                    )
+                )
+
+            item = {"type": data.get("type")}
+            item.update(self.parse_attributes(data))
+            item.update(self.parse_relationships(data))
+            parsed_data.append(item)
+        return parsed_data
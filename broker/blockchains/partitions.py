@@ -0,0 +1,131 @@
+"""
+The monthly range partitions of the TX table.
+
+TX ids are UUID7 strings, which sort by creation time, so a month of TXs is the id
+range from `uuid7_floor` of its first day to that of the next month's. Queries
+bounding the id, like cursor pages or `filter[id.gt]`, only read the partitions
+of the months they cover.
+"""
+
+import re
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from django.db import transaction
+
+from .models import TX, uuid7_floor
+
+DEFAULT_PARTITION = f"{TX._meta.db_table}_default"
+
+BOUNDS_PATTERN = re.compile(r"FROM \((.+)\) TO \((.+)\)")
+
+# `lower` and `upper` are `None` when unbounded, both are for the default partition.
+Partition = namedtuple("Partition", ["name", "lower", "upper"])
+
+
+def month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(moment: datetime, months: int) -> datetime:
+    year, month = divmod(moment.year * 12 + moment.month - 1 + months, 12)
+    return datetime(year, month + 1, 1, tzinfo=timezone.utc)
+
+
+def get_partition_name(month: datetime) -> str:
+    return f"{TX._meta.db_table}_p{month:%Y%m}"
+
+
+def get_partitions(connection) -> list[Partition]:
+    """
+    Returns the partitions attached to the TX table, ordered by their bounds.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass
+            """,
+            [TX._meta.db_table],
+        )
+        rows = cursor.fetchall()
+
+    partitions = []
+    for name, bounds in rows:
+        match = BOUNDS_PATTERN.search(bounds)
+        if match is None:
+            partitions.append(Partition(name, None, None))
+            continue
+        lower, upper = (
+            None if bound in ("MINVALUE", "MAXVALUE") else bound.strip("'")
+            for bound in match.groups()
+        )
+        partitions.append(Partition(name, lower, upper))
+    return sorted(partitions, key=lambda partition: partition.lower or "")
+
+
+def create_partition(connection, month: datetime) -> str | None:
+    """
+    Creates the partition of `month` unless a partition covers part of it already.
+    Returns its name, or `None` when it wasn't created.
+
+    TXs of the month that landed in the default partition are moved to the new one.
+    """
+    lower = uuid7_floor(month)
+    upper = uuid7_floor(add_months(month, 1))
+    partitions = get_partitions(connection)
+    for partition in partitions:
+        if partition.name == DEFAULT_PARTITION:
+            continue
+        if (partition.lower is None or partition.lower < upper) and (
+            partition.upper is None or partition.upper > lower
+        ):
+            return None
+
+    name = get_partition_name(month)
+    quote = connection.ops.quote_name
+    table = quote(TX._meta.db_table)
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE {quote(name)} (LIKE {table} "
+            "INCLUDING DEFAULTS INCLUDING COMMENTS)"
+        )
+        if any(partition.name == DEFAULT_PARTITION for partition in partitions):
+            # The txids stay registered: the trigger of the TX table doesn't fire on
+            # a table that isn't attached yet.
+            cursor.execute(
+                f"""
+                WITH moved AS (
+                    DELETE FROM {quote(DEFAULT_PARTITION)}
+                    WHERE id >= %s AND id < %s
+                    RETURNING *
+                )
+                INSERT INTO {quote(name)} SELECT * FROM moved
+                """,
+                [lower, upper],
+            )
+        # Attaching creates the indexes, foreign key and trigger of the TX table.
+        cursor.execute(
+            f"ALTER TABLE {table} ATTACH PARTITION {quote(name)} "
+            f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+        )
+    return name
+
+
+def detach_partition(connection, partition: Partition, schema: str | None = None):
+    """
+    Detaches `partition` from the TX table, keeping it as a table of its own, moved
+    to `schema` if given. Its txids stay registered in `UniqueTXID`.
+    """
+    quote = connection.ops.quote_name
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(
+            f"ALTER TABLE {quote(TX._meta.db_table)} "
+            f"DETACH PARTITION {quote(partition.name)}"
+        )
+        if schema:
+            cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {quote(schema)}")
+            cursor.execute(
+                f"ALTER TABLE {quote(partition.name)} SET SCHEMA {quote(schema)}"
+            )
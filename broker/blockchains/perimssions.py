@@ -4,7 +4,7 @@ from rest_framework import permissions
 class IsWalletOwner(permissions.BasePermission):
     """
     Object-level permission to only allow owners of an object to edit it.
-    Assumes the model instance has an `owner` attribute.
+    Assumes the model instance has a `user_id` attribute.
     """
 
     def has_object_permission(self, request, view, obj):
@@ -13,8 +13,8 @@ class IsWalletOwner(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True
 
-        # Instance must have an attribute named `user_id`.
-        return obj.user == request.user
+        # Compared by id, so the user row isn't loaded.
+        return obj.user_id == request.user.pk
 
 
 class IsWalletActive(permissions.BasePermission):
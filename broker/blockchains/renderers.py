@@ -0,0 +1,79 @@
+import csv
+import io
+import json
+from itertools import batched, islice
+
+from asgiref.sync import sync_to_async
+from rest_framework import renderers
+
+
+class RowStreamRenderer(renderers.BaseRenderer):
+    """
+    Renders rows of `columns` into chunks of text for a `StreamingHttpResponse`.
+
+    `render` only handles the data of regular responses, like errors.
+    """
+
+    charset = "utf-8"
+    columns = ()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = data if isinstance(data, list) else [data]
+        columns = tuple(rows[0]) if rows and isinstance(rows[0], dict) else ("detail",)
+        rows = [
+            [row.get(column) for column in columns] if isinstance(row, dict) else [row]
+            for row in rows
+        ]
+        return (self.render_header(columns) + self.render_rows(columns, rows)).encode()
+
+    def stream(self, rows, chunk_size):
+        yield self.render_header(self.columns)
+        for chunk in batched(rows, chunk_size):
+            yield self.render_rows(self.columns, chunk)
+
+    async def astream(self, rows, chunk_size):
+        # `QuerySet.aiterator` runs the query of a `values_list` in the event loop
+        # on Django 5.1, so chunks of the sync iterator are fetched in a thread.
+        rows = iter(rows)
+        next_chunk = sync_to_async(lambda: list(islice(rows, chunk_size)))
+
+        yield self.render_header(self.columns)
+        while chunk := await next_chunk():
+            yield self.render_rows(self.columns, chunk)
+
+    def render_header(self, columns):
+        return ""
+
+    def render_rows(self, columns, rows):
+        raise NotImplementedError
+
+
+class NDJSONRenderer(RowStreamRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+    def render_rows(self, columns, rows):
+        return "".join(
+            json.dumps(dict(zip(columns, row)), default=str) + "\n" for row in rows
+        )
+
+
+class CSVRenderer(RowStreamRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+    def render_header(self, columns):
+        return self.render_rows(columns, [columns])
+
+    def render_rows(self, columns, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue()
+
+
+class TXNDJSONRenderer(NDJSONRenderer):
+    columns = ("id", "txid", "amount")
+
+
+class TXCSVRenderer(CSVRenderer):
+    columns = ("id", "txid", "amount")
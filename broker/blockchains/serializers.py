@@ -1,9 +1,12 @@
 from django.core.validators import RegexValidator
 from django_uuid7 import UUID7SerializerField
+from django.utils.translation import gettext_lazy as _
+from rest_framework import serializers as rest_serializers
 from rest_framework_json_api import serializers
 from django.contrib.auth import get_user_model
 import uuid_utils as uuid
-from .models import Wallet, TX
+from .fields import WalletRelatedField
+from .models import QueuedTX, Wallet, WalletDailyRollupManager, TX
 
 
 class WalletSerializer(serializers.ModelSerializer):
@@ -17,7 +20,42 @@ class WalletSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Wallet
-        fields = ("id", "user", "label", "balance", "status")
+        fields = ("id", "user", "label", "balance", "status", "slot_count")
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        # A sharded wallet shows the total of its row and slots, which can be sent
+        # back as read but not changed: it would land on the row alone.
+        instance = self.instance
+        if instance is not None and instance.slot_count and "balance" in attrs:
+            if attrs.pop("balance") != instance.total_balance:
+                raise rest_serializers.ValidationError(
+                    {"balance": [_("Cannot be changed on a sharded wallet.")]}
+                )
+        return attrs
+
+    def create(self, validated_data):
+        slot_count = validated_data.pop("slot_count", 0)
+        wallet = super().create(validated_data)
+        if slot_count:
+            Wallet.objects.reshard(wallet, slot_count)
+        return wallet
+
+    def update(self, instance, validated_data):
+        slot_count = validated_data.pop("slot_count", instance.slot_count)
+        wallet = super().update(instance, validated_data)
+        if slot_count != wallet.slot_count:
+            Wallet.objects.reshard(wallet, slot_count)
+        return wallet
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # A sharded wallet still shows a single balance: its row plus its slots.
+        if "balance" in data:
+            data["balance"] = self.fields["balance"].to_representation(
+                instance.total_balance
+            )
+        return data
 
 
 class TXSerializer(serializers.ModelSerializer):
@@ -30,9 +68,85 @@ class TXSerializer(serializers.ModelSerializer):
             RegexValidator(r"^[xa-fA-F0-9-]{64,100}$"),
         ],
     )
-    wallet = serializers.PrimaryKeyRelatedField(queryset=Wallet.objects.all())
+    wallet = WalletRelatedField(queryset=Wallet.objects.all())
     amount = serializers.DecimalField(max_digits=26, decimal_places=18)
 
     class Meta:
         model = TX
         fields = ("id", "wallet", "txid", "amount")
+
+
+class TXBulkSerializer(TXSerializer):
+    """
+    Validates a single item of a bulk ingestion document.
+
+    The wallet is kept as a bare id: wallets are resolved once per batch
+    instead of once per item.
+    """
+
+    wallet = serializers.UUIDField(source="wallet_id")
+
+    class Meta(TXSerializer.Meta):
+        pass
+
+
+class QueuedTXSerializer(serializers.ModelSerializer):
+    """
+    The status of a TX queued for write-behind ingestion. An applied TX is linked
+    as `tx`.
+    """
+
+    id = UUID7SerializerField(read_only=True)
+    wallet = serializers.PrimaryKeyRelatedField(read_only=True)
+    tx = serializers.PrimaryKeyRelatedField(read_only=True)
+    status = serializers.ChoiceField(choices=QueuedTX.Status.choices, read_only=True)
+
+    class Meta:
+        model = QueuedTX
+        fields = (
+            "id",
+            "wallet",
+            "txid",
+            "amount",
+            "status",
+            "errors",
+            "processed_at",
+            "tx",
+        )
+
+
+class WalletStatsSerializer(serializers.Serializer):
+    """
+    A period of a wallet's TXs, see `WalletDailyRollupManager.get_stats`.
+    """
+
+    id = serializers.CharField(read_only=True)
+    bucket = serializers.ChoiceField(choices=WalletDailyRollupManager.BUCKETS)
+    start = serializers.DateField()
+    inflow = serializers.DecimalField(max_digits=38, decimal_places=18)
+    outflow = serializers.DecimalField(max_digits=38, decimal_places=18)
+    tx_count = serializers.IntegerField()
+    closing_balance = serializers.DecimalField(max_digits=38, decimal_places=18)
+
+
+class WalletStatsQuerySerializer(rest_serializers.Serializer):
+    """
+    Validates the `from`, `to` and `bucket` query parameters of the wallet stats.
+    """
+
+    def get_fields(self):
+        # `from` is a keyword, so the fields can't be declared as attributes.
+        return {
+            "from": rest_serializers.DateField(required=False),
+            "to": rest_serializers.DateField(required=False),
+            "bucket": rest_serializers.ChoiceField(
+                choices=WalletDailyRollupManager.BUCKETS, default="day"
+            ),
+        }
+
+    def validate(self, attrs):
+        if "from" in attrs and "to" in attrs and attrs["from"] > attrs["to"]:
+            raise rest_serializers.ValidationError(
+                {"to": [_("Must not be before `from`.")]}
+            )
+        return attrs
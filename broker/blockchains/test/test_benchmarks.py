@@ -0,0 +1,34 @@
+import pytest
+
+from ..benchmarks import BENCHMARKS, compare, run_benchmark
+from ..models import TX, Wallet
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize("name", BENCHMARKS)
+def test_benchmark_runs_and_flushes_its_data(name: str):
+    result = run_benchmark(name, rounds=1, threads=2, scale=0.01)
+
+    assert result["rate"] > 0
+    assert result["min"] <= result["rate"] <= result["max"]
+    assert not Wallet.objects.exists()
+    assert not TX.objects.exists()
+
+
+def test_compare_flags_slowdowns_beyond_the_tolerance():
+    results = {
+        "slower": {"unit": "TXs", "rate": 70.0},
+        "within": {"unit": "TXs", "rate": 90.0},
+        "new": {"unit": "TXs", "rate": 10.0},
+    }
+    baselines = {
+        "slower": {"unit": "TXs", "rate": 100.0},
+        "within": {"unit": "TXs", "rate": 100.0},
+    }
+
+    comparison = compare(results, baselines, tolerance=0.2)
+
+    assert comparison["slower"]["regressed"] is True
+    assert comparison["slower"]["change"] == pytest.approx(-0.3)
+    assert comparison["within"]["regressed"] is False
+    assert comparison["new"] == {"baseline": None, "change": None, "regressed": False}
@@ -0,0 +1,427 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+from io import StringIO
+import json
+import threading
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+import pytest
+
+from broker.conftest import User, fake
+from broker.db import atomic_with_retries
+
+from .. import models
+from ..models import (
+    DUPLICATE_TXID_MESSAGE,
+    TX,
+    BalanceCheckpoint,
+    BalanceDrift,
+    QueuedTX,
+    UniqueTXID,
+    Wallet,
+    WalletDailyRollup,
+    WalletRollupDelta,
+    uuid7_floor,
+)
+from .factories import TXFactory, WalletFactory
+
+
+@pytest.mark.django_db
+def test_import_transactions_merges_new_txs_and_updates_balances(
+    default_user: User, tmp_path
+):
+    wallet = WalletFactory(user=default_user, balance=Decimal("1.00"))
+    other = WalletFactory(user=default_user, balance=Decimal("0.00"))
+    existing = TXFactory(wallet=wallet)
+    txid = fake.sha256()
+    path = tmp_path / "txs.csv"
+    path.write_text(
+        "wallet,txid,amount\n"
+        f"{wallet.pk},{txid},2.5\n"
+        f"{wallet.pk},{txid},2.5\n"
+        f"{wallet.pk},{existing.txid},100\n"
+        f"{other.pk},{fake.sha256()},-0.000000000000000001\n"
+        f"{other.pk},{fake.sha256()},0.000000000000000003\n"
+    )
+    stdout = StringIO()
+
+    call_command("import_transactions", path, stdout=stdout)
+
+    assert "Staged 5 rows: 3 new, 2 with known or repeated txids" in stdout.getvalue()
+    assert "Imported 3 TXs into 2 wallets" in stdout.getvalue()
+    assert TX.objects.filter(txid=txid).count() == 1
+    assert Wallet.objects.get(pk=wallet.pk).balance == Decimal("3.50")
+    assert Wallet.objects.get(pk=other.pk).balance == Decimal("2e-18")
+
+
+@pytest.mark.django_db
+def test_import_transactions_into_sharded_wallet_respreads_slots(
+    default_user: User, tmp_path
+):
+    wallet = WalletFactory(user=default_user, balance=Decimal("3.00"))
+    Wallet.objects.reshard(wallet, 3)
+    path = tmp_path / "txs.ndjson"
+    path.write_text(json.dumps({"txid": fake.sha256(), "amount": "-2.5"}) + "\n")
+
+    call_command("import_transactions", path, wallet=str(wallet.pk), stdout=StringIO())
+
+    wallet = Wallet.objects.with_balance().get(pk=wallet.pk)
+    assert wallet.balance == Decimal("0.00")
+    assert wallet.total_balance == Decimal("0.50")
+
+
+@pytest.mark.django_db
+def test_import_transactions_dry_run_reports_negative_wallets(
+    default_user: User, tmp_path
+):
+    wallet = WalletFactory(user=default_user, balance=Decimal("1.00"))
+    path = tmp_path / "txs.ndjson"
+    path.write_text(
+        json.dumps({"wallet": str(wallet.pk), "txid": fake.sha256(), "amount": -1.5})
+        + "\n"
+    )
+    stdout = StringIO()
+
+    call_command("import_transactions", path, dry_run=True, stdout=stdout)
+
+    assert "1 wallets would go negative" in stdout.getvalue()
+    assert f"{wallet.pk}: -0.5" in stdout.getvalue()
+    assert not TX.objects.exists()
+
+    with pytest.raises(CommandError):
+        call_command("import_transactions", path, stdout=StringIO())
+
+    assert not TX.objects.exists()
+    assert Wallet.objects.get(pk=wallet.pk).balance == Decimal("1.00")
+
+
+@pytest.mark.django_db
+def test_import_transactions_rejects_an_invalid_row(default_user: User, tmp_path):
+    wallet = WalletFactory(user=default_user)
+    path = tmp_path / "txs.csv"
+    path.write_text(f"wallet,txid,amount\n{wallet.pk},not-a-hash,1\n")
+
+    with pytest.raises(CommandError, match="txs.csv:2"):
+        call_command("import_transactions", path, stdout=StringIO())
+
+
+@pytest.mark.django_db
+def test_import_transactions_rejects_a_taken_id_without_claiming_txids(
+    default_user: User, tmp_path
+):
+    wallet = WalletFactory(user=default_user, balance=Decimal("1.00"))
+    existing = TXFactory(wallet=wallet)
+    txid = fake.sha256()
+    path = tmp_path / "txs.csv"
+    path.write_text(f"id,wallet,txid,amount\n{existing.pk},{wallet.pk},{txid},1\n")
+
+    with pytest.raises(CommandError, match="nothing was imported"):
+        call_command("import_transactions", path, stdout=StringIO())
+
+    assert not UniqueTXID.objects.filter(txid=txid).exists()
+    assert Wallet.objects.get(pk=wallet.pk).balance == Decimal("1.00")
+
+
+def reconcile_balances(**options):
+    # Without lag, TXs of the current millisecond are left for the next run.
+    time.sleep(0.002)
+    options.setdefault("stdout", StringIO())
+    call_command("reconcile_balances", lag=0, **options)
+
+
+@pytest.mark.django_db
+def test_reconcile_balances_only_reads_wallets_with_new_txs(default_user: User):
+    wallet = WalletFactory(user=default_user, balance=Decimal("0.00"))
+    idle = WalletFactory(user=default_user, balance=Decimal("0.00"))
+    TX.objects.create(wallet=wallet, txid=fake.sha256(), amount=Decimal("2.00"))
+    reconcile_balances()
+
+    assert BalanceCheckpoint.objects.get(wallet=idle).tx_sum == Decimal("0.00")
+    tx = TX.objects.create(wallet=wallet, txid=fake.sha256(), amount=Decimal("-0.50"))
+    stdout = StringIO()
+    reconcile_balances(batch_size=1, stdout=stdout)
+
+    assert "Reconciled 1 wallets, 0 drifted." in stdout.getvalue()
+    checkpoint = BalanceCheckpoint.objects.get(wallet=wallet)
+    assert checkpoint.watermark == str(tx.pk)
+    assert checkpoint.tx_sum == Decimal("1.50")
+    assert not BalanceDrift.objects.exists()
+
+
+@pytest.mark.django_db
+def test_compact_rollups_folds_rollup_deltas(default_user: User):
+    wallet = WalletFactory(user=default_user, balance=Decimal("0.00"))
+    for amount in ("2.00", "-0.50"):
+        TX.objects.create(wallet=wallet, txid=fake.sha256(), amount=Decimal(amount))
+    stdout = StringIO()
+
+    call_command("compact_rollups", batch_size=1, stdout=stdout)
+
+    assert "Folded 2 rollup deltas." in stdout.getvalue()
+    assert not WalletRollupDelta.objects.exists()
+    [rollup] = WalletDailyRollup.objects.filter(wallet=wallet)
+    assert (rollup.inflow, rollup.outflow, rollup.tx_count) == (
+        Decimal("2.00"),
+        Decimal("0.50"),
+        2,
+    )
+
+
+@pytest.mark.django_db
+def test_reconcile_balances_records_and_fixes_drift(default_user: User):
+    wallet = WalletFactory(user=default_user, balance=Decimal("0.00"))
+    TX.objects.create(wallet=wallet, txid=fake.sha256(), amount=Decimal("2.00"))
+    Wallet.objects.filter(pk=wallet.pk).update(balance=Decimal("2.25"))
+    stdout = StringIO()
+
+    reconcile_balances(stdout=stdout)
+
+    drift = BalanceDrift.objects.get(wallet=wallet)
+    assert drift.difference == Decimal("0.25")
+    assert drift.fixed_at is None
+    assert "Reconciled 1 wallets, 1 drifted." in stdout.getvalue()
+
+    # The wallet didn't change since, the drift is fixed all the same.
+    reconcile_balances(fix=True)
+
+    assert BalanceDrift.objects.get(wallet=wallet).fixed_at is not None
+    assert Wallet.objects.get(pk=wallet.pk).balance == Decimal("2.00")
+
+
+@pytest.mark.django_db
+def test_imported_txs_older_than_the_watermark_do_not_drift(
+    default_user: User, tmp_path
+):
+    wallet = WalletFactory(user=default_user, balance=Decimal("0.00"))
+    TX.objects.create(wallet=wallet, txid=fake.sha256(), amount=Decimal("2.00"))
+    reconcile_balances()
+    assert BalanceCheckpoint.objects.filter(wallet=wallet).exists()
+    old_id = uuid7_floor(datetime(2020, 1, 1, tzinfo=timezone.utc))
+    path = tmp_path / "txs.csv"
+    path.write_text(f"id,wallet,txid,amount\n{old_id},{wallet.pk},{fake.sha256()},1\n")
+
+    call_command("import_transactions", path, stdout=StringIO())
+
+    assert BalanceCheckpoint.objects.get(wallet=wallet).tx_sum == Decimal("3.00")
+    reconcile_balances()
+
+    assert BalanceCheckpoint.objects.get(wallet=wallet).tx_sum == Decimal("3.00")
+    assert not BalanceDrift.objects.exists()
+
+
+@pytest.mark.django_db
+def test_apply_queued_transactions_rejects_only_the_txs_at_fault(default_user: User):
+    wallet = WalletFactory(user=default_user, balance=Decimal("1.00"))
+    existing = TXFactory(wallet=wallet)
+    applied = [
+        QueuedTX.objects.create(wallet=wallet, txid=fake.sha256(), amount=amount)
+        for amount in (Decimal("-0.50"), Decimal("2.00"))
+    ]
+    overdraft = QueuedTX.objects.create(
+        wallet=wallet, txid=fake.sha256(), amount=Decimal("-5.00")
+    )
+    duplicate = QueuedTX.objects.create(
+        wallet=wallet, txid=existing.txid, amount=Decimal("1.00")
+    )
+    missing_wallet = QueuedTX.objects.create(
+        wallet_id=fake.uuid4(), txid=fake.sha256(), amount=Decimal("1.00")
+    )
+    stdout = StringIO()
+
+    call_command("apply_queued_transactions", "--batch-size", 2, stdout=stdout)
+
+    assert "Applied 2 TXs, rejected 3." in stdout.getvalue()
+    assert Wallet.objects.get(pk=wallet.pk).balance == Decimal("2.50")
+    assert {str(tx.pk) for tx in TX.objects.exclude(pk=existing.pk)} == {
+        str(item.tx_id) for item in QueuedTX.objects.filter(status="A")
+    }
+    statuses = {
+        str(pk): value for pk, value in QueuedTX.objects.values_list("pk", "status")
+    }
+    assert statuses[str(applied[0].pk)] == statuses[str(applied[1].pk)] == "A"
+    assert statuses[str(overdraft.pk)] == statuses[str(duplicate.pk)] == "R"
+    assert statuses[str(missing_wallet.pk)] == "R"
+    assert "balance" in QueuedTX.objects.get(pk=overdraft.pk).errors
+    assert "txid" in QueuedTX.objects.get(pk=duplicate.pk).errors
+    assert "wallet" in QueuedTX.objects.get(pk=missing_wallet.pk).errors
+
+
+@pytest.mark.django_db
+def test_apply_queued_transactions_rejects_only_a_txid_raced_in(
+    default_user: User, monkeypatch
+):
+    wallet = WalletFactory(user=default_user, balance=Decimal("1.00"))
+    raced, other = (
+        QueuedTX.objects.create(wallet=wallet, txid=fake.sha256(), amount=amount)
+        for amount in (Decimal("1.00"), Decimal("2.00"))
+    )
+
+    def take_txid_first(operation, function, **kwargs):
+        # A concurrent writer commits the txid between the lookup and the insert.
+        UniqueTXID.objects.get_or_create(
+            txid=raced.txid, defaults={"tx_id": fake.uuid4()}
+        )
+        return atomic_with_retries(operation, function, **kwargs)
+
+    monkeypatch.setattr(models, "atomic_with_retries", take_txid_first)
+    stdout = StringIO()
+
+    call_command("apply_queued_transactions", stdout=stdout)
+
+    assert "Applied 1 TXs, rejected 1." in stdout.getvalue()
+    raced.refresh_from_db()
+    other.refresh_from_db()
+    assert raced.status == QueuedTX.Status.REJECTED
+    assert raced.errors == {"txid": [str(DUPLICATE_TXID_MESSAGE)]}
+    assert other.status == QueuedTX.Status.APPLIED
+    assert Wallet.objects.get(pk=wallet.pk).balance == Decimal("3.00")
+
+
+@pytest.mark.django_db
+def test_queued_tx_applied_after_a_reconciliation_does_not_drift(default_user: User):
+    wallet = WalletFactory(user=default_user, balance=Decimal("0.00"))
+    queued = QueuedTX.objects.create(
+        wallet=wallet, txid=fake.sha256(), amount=Decimal("2.00")
+    )
+    # The watermark passes the queued TX's id while it waits in the queue.
+    reconcile_balances()
+
+    call_command("apply_queued_transactions", stdout=StringIO())
+    reconcile_balances()
+
+    queued.refresh_from_db()
+    assert queued.tx_id is not None and str(queued.tx_id) > str(queued.pk)
+    assert Wallet.objects.get(pk=wallet.pk).balance == Decimal("2.00")
+    assert BalanceCheckpoint.objects.get(wallet=wallet).tx_sum == Decimal("2.00")
+    assert not BalanceDrift.objects.exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_apply_queued_transactions_skips_wallets_locked_by_another_worker(
+    default_user: User,
+):
+    wallet = WalletFactory(user=default_user, balance=Decimal("1.00"))
+    QueuedTX.objects.create(wallet=wallet, txid=fake.sha256(), amount=Decimal("1"))
+
+    with connections["default"].cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_advisory_lock(%s, hashtext(%s))",
+            [QueuedTX.objects.ADVISORY_LOCK_NAMESPACE, str(wallet.pk)],
+        )
+    try:
+        # Threads get their own connection, as another worker would.
+        results = []
+        worker = threading.Thread(
+            target=lambda: (
+                results.append(QueuedTX.objects.apply(wallet.pk, 10)),
+                connections.close_all(),
+            )
+        )
+        worker.start()
+        worker.join()
+    finally:
+        with connections["default"].cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock_all()")
+
+    assert results == [None]
+    assert QueuedTX.objects.apply(wallet.pk, 10) == (1, 0)
+
+
+def get_partition_of(tx: TX) -> str:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT tableoid::regclass::text FROM blockchains_tx WHERE id = %s",
+            [str(tx.pk)],
+        )
+        return cursor.fetchone()[0]
+
+
+@pytest.mark.django_db
+def test_manage_tx_partitions_creates_months_ahead_and_prunes_by_id(
+    default_user: User,
+):
+    wallet = WalletFactory(user=default_user, balance=Decimal("10"))
+    january = uuid7_floor(datetime(2100, 1, 15, tzinfo=timezone.utc))
+    early = TX.objects.create(
+        wallet=wallet, id=f"{january[:-1]}1", txid=fake.sha256(), amount=Decimal("1")
+    )
+    assert get_partition_of(early) == "blockchains_tx_default"
+    stdout = StringIO()
+
+    call_command(
+        "manage_tx_partitions", "--month", "2100-01", "--ahead", 2, stdout=stdout
+    )
+
+    assert stdout.getvalue().splitlines() == [
+        "Created partition blockchains_tx_p210001.",
+        "Created partition blockchains_tx_p210002.",
+        "Created partition blockchains_tx_p210003.",
+    ]
+    # TXs that went to the default partition move to their month's.
+    assert get_partition_of(early) == "blockchains_tx_p210001"
+    assert TX.objects.get(pk=early.pk).txid == early.txid
+
+    # Covered months are left alone.
+    stdout = StringIO()
+    call_command(
+        "manage_tx_partitions", "--month", "2100-01", "--ahead", 2, stdout=stdout
+    )
+    assert stdout.getvalue() == ""
+
+    february = uuid7_floor(datetime(2100, 2, 1, tzinfo=timezone.utc))
+    sql, params = (
+        TX.objects.filter(id__gte=february).order_by("-id").query.sql_with_params()
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN {sql}", params)
+        plan = "\n".join(row[0] for row in cursor.fetchall())
+    assert "blockchains_tx_p210002" in plan
+    assert "blockchains_tx_p210001" not in plan
+    assert "blockchains_tx_initial" not in plan
+
+
+@pytest.mark.django_db
+def test_manage_tx_partitions_detaches_old_months_keeping_their_txids(
+    default_user: User,
+):
+    wallet = WalletFactory(user=default_user, balance=Decimal("0"))
+    january = uuid7_floor(datetime(2100, 1, 15, tzinfo=timezone.utc))
+    call_command(
+        "manage_tx_partitions", "--month", "2100-01", "--ahead", 1, stdout=StringIO()
+    )
+    old = TX.objects.create(
+        wallet=wallet, id=f"{january[:-1]}1", txid=fake.sha256(), amount=Decimal("1")
+    )
+    stdout = StringIO()
+
+    call_command(
+        "manage_tx_partitions",
+        "--month",
+        "2100-03",
+        "--ahead",
+        0,
+        "--retain",
+        1,
+        "--archive-schema",
+        "tx_archive",
+        stdout=stdout,
+    )
+
+    assert "Detached partition blockchains_tx_initial." in stdout.getvalue()
+    assert "Detached partition blockchains_tx_p210001." in stdout.getvalue()
+    assert "Detached partition blockchains_tx_p210002." not in stdout.getvalue()
+    assert not TX.objects.filter(pk=old.pk).exists()
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM tx_archive.blockchains_tx_p210001")
+        assert cursor.fetchone() == (1,)
+    # Checkpointed before it was detached, the TX still counts for reconciliation.
+    checkpoint = BalanceCheckpoint.objects.get(wallet=wallet)
+    assert (checkpoint.watermark, checkpoint.tx_sum) == (str(old.pk), Decimal("1"))
+    reconcile_balances()
+    assert not BalanceDrift.objects.exists()
+
+    with pytest.raises(ValidationError):
+        TX.objects.create(wallet=wallet, txid=old.txid, amount=Decimal("1"))
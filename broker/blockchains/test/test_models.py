@@ -0,0 +1,253 @@
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+import pytest
+
+from broker.conftest import User, fake
+from broker.db import atomic_with_retries
+
+from .. import models
+from ..models import (
+    DUPLICATE_TXID_MESSAGE,
+    TX,
+    StaleWalletError,
+    UniqueTXID,
+    Wallet,
+    WalletDailyRollup,
+    WalletRollupDelta,
+    WalletSlot,
+    uuid7_floor,
+)
+from ..perimssions import IsWalletOwner
+from ..serializers import TXSerializer
+from .factories import WalletFactory
+
+
+@pytest.mark.django_db(transaction=True)
+def test_create_transaction_runs_at_most_three_statements(default_user: User):
+    wallet = WalletFactory(user=default_user, balance=Decimal("5.00"))
+    serializer = TXSerializer(
+        data={"wallet": str(wallet.pk), "txid": fake.sha256(), "amount": "-5.00"}
+    )
+
+    # In its transaction, the timeouts, the conditional balance update and the TX
+    # insert, nothing else.
+    with CaptureQueriesContext(connection) as queries:
+        assert serializer.is_valid()
+        tx = serializer.save()
+    statements = [query["sql"] for query in queries]
+    assert statements[0] == "BEGIN" and statements[-1] == "COMMIT"
+    assert len(statements[1:-1]) <= 3
+
+    assert tx.wallet.balance == Decimal("0.00")
+    assert Wallet.objects.get(pk=wallet.pk).balance == Decimal("0.00")
+
+
+@pytest.mark.django_db
+def test_create_transaction_rejects_overdraft(default_user: User):
+    wallet = WalletFactory(user=default_user, balance=Decimal("5.00"))
+
+    with pytest.raises(ValidationError) as e:
+        TX.objects.create(wallet=wallet, txid=fake.sha256(), amount=Decimal("-5.01"))
+
+    assert "balance" in e.value.message_dict
+    assert Wallet.objects.get(pk=wallet.pk).balance == Decimal("5.00")
+    assert not TX.objects.exists()
+
+
+@pytest.mark.django_db
+def test_create_transaction_for_missing_wallet_fails():
+    with pytest.raises(Wallet.DoesNotExist):
+        TX.objects.create(wallet=Wallet(), txid=fake.sha256(), amount=Decimal("1.00"))
+
+
+@pytest.mark.django_db
+def test_reshard_spreads_balance_across_slots(default_user: User):
+    wallet = WalletFactory(user=default_user, balance=Decimal("10.00"))
+
+    Wallet.objects.reshard(wallet, 3)
+
+    balances = list(wallet.slots.values_list("balance", flat=True))
+    assert len(balances) == 3
+    assert sum(balances) == Decimal("10.00")
+    assert Wallet.objects.with_balance().get(pk=wallet.pk).total_balance == Decimal(
+        "10.00"
+    )
+
+    Wallet.objects.reshard(wallet, 0)
+
+    assert not wallet.slots.exists()
+    assert Wallet.objects.get(pk=wallet.pk).balance == Decimal("10.00")
+
+
+@pytest.mark.django_db
+def test_create_transaction_for_sharded_wallet_uses_slots(default_user: User):
+    wallet = WalletFactory(user=default_user, balance=Decimal("9.00"))
+    Wallet.objects.reshard(wallet, 3)
+
+    TX.objects.create(wallet=wallet, txid=fake.sha256(), amount=Decimal("1.00"))
+    # Larger than any single slot, so it is spread across all of them.
+    TX.objects.create(wallet=wallet, txid=fake.sha256(), amount=Decimal("-8.00"))
+
+    wallet = Wallet.objects.with_balance().get(pk=wallet.pk)
+    assert wallet.balance == Decimal("0.00")
+    assert wallet.total_balance == Decimal("2.00")
+    assert all(slot.balance >= 0 for slot in wallet.slots.all())
+
+
+@pytest.mark.django_db
+def test_bulk_create_blames_only_a_txid_taken_after_the_lookup(
+    default_user: User, monkeypatch
+):
+    wallet = WalletFactory(user=default_user, balance=Decimal("5.00"))
+    txs = [
+        TX(wallet_id=wallet.pk, txid=fake.sha256(), amount=Decimal(amount))
+        for amount in ("1.00", "2.00")
+    ]
+
+    def take_txid_first(operation, function, **kwargs):
+        # A concurrent writer commits the txid between the lookup and the insert.
+        UniqueTXID.objects.get_or_create(
+            txid=txs[0].txid, defaults={"tx_id": fake.uuid4()}
+        )
+        return atomic_with_retries(operation, function, **kwargs)
+
+    monkeypatch.setattr(models, "atomic_with_retries", take_txid_first)
+
+    errors = TX.objects.bulk_create_per_wallet(txs)
+
+    assert errors[0].message_dict == {"txid": [str(DUPLICATE_TXID_MESSAGE)]}
+    assert errors[1].code == "wallet_rejected"
+    assert Wallet.objects.get(pk=wallet.pk).balance == Decimal("5.00")
+    assert not TX.objects.exists()
+
+
+@pytest.mark.django_db
+def test_create_transaction_for_sharded_wallet_rejects_overdraft(default_user: User):
+    wallet = WalletFactory(user=default_user, balance=Decimal("9.00"))
+    Wallet.objects.reshard(wallet, 3)
+
+    with pytest.raises(ValidationError) as e:
+        TX.objects.create(wallet=wallet, txid=fake.sha256(), amount=Decimal("-9.01"))
+
+    assert "balance" in e.value.message_dict
+    assert Wallet.objects.get(pk=wallet.pk).total_balance == Decimal("9.00")
+    assert not TX.objects.exists()
+
+
+@pytest.mark.django_db
+def test_wallet_version_is_bumped_by_transactions_and_saves(default_user: User):
+    wallet = WalletFactory(user=default_user, balance=Decimal("5.00"))
+    version = Wallet.objects.get(pk=wallet.pk).version
+
+    TX.objects.create(wallet=wallet, txid=fake.sha256(), amount=Decimal("1.00"))
+    assert wallet.version == version + 1
+
+    wallet.label = "Savings"
+    wallet.save()
+    assert Wallet.objects.get(pk=wallet.pk).version == wallet.version == version + 2
+
+
+@pytest.mark.django_db
+def test_saving_a_stale_wallet_fails(default_user: User):
+    wallet = WalletFactory(user=default_user, balance=Decimal("5.00"))
+    stale = Wallet.objects.get(pk=wallet.pk)
+
+    TX.objects.create(wallet=wallet, txid=fake.sha256(), amount=Decimal("1.00"))
+
+    stale.label = "Savings"
+    with pytest.raises(StaleWalletError):
+        stale.save()
+    # The balance written by the TX isn't overwritten with the stale one.
+    assert Wallet.objects.get(pk=wallet.pk).balance == Decimal("6.00")
+
+
+def tx_on(wallet: Wallet, day: date, amount: str, position: int = 1) -> TX:
+    floor = uuid7_floor(datetime(day.year, day.month, day.day, tzinfo=timezone.utc))
+    return TX(
+        id=f"{floor[:-4]}{position:04x}",
+        wallet=wallet,
+        txid=fake.sha256(),
+        amount=Decimal(amount),
+    )
+
+
+def daily_stats(wallet: Wallet) -> list[tuple]:
+    return [
+        (
+            day["start"],
+            day["inflow"],
+            day["outflow"],
+            day["tx_count"],
+            day["closing_balance"],
+        )
+        for day in WalletDailyRollup.objects.get_stats(wallet.pk)
+    ]
+
+
+@pytest.mark.django_db
+def test_txs_are_rolled_up_by_day_through_appended_deltas(default_user: User):
+    wallet = WalletFactory(user=default_user, balance=Decimal("10"))
+    first, second = date(2100, 1, 4), date(2100, 1, 5)
+
+    errors = TX.objects.bulk_create_per_wallet(
+        [
+            tx_on(wallet, first, "5", 1),
+            tx_on(wallet, first, "-2", 2),
+            tx_on(wallet, second, "1", 3),
+        ]
+    )
+    assert not errors
+    # A later statement for the same day appends a delta of its own.
+    late = tx_on(wallet, first, "3", 4)
+    TX.objects.create(wallet=wallet, id=late.id, txid=late.txid, amount=late.amount)
+    expected = [
+        (first, Decimal("8"), Decimal("2"), 3, Decimal("16")),
+        (second, Decimal("1"), Decimal("0"), 1, Decimal("17")),
+    ]
+
+    assert WalletRollupDelta.objects.filter(wallet=wallet).count() == 3
+    assert not WalletDailyRollup.objects.filter(wallet=wallet).exists()
+    assert daily_stats(wallet) == expected
+
+    assert WalletDailyRollup.objects.compact(batch_size=2) == 2
+    assert WalletDailyRollup.objects.compact(batch_size=2) == 1
+    assert not WalletRollupDelta.objects.exists()
+    assert [
+        (rollup.day, rollup.inflow, rollup.outflow, rollup.tx_count)
+        for rollup in WalletDailyRollup.objects.filter(wallet=wallet)
+    ] == [row[:4] for row in expected]
+    assert daily_stats(wallet) == expected
+
+
+@pytest.mark.django_db
+def test_closing_balances_follow_balance_changes_made_without_txs(
+    default_user: User,
+):
+    wallet = WalletFactory(user=default_user, balance=Decimal("10"))
+    TX.objects.bulk_create_per_wallet([tx_on(wallet, date(2100, 1, 4), "5")])
+    Wallet.objects.reshard(wallet, 4)
+    assert daily_stats(wallet)[0][4] == Decimal("15")
+
+    # As a balance update or a drift fix would.
+    WalletSlot.objects.filter(wallet=wallet, index=0).update(balance=F("balance") - 1)
+
+    assert daily_stats(wallet)[0][4] == Decimal("14")
+
+
+@pytest.mark.django_db
+def test_wallet_ownership_is_checked_without_loading_the_user(
+    default_user: User, django_assert_num_queries
+):
+    wallet = Wallet.objects.only("id", "user_id").get(
+        pk=WalletFactory(user=default_user).pk
+    )
+    request = APIRequestFactory().patch("/")
+    request.user = type(default_user).objects.get(pk=default_user.pk)
+
+    with django_assert_num_queries(0):
+        assert IsWalletOwner().has_object_permission(request, None, wallet)
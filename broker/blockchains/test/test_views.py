@@ -1,12 +1,23 @@
+from asgiref.sync import async_to_sync, iscoroutinefunction
+import csv
+from datetime import datetime
 from decimal import Decimal
-from django.urls import reverse
+from io import StringIO
+import json
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from uuid import uuid4
 from rest_framework import status
 from rest_framework.test import APIClient
 import pytest
 
-from broker.conftest import User
+from broker.conftest import User, fake
+from broker.users.test.factories import UserFactory
 
-from ..models import TX, Wallet
+from ..models import TX, Wallet, uuid7_floor
 from .factories import TXFactory, WalletFactory
 
 
@@ -79,6 +90,67 @@ def test_get_request_returns_a_given_wallet(
     assert response.status_code == status.HTTP_200_OK
 
 
+@pytest.mark.django_db
+def test_sharded_wallet_shows_a_single_balance(
+    authorized_api_client: APIClient, default_user: User
+):
+    response = authorized_api_client.post(
+        reverse("wallet-list"),
+        {
+            "data": {
+                "type": "Wallet",
+                "attributes": {
+                    "label": "Hot wallet",
+                    "balance": "10.00",
+                    "user": default_user.pk,
+                    "status": "A",
+                    "slot_count": 4,
+                },
+            }
+        },
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    assert Decimal(response.json()["data"]["attributes"]["balance"]) == Decimal("10")
+
+    wallet = Wallet.objects.get(pk=response.data.get("id"))
+    assert wallet.slots.count() == 4
+
+    response = authorized_api_client.get(
+        reverse("wallet-detail", kwargs={"pk": wallet.pk})
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["data"]["attributes"]["slot_count"] == 4
+    assert Decimal(response.json()["data"]["attributes"]["balance"]) == Decimal("10")
+
+
+@pytest.mark.django_db
+def test_sharded_wallet_sent_back_as_read_keeps_its_balance(
+    authorized_api_client: APIClient, default_user: User
+):
+    wallet = WalletFactory(user=default_user, balance=Decimal("10.00"))
+    Wallet.objects.reshard(wallet, 4)
+    url = reverse("wallet-detail", kwargs={"pk": wallet.pk})
+    document = authorized_api_client.get(url).json()
+    # The attributes are sent back as read, with the balance the wallet shows.
+    document["data"] = {
+        key: document["data"][key] for key in ("type", "id", "attributes")
+    }
+
+    response = authorized_api_client.patch(url, document)
+    assert response.status_code == status.HTTP_200_OK
+    assert Decimal(response.json()["data"]["attributes"]["balance"]) == Decimal("10")
+    assert Wallet.objects.with_balance().get(pk=wallet.pk).total_balance == Decimal(
+        "10.00"
+    )
+
+    document["data"]["attributes"]["balance"] = "20.00"
+    response = authorized_api_client.patch(url, document)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert Wallet.objects.with_balance().get(pk=wallet.pk).total_balance == Decimal(
+        "10.00"
+    )
+
+
 @pytest.mark.django_db
 def test_put_request_updates_a_wallet(authorized_api_client: APIClient, wallet: Wallet):
     response = authorized_api_client.post(
@@ -370,10 +442,22 @@ def test_wallet_list_pagination(authorized_api_client: APIClient, default_user:
     response = authorized_api_client.get(reverse("wallet-list"))
     assert response.status_code == status.HTTP_200_OK
     assert len(response.json()["data"]) == 10
-    assert response.json()["meta"]["pagination"]["count"] == 25
+    assert response.json()["links"]["prev"] is None
+    # Keyset pagination doesn't count the collection
+    assert "meta" not in response.json()
 
-    # Test second page
-    response = authorized_api_client.get(reverse("wallet-list"), {"page[number]": 2})
+    # Test the following pages through their cursors
+    response = authorized_api_client.get(response.json()["links"]["next"])
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()["data"]) == 10
+
+    response = authorized_api_client.get(response.json()["links"]["next"])
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()["data"]) == 5
+    assert response.json()["links"]["next"] is None
+
+    # Test going back
+    response = authorized_api_client.get(response.json()["links"]["prev"])
     assert response.status_code == status.HTTP_200_OK
     assert len(response.json()["data"]) == 10
 
@@ -383,6 +467,24 @@ def test_wallet_list_pagination(authorized_api_client: APIClient, default_user:
     assert len(response.json()["data"]) == 5
 
 
+@pytest.mark.django_db
+def test_transaction_list_pagination_seeks_newest_first(
+    authorized_api_client: APIClient, default_user: User
+):
+    wallet = WalletFactory(user=default_user)
+    txs = [TXFactory(wallet=wallet) for _ in range(3)]
+    newest_first = sorted((str(tx.pk) for tx in txs), reverse=True)
+
+    response = authorized_api_client.get(reverse("tx-list"), {"page[size]": 2})
+    assert response.status_code == status.HTTP_200_OK
+    assert [tx["id"] for tx in response.json()["data"]] == newest_first[:2]
+
+    response = authorized_api_client.get(response.json()["links"]["next"])
+    assert response.status_code == status.HTTP_200_OK
+    assert [tx["id"] for tx in response.json()["data"]] == newest_first[2:]
+    assert response.json()["links"]["next"] is None
+
+
 @pytest.mark.django_db
 def test_wallet_list_sorting(authorized_api_client: APIClient, default_user: User):
     # Create wallets with different labels for sorting
@@ -403,3 +505,610 @@ def test_wallet_list_sorting(authorized_api_client: APIClient, default_user: Use
     assert response.json()["data"][0]["attributes"]["label"] == "Wallet C"
     assert response.json()["data"][1]["attributes"]["label"] == "Wallet B"
     assert response.json()["data"][2]["attributes"]["label"] == "Wallet A"
+
+
+@pytest.mark.django_db
+def test_bulk_create_transactions_applies_net_delta_per_wallet(
+    authorized_api_client: APIClient, default_user: User
+):
+    wallet_a = WalletFactory(user=default_user, balance=Decimal("10.00"))
+    wallet_b = WalletFactory(user=default_user, balance=Decimal("0.00"))
+
+    response = authorized_api_client.post(
+        reverse("tx-bulk-create"),
+        {
+            "data": [
+                {
+                    "type": "TX",
+                    "attributes": {
+                        "wallet": str(wallet_a.pk),
+                        "txid": fake.sha256(),
+                        "amount": "-7.5",
+                    },
+                },
+                {
+                    "type": "TX",
+                    "attributes": {
+                        "wallet": str(wallet_b.pk),
+                        "txid": fake.sha256(),
+                        "amount": "3.000000000000000001",
+                    },
+                },
+                {
+                    "type": "TX",
+                    "attributes": {
+                        "wallet": str(wallet_a.pk),
+                        "txid": fake.sha256(),
+                        "amount": "2.5",
+                    },
+                },
+            ]
+        },
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    assert len(response.json()["data"]) == 3
+    assert "meta" not in response.json()
+
+    assert Wallet.objects.get(pk=wallet_a.pk).balance == Decimal("5.00")
+    assert Wallet.objects.get(pk=wallet_b.pk).balance == Decimal("3.000000000000000001")
+    assert TX.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_bulk_create_transactions_rejects_whole_wallet_on_negative_balance(
+    authorized_api_client: APIClient, default_user: User
+):
+    wallet_a = WalletFactory(user=default_user, balance=Decimal("5.00"))
+    wallet_b = WalletFactory(user=default_user, balance=Decimal("5.00"))
+
+    response = authorized_api_client.post(
+        reverse("tx-bulk-create"),
+        {
+            "data": [
+                {
+                    "type": "TX",
+                    "attributes": {
+                        "wallet": str(wallet_a.pk),
+                        "txid": fake.sha256(),
+                        "amount": "1.00",
+                    },
+                },
+                {
+                    "type": "TX",
+                    "attributes": {
+                        "wallet": str(wallet_a.pk),
+                        "txid": fake.sha256(),
+                        "amount": "-10.00",
+                    },
+                },
+                {
+                    "type": "TX",
+                    "attributes": {
+                        "wallet": str(wallet_b.pk),
+                        "txid": fake.sha256(),
+                        "amount": "-5.00",
+                    },
+                },
+            ]
+        },
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    assert len(response.json()["data"]) == 1
+
+    pointers = [
+        error["source"]["pointer"] for error in response.json()["meta"]["errors"]
+    ]
+    assert pointers == ["/data/0", "/data/1/attributes/amount"]
+
+    assert Wallet.objects.get(pk=wallet_a.pk).balance == Decimal("5.00")
+    assert Wallet.objects.get(pk=wallet_b.pk).balance == Decimal("0.00")
+    assert not TX.objects.filter(wallet=wallet_a).exists()
+
+
+@pytest.mark.django_db
+def test_bulk_create_transactions_with_duplicate_txid_fails(
+    authorized_api_client: APIClient, default_user: User
+):
+    wallet = WalletFactory(user=default_user, balance=Decimal("5.00"))
+    existing = TXFactory(wallet=wallet)
+
+    response = authorized_api_client.post(
+        reverse("tx-bulk-create"),
+        {
+            "data": [
+                {
+                    "type": "TX",
+                    "attributes": {
+                        "wallet": str(wallet.pk),
+                        "txid": existing.txid,
+                        "amount": "1.00",
+                    },
+                },
+            ]
+        },
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert (
+        response.json()["errors"][0]["source"]["pointer"] == "/data/0/attributes/txid"
+    )
+    assert TX.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_wallet_reads_are_served_natively_under_asgi(default_user: User):
+    wallets = WalletFactory.create_batch(3, user=default_user)
+    client = AsyncClient()
+    headers = {"Authorization": f"Token {default_user.auth_token}"}
+
+    assert iscoroutinefunction(resolve(reverse("wallet-list")).func)
+
+    response = async_to_sync(client.get)(
+        reverse("wallet-list"), {"page[size]": 2}, headers=headers
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert [item["id"] for item in response.json()["data"]] == [
+        str(wallet.pk) for wallet in wallets[:2]
+    ]
+    assert response.json()["links"]["next"]
+
+    response = async_to_sync(client.get)(
+        reverse("wallet-detail", args=[wallets[2].pk]), headers=headers
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["data"]["id"] == str(wallets[2].pk)
+
+    response = async_to_sync(client.get)(
+        reverse("wallet-detail", args=[uuid4()]), headers=headers
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+def test_async_reads_reject_an_invalid_token(default_user: User):
+    client = AsyncClient()
+
+    response = async_to_sync(client.get)(
+        reverse("tx-list"), headers={"Authorization": "Token invalid"}
+    )
+    assert response.status_code in (
+        status.HTTP_401_UNAUTHORIZED,
+        status.HTTP_403_FORBIDDEN,
+    )
+    assert response.json()["errors"][0]["detail"] == "Invalid token."
+
+
+@pytest.mark.django_db
+def test_export_transactions_streams_ndjson_and_resumes_by_id(
+    authorized_api_client: APIClient, default_user: User, settings
+):
+    settings.TX_EXPORT_CHUNK_SIZE = 2
+    wallet = WalletFactory(user=default_user)
+    txs = sorted(
+        (TXFactory(wallet=wallet) for _ in range(5)), key=lambda tx: str(tx.pk)
+    )
+    TXFactory(wallet=WalletFactory(user=default_user))
+    url = reverse("wallet-export-transactions", args=[wallet.pk])
+
+    response = authorized_api_client.get(url, HTTP_ACCEPT="application/x-ndjson")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.streaming
+    rows = [
+        json.loads(line) for line in b"".join(response.streaming_content).splitlines()
+    ]
+    assert [row["id"] for row in rows] == [str(tx.pk) for tx in txs]
+    assert [Decimal(row["amount"]) for row in rows] == [tx.amount for tx in txs]
+
+    response = authorized_api_client.get(url, {"filter[id.gt]": rows[2]["id"]})
+    rows = [
+        json.loads(line) for line in b"".join(response.streaming_content).splitlines()
+    ]
+    assert [row["id"] for row in rows] == [str(tx.pk) for tx in txs[3:]]
+
+
+@pytest.mark.django_db
+def test_export_transactions_streams_csv(
+    authorized_api_client: APIClient, default_user: User
+):
+    wallet = WalletFactory(user=default_user)
+    txs = sorted(
+        (TXFactory(wallet=wallet) for _ in range(2)), key=lambda tx: str(tx.pk)
+    )
+    url = reverse("wallet-export-transactions", args=[wallet.pk])
+
+    response = authorized_api_client.get(
+        url, {"format": "csv", "filter[id.lte]": txs[0].pk}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response["Content-Type"] == "text/csv; charset=utf-8"
+    rows = list(csv.reader(b"".join(response.streaming_content).decode().splitlines()))
+    assert rows == [
+        ["id", "txid", "amount"],
+        [str(txs[0].pk), txs[0].txid, str(txs[0].amount)],
+    ]
+
+
+@pytest.mark.django_db
+def test_export_transactions_with_invalid_id_range_fails(
+    authorized_api_client: APIClient, default_user: User
+):
+    wallet = WalletFactory(user=default_user)
+    url = reverse("wallet-export-transactions", args=[wallet.pk])
+
+    response = authorized_api_client.get(url, {"filter[id.gt]": "last"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_export_transactions_streams_under_asgi(default_user: User):
+    wallet = WalletFactory(user=default_user)
+    tx = TXFactory(wallet=wallet)
+
+    async def export():
+        response = await AsyncClient().get(
+            reverse("wallet-export-transactions", args=[wallet.pk]),
+            headers={"Authorization": f"Token {default_user.auth_token}"},
+        )
+        return response, b"".join([chunk async for chunk in response.streaming_content])
+
+    response, content = async_to_sync(export)()
+    assert response.status_code == status.HTTP_200_OK
+    assert [json.loads(line)["id"] for line in content.splitlines()] == [str(tx.pk)]
+
+
+@pytest.mark.django_db
+def test_polling_an_unchanged_wallet_is_not_modified(
+    authorized_api_client: APIClient, default_user: User
+):
+    wallet = WalletFactory(user=default_user, balance=Decimal("5"))
+    url = reverse("wallet-detail", args=[wallet.pk])
+
+    response = authorized_api_client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    etag = response["ETag"]
+
+    with CaptureQueriesContext(connection) as context:
+        response = authorized_api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response["ETag"] == etag
+    assert not response.content
+    # Only the version lookup, the wallet itself isn't fetched.
+    wallet_queries = [
+        query["sql"]
+        for query in context.captured_queries
+        if query["sql"].startswith("SELECT")
+        and 'FROM "blockchains_wallet"' in query["sql"]
+    ]
+    assert len(wallet_queries) == 1
+    assert '"label"' not in wallet_queries[0]
+
+    TX.objects.create(wallet=wallet, txid=fake.sha256(), amount=Decimal("1"))
+
+    response = authorized_api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert response["ETag"] != etag
+    assert response.json()["data"]["attributes"]["balance"] == "6.000000000000000000"
+
+
+@pytest.mark.django_db
+def test_sharded_wallet_etag_changes_with_its_slots(
+    authorized_api_client: APIClient, default_user: User
+):
+    wallet = WalletFactory(user=default_user, balance=Decimal("9"))
+    Wallet.objects.reshard(wallet, 3)
+    url = reverse("wallet-detail", args=[wallet.pk])
+    etag = authorized_api_client.get(url)["ETag"]
+
+    TX.objects.create(wallet=wallet, txid=fake.sha256(), amount=Decimal("-1"))
+
+    response = authorized_api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert Wallet.objects.get(pk=wallet.pk).version == wallet.version
+
+
+@pytest.mark.django_db
+def test_polling_an_unchanged_wallet_page_is_not_modified(
+    authorized_api_client: APIClient, default_user: User
+):
+    wallets = WalletFactory.create_batch(3, user=default_user)
+    url = reverse("wallet-list")
+
+    etag = authorized_api_client.get(url, {"page[size]": 2})["ETag"]
+    response = authorized_api_client.get(
+        url, {"page[size]": 2}, HTTP_IF_NONE_MATCH=etag
+    )
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    wallets[0].label = "Renamed"
+    wallets[0].save()
+
+    response = authorized_api_client.get(
+        url, {"page[size]": 2}, HTTP_IF_NONE_MATCH=etag
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+def test_polling_an_unchanged_wallet_under_asgi_is_not_modified(default_user: User):
+    wallet = WalletFactory(user=default_user)
+    client = AsyncClient()
+    headers = {"Authorization": f"Token {default_user.auth_token}"}
+    url = reverse("wallet-detail", args=[wallet.pk])
+
+    response = async_to_sync(client.get)(url, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+
+    response = async_to_sync(client.get)(
+        url, headers={**headers, "If-None-Match": response["ETag"]}
+    )
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+@pytest.mark.django_db
+def test_patch_wallet_with_if_match_applies_only_to_the_version_read(
+    authorized_api_client: APIClient, default_user: User
+):
+    wallet = WalletFactory(user=default_user, balance=Decimal("5"))
+    url = reverse("wallet-detail", args=[wallet.pk])
+    etag = authorized_api_client.get(url)["ETag"]
+    payload = {
+        "data": {
+            "type": "Wallet",
+            "id": str(wallet.pk),
+            "attributes": {"label": "Savings"},
+        }
+    }
+
+    response = authorized_api_client.patch(url, payload, HTTP_IF_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert response["ETag"] != etag
+
+    response = authorized_api_client.patch(url, payload, HTTP_IF_MATCH=etag)
+    assert response.status_code == status.HTTP_412_PRECONDITION_FAILED
+    assert response.json()["errors"][0]["status"] == "412"
+
+
+@pytest.mark.django_db
+def test_create_transaction_with_write_behind_queues_it(
+    authorized_api_client: APIClient, default_user: User, settings
+):
+    settings.TX_WRITE_BEHIND = True
+    wallet = WalletFactory(user=default_user, balance=Decimal("1.00"))
+
+    response = authorized_api_client.post(
+        reverse("tx-list"),
+        {
+            "data": {
+                "type": "TX",
+                "attributes": {
+                    "wallet": str(wallet.pk),
+                    "txid": fake.sha256(),
+                    "amount": "-0.25",
+                },
+            }
+        },
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert response.json()["data"]["type"] == "QueuedTX"
+    assert response.json()["data"]["attributes"]["status"] == "Q"
+    assert not TX.objects.exists()
+    assert Wallet.objects.get(pk=wallet.pk).balance == Decimal("1.00")
+
+    call_command("apply_queued_transactions", stdout=StringIO())
+
+    response = authorized_api_client.get(response["Location"])
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["data"]["attributes"]["status"] == "A"
+    tx = TX.objects.get(pk=response.json()["data"]["relationships"]["tx"]["data"]["id"])
+    assert tx.amount == Decimal("-0.25")
+    assert Wallet.objects.get(pk=wallet.pk).balance == Decimal("0.75")
+
+
+@pytest.mark.django_db
+def test_list_wallet_transactions_returns_the_latest_of_the_wallet(
+    authorized_api_client: APIClient, default_user: User
+):
+    wallet = WalletFactory(user=default_user)
+    txs = TXFactory.create_batch(3, wallet=wallet)
+    TXFactory(wallet=WalletFactory(user=default_user))
+
+    response = authorized_api_client.get(
+        reverse("wallet-transactions-list", args=[wallet.pk]), {"page[size]": 2}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert [item["id"] for item in response.json()["data"]] == [
+        str(tx.pk) for tx in sorted(txs, key=lambda tx: str(tx.pk), reverse=True)[:2]
+    ]
+
+    response = authorized_api_client.get(
+        reverse("wallet-transactions-list", args=["not-a-uuid"])
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+def test_list_wallet_transactions_of_another_user_is_not_found(
+    authorized_api_client: APIClient, default_user: User
+):
+    wallet = WalletFactory(user=UserFactory())
+    TXFactory(wallet=wallet)
+
+    response = authorized_api_client.get(
+        reverse("wallet-transactions-list", args=[wallet.pk])
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+def test_list_transactions_filters_by_wallet_amount_and_id_ranges(
+    authorized_api_client: APIClient, default_user: User
+):
+    wallet = WalletFactory(user=default_user, balance=Decimal("100"))
+    small, large, latest = (
+        TX.objects.create(wallet=wallet, txid=fake.sha256(), amount=Decimal(amount))
+        for amount in ("1", "5", "7")
+    )
+    TXFactory(wallet=WalletFactory(user=default_user))
+
+    def filtered(**filters):
+        response = authorized_api_client.get(
+            reverse("tx-list"),
+            {
+                f"filter[{name.replace('__', '.')}]": value
+                for name, value in filters.items()
+            },
+        )
+        assert response.status_code == status.HTTP_200_OK
+        return {item["id"] for item in response.json()["data"]}
+
+    assert filtered(wallet=wallet.pk) == {str(small.pk), str(large.pk), str(latest.pk)}
+    assert filtered(wallet=wallet.pk, amount__gte="5") == {
+        str(large.pk),
+        str(latest.pk),
+    }
+    assert filtered(wallet=wallet.pk, id__gt=small.pk, id__lte=large.pk) == {
+        str(large.pk)
+    }
+
+    response = authorized_api_client.get(reverse("tx-list"), {"filter[wallet]": "x"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_list_wallet_transactions_seeks_the_wallet_index_without_sorting(
+    authorized_api_client: APIClient, default_user: User
+):
+    wallet = WalletFactory(user=default_user)
+    TXFactory.create_batch(3, wallet=wallet)
+
+    with CaptureQueriesContext(connection) as queries:
+        response = authorized_api_client.get(
+            reverse("wallet-transactions-list", args=[wallet.pk])
+        )
+    assert response.status_code == status.HTTP_200_OK
+    [sql] = [
+        query["sql"]
+        for query in queries.captured_queries
+        if query["sql"].startswith("SELECT") and 'FROM "blockchains_tx"' in query["sql"]
+    ]
+
+    with connection.cursor() as cursor:
+        # A handful of rows is cheaper to scan, plan as for a table of millions.
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        cursor.execute("SET LOCAL enable_bitmapscan = off")
+        cursor.execute(f"EXPLAIN {sql}")
+        plan = "\n".join(row[0] for row in cursor.fetchall())
+
+    # Each partition's copy of `blockchains_tx_wallet_id_idx`, merged in id order.
+    assert "Index Only Scan using blockchains_tx_initial_wallet_id_idx" in plan
+    assert "Sort  (" not in plan
+
+
+@pytest.mark.django_db
+def test_wallet_stats_sums_txs_up_by_bucket(
+    authorized_api_client: APIClient, default_user: User
+):
+    wallet = WalletFactory(user=default_user, balance=Decimal("10"))
+    for day, amount in (
+        ("2100-01-04", "5"),
+        ("2100-01-04", "-2"),
+        ("2100-02-01", "1"),
+        # Late, after a TX of a later day.
+        ("2100-01-05", "4"),
+    ):
+        floor = uuid7_floor(datetime.fromisoformat(f"{day}T00:00:00+00:00"))
+        TX.objects.create(
+            wallet=wallet,
+            id=f"{floor[:-12]}{uuid4().hex[:12]}",
+            txid=fake.sha256(),
+            amount=Decimal(amount),
+        )
+    url = reverse("wallet-stats", args=[wallet.pk])
+
+    def stats(**query):
+        response = authorized_api_client.get(url, query)
+        assert response.status_code == status.HTTP_200_OK
+        return [
+            (
+                item["attributes"]["start"],
+                item["attributes"]["inflow"],
+                item["attributes"]["outflow"],
+                item["attributes"]["tx_count"],
+                Decimal(item["attributes"]["closing_balance"]),
+            )
+            for item in response.json()["data"]
+        ]
+
+    assert stats() == [
+        ("2100-01-04", "5.000000000000000000", "2.000000000000000000", 2, 13),
+        ("2100-01-05", "4.000000000000000000", "0.000000000000000000", 1, 17),
+        ("2100-02-01", "1.000000000000000000", "0.000000000000000000", 1, 18),
+    ]
+    assert [row[0] for row in stats(bucket="week")] == ["2100-01-04", "2100-02-01"]
+    assert stats(bucket="month", **{"from": "2100-01-05"}) == [
+        ("2100-01-01", "4.000000000000000000", "0.000000000000000000", 1, 17),
+        ("2100-02-01", "1.000000000000000000", "0.000000000000000000", 1, 18),
+    ]
+
+    response = authorized_api_client.get(
+        url, {"from": "2100-02-01", "to": "2100-01-01"}
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_wallets_are_scoped_to_their_owner_unless_staff(
+    authorized_api_client: APIClient,
+    default_user: User,
+    django_capture_on_commit_callbacks,
+):
+    own = WalletFactory(user=default_user)
+    other = WalletFactory(user=UserFactory())
+
+    response = authorized_api_client.get(reverse("wallet-list"))
+    assert response.status_code == status.HTTP_200_OK
+    assert [item["id"] for item in response.json()["data"]] == [str(own.pk)]
+
+    for url in (
+        reverse("wallet-detail", args=[other.pk]),
+        reverse("wallet-stats", args=[other.pk]),
+    ):
+        response = authorized_api_client.get(url)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    default_user.is_staff = True
+    # Cached tokens are dropped once the user is committed.
+    with django_capture_on_commit_callbacks(execute=True):
+        default_user.save()
+    response = authorized_api_client.get(reverse("wallet-list"))
+    assert {item["id"] for item in response.json()["data"]} == {
+        str(own.pk),
+        str(other.pk),
+    }
+
+
+@pytest.mark.django_db
+def test_listing_own_wallets_seeks_the_user_index(
+    authorized_api_client: APIClient, default_user: User
+):
+    WalletFactory.create_batch(2, user=default_user)
+    WalletFactory.create_batch(3, user=UserFactory())
+
+    with CaptureQueriesContext(connection) as queries:
+        response = authorized_api_client.get(reverse("wallet-list"))
+    assert response.status_code == status.HTTP_200_OK
+    [sql] = [
+        query["sql"]
+        for query in queries.captured_queries
+        if query["sql"].startswith("SELECT")
+        and 'FROM "blockchains_wallet"' in query["sql"]
+    ]
+
+    with connection.cursor() as cursor:
+        # A handful of rows is cheaper to scan, plan as for a table of millions.
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        cursor.execute("SET LOCAL enable_bitmapscan = off")
+        cursor.execute(f"EXPLAIN {sql}")
+        plan = "\n".join(row[0] for row in cursor.fetchall())
+
+    assert "Index Scan using blockchains_wallet_user_id_idx" in plan
+    assert "Sort  (" not in plan
@@ -1,23 +1,110 @@
-from django.core.exceptions import ValidationError
-from rest_framework import permissions, mixins, viewsets
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.db import router
+from django.http import StreamingHttpResponse
+from django.utils.translation import gettext_lazy as _
+from rest_framework import permissions, mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
+from rest_framework.exceptions import (
+    NotFound,
+    ParseError,
+    ValidationError as APIValidationError,
+)
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.settings import api_settings
 from rest_framework_json_api import views, exceptions as exceptions_extensions
 from django.db.models import ProtectedError
 
-from broker.exceptions import UnprocessableEntity
+from broker.db import ContentionError
+from broker.exceptions import (
+    PreconditionFailed,
+    ServiceUnavailable,
+    UnprocessableEntity,
+)
+from broker.pagination import JsonApiCursorPagination
+from broker.views import (
+    AsyncReadMixin,
+    AtomicWritesMixin,
+    ConditionalRequestMixin,
+    ReplicaReadMixin,
+)
 
-from .models import Wallet, TX
-from .serializers import WalletSerializer, TXSerializer
+from .filters import TXFilterSet
+from .models import QueuedTX, StaleWalletError, Wallet, WalletDailyRollup, TX
+from .parsers import BulkJSONParser
+from .renderers import TXCSVRenderer, TXNDJSONRenderer
+from .serializers import (
+    QueuedTXSerializer,
+    TXBulkSerializer,
+    TXSerializer,
+    WalletSerializer,
+    WalletStatsQuerySerializer,
+    WalletStatsSerializer,
+)
 from .perimssions import IsWalletActive, IsWalletOwner
 
 
-class WalletViewSet(views.ModelViewSet):
+class WalletViewSet(
+    ReplicaReadMixin,
+    AtomicWritesMixin,
+    ConditionalRequestMixin,
+    AsyncReadMixin,
+    views.ModelViewSet,
+):
     """
     Handles Wallet-related operations.
+
+    Users only see their own wallets, staff users see all of them, see
+    `WalletQuerySet.owned_by`.
+
+    Responses carry the wallet's ETag, see `Wallet.etag`. Polling a wallet with
+    `If-None-Match` costs a version lookup until it changes, and updates sent with
+    `If-Match` only apply to the version that was read, without locking the row.
     """
 
-    queryset = Wallet.objects.all()
+    queryset = Wallet.objects.with_balance().with_version()
     serializer_class = WalletSerializer
+    pagination_class = JsonApiCursorPagination
+    ordering = ("id",)
     permission_classes = [permissions.IsAuthenticated, IsWalletOwner]
+    replica_actions = ReplicaReadMixin.replica_actions + (
+        "export_transactions",
+        "stats",
+    )
+
+    def get_queryset(self):
+        return super().get_queryset().owned_by(self.request.user)
+
+    def get_etag(self, instance):
+        return instance.etag
+
+    def get_etag_queryset(self):
+        return (
+            Wallet.objects.owned_by(self.request.user)
+            .with_version()
+            .only("version", "slot_count")
+        )
+
+    def perform_create(self, serializer):
+        try:
+            super().perform_create(serializer)
+        except ContentionError as e:
+            raise ServiceUnavailable(wait=settings.DATABASE_RETRY["RETRY_AFTER"]) from e
+
+    def perform_update(self, serializer):
+        try:
+            super().perform_update(serializer)
+        except StaleWalletError as e:
+            if self.request.headers.get("If-Match"):
+                raise PreconditionFailed() from e
+            raise exceptions_extensions.Conflict(e.args[0]) from e
+        except ContentionError as e:
+            raise ServiceUnavailable(wait=settings.DATABASE_RETRY["RETRY_AFTER"]) from e
 
     def perform_destroy(self, instance):
         try:
@@ -27,8 +114,109 @@ class WalletViewSet(views.ModelViewSet):
         except ValidationError as e:
             raise UnprocessableEntity(e.args[0]) from e
 
+    @action(
+        detail=True,
+        methods=["get"],
+        url_path="transactions/export",
+        renderer_classes=[TXNDJSONRenderer, TXCSVRenderer],
+    )
+    def export_transactions(self, request, *args, **kwargs):
+        """
+        Streams every TX of the wallet, oldest first, as NDJSON or CSV depending on
+        the `Accept` header or `?format=ndjson|csv`.
+
+        Rows come from a server-side cursor and are written out chunk by chunk, so
+        memory use doesn't grow with the number of TXs. `filter[id.gt]` and
+        `filter[id.lte]` restrict the TX id range, an interrupted download resumes
+        with `filter[id.gt]` set to the last id received.
+        """
+        wallet = self.get_wallet_stub()
+
+        renderer = request.accepted_renderer
+        # Streaming outlives the view, so bind the rows to the database chosen now.
+        rows = (
+            TX.objects.using(router.db_for_read(TX))
+            .filter(wallet_id=wallet.pk, **self._get_export_id_range(request))
+            .order_by("id")
+            .values_list(*renderer.columns)
+        )
+        chunk_size = settings.TX_EXPORT_CHUNK_SIZE
+        # Django serves async iterators under ASGI and sync ones under WSGI without
+        # buffering the whole response.
+        stream = (
+            renderer.astream
+            if isinstance(request._request, ASGIRequest)
+            else renderer.stream
+        )
+        content = stream(rows.iterator(chunk_size=chunk_size), chunk_size)
+
+        response = StreamingHttpResponse(
+            content, content_type=f"{renderer.media_type}; charset={renderer.charset}"
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="wallet-{wallet.pk}-transactions.{renderer.format}"'
+        )
+        return response
+
+    @action(detail=True, methods=["get"])
+    def stats(self, request, *args, **kwargs):
+        """
+        Sums the wallet's TXs up by `?bucket=day|week|month` between the days
+        `?from=` and `?to=`, both included and optional.
+
+        Stats are read from the wallet's daily rollups and their pending deltas, so
+        their cost grows with the number of days covered instead of the number of TXs.
+        """
+        wallet = self.get_wallet_stub()
+        query = WalletStatsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        self.resource_name = "WalletStats"
+        stats = WalletDailyRollup.objects.get_stats(
+            wallet.pk,
+            query.validated_data["bucket"],
+            query.validated_data.get("from"),
+            query.validated_data.get("to"),
+        )
+        serializer = WalletStatsSerializer(
+            stats, many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+    def get_wallet_stub(self):
+        """
+        Returns the wallet of a detail action with only the fields its permissions
+        need, for actions reading other tables than the wallet's.
+        """
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        wallet = get_object_or_404(
+            Wallet.objects.owned_by(self.request.user).only("id", "user_id", "status"),
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]},
+        )
+        self.check_object_permissions(self.request, wallet)
+        return wallet
+
+    @staticmethod
+    def _get_export_id_range(request):
+        id_range = {}
+        for param, lookup in (
+            ("filter[id.gt]", "id__gt"),
+            ("filter[id.lte]", "id__lte"),
+        ):
+            value = request.query_params.get(param)
+            if value is None:
+                continue
+            try:
+                # Ids are stored as canonical strings, which sort in UUID7 time order.
+                id_range[lookup] = str(uuid.UUID(value))
+            except ValueError as e:
+                raise APIValidationError({param: [_("Must be a valid UUID.")]}) from e
+        return id_range
+
 
 class TXViewSet(
+    ReplicaReadMixin,
+    AsyncReadMixin,
     views.AutoPrefetchMixin,
     views.PreloadIncludesMixin,
     views.RelatedMixin,
@@ -39,10 +227,52 @@ class TXViewSet(
 ):
     """
     Handles TX-related operations.
+
+    With `settings.TX_WRITE_BEHIND`, a created TX is only queued, see `create`.
+    Otherwise it's written in the transaction `TXManager.create` opens, which retries
+    on conflicts, and a bulk request in one such transaction per wallet, see
+    `bulk_create`.
+
+    Also lists the TXs of one wallet under `/api/v1/wallets/{wallet_pk}/transactions/`,
+    latest first, which seeks on the `(wallet, -id)` index instead of sorting.
     """
 
     queryset = TX.objects.all()
     serializer_class = TXSerializer
+    pagination_class = JsonApiCursorPagination
+    filterset_class = TXFilterSet
+    ordering = ("-id",)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if "wallet_pk" in self.kwargs:
+            queryset = queryset.filter(wallet_id=self.get_nested_wallet_id())
+        return queryset
+
+    def get_nested_wallet_id(self) -> str:
+        try:
+            return str(uuid.UUID(self.kwargs["wallet_pk"]))
+        except ValueError as e:
+            raise NotFound() from e
+
+    def get_nested_wallets(self):
+        """
+        Returns the user's wallets with the id `wallet_pk`, as `WalletViewSet` finds
+        them. Listing checks it isn't empty first, so another user's wallet is a 404.
+        """
+        return Wallet.objects.owned_by(self.request.user).filter(
+            pk=self.get_nested_wallet_id()
+        )
+
+    def list(self, request, *args, **kwargs):
+        if "wallet_pk" in self.kwargs and not self.get_nested_wallets().exists():
+            raise NotFound()
+        return super().list(request, *args, **kwargs)
+
+    async def alist(self, request, *args, **kwargs):
+        if "wallet_pk" in self.kwargs and not await self.get_nested_wallets().aexists():
+            raise NotFound()
+        return await super().alist(request, *args, **kwargs)
 
     def get_permissions(self):
         if self.action in ["create"]:
@@ -52,11 +282,165 @@ class TXViewSet(
             ]
         return [permission() for permission in self.permission_classes]
 
+    def create(self, request, *args, **kwargs):
+        """
+        Creates a TX, or with `settings.TX_WRITE_BEHIND` queues it and answers
+        `202 Accepted` with the `QueuedTX` to poll, whose URL is in `Location`.
+
+        Queued TXs are applied per wallet by `apply_queued_transactions`, which
+        takes the balance update off the request and batches the TXs of a burst.
+        """
+        if not settings.TX_WRITE_BEHIND:
+            return super().create(request, *args, **kwargs)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        queued = QueuedTX.objects.create(**serializer.validated_data)
+
+        self.resource_name = "QueuedTX"
+        data = QueuedTXSerializer(queued, context=self.get_serializer_context()).data
+        location = reverse("queuedtx-detail", args=[queued.pk], request=request)
+        return Response(
+            data, status=status.HTTP_202_ACCEPTED, headers={"Location": location}
+        )
+
     def perform_create(self, serializer):
         try:
             super().perform_create(serializer)
+        except Wallet.DoesNotExist as e:
+            raise APIValidationError({"wallet": [_("Wallet does not exist.")]}) from e
         except ValidationError as e:
             # Use case:
             # * When a wallet balance is attempted to decrease bellow 0
             # * When a wallet balance exceeds the max value
+            # * When the txid is already taken
             raise UnprocessableEntity(e.args[0]) from e
+        except ContentionError as e:
+            # The balance row stayed locked, or deadlocked, through every retry.
+            raise ServiceUnavailable(wait=settings.DATABASE_RETRY["RETRY_AFTER"]) from e
+
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="bulk",
+        parser_classes=[BulkJSONParser],
+    )
+    def bulk_create(self, request, *args, **kwargs):
+        """
+        Ingests a list of TXs in one request.
+
+        TXs are grouped by wallet and every wallet gets one conditional balance update,
+        see `TXManager.bulk_create_per_wallet`. The created TXs are returned as
+        primary data, rejected ones are reported in `meta.errors`.
+        """
+        if len(request.data) > settings.TX_BULK_MAX_SIZE:
+            raise ParseError(
+                f"A bulk document can contain at most {settings.TX_BULK_MAX_SIZE} TXs"
+            )
+
+        errors = {}
+        txs, positions = [], []
+        for position, item in enumerate(request.data):
+            serializer = TXBulkSerializer(
+                data=item, context=self.get_serializer_context()
+            )
+            if serializer.is_valid():
+                txs.append(TX(**serializer.validated_data))
+                positions.append(position)
+            else:
+                errors[position] = serializer.errors
+
+        # Wallets are resolved once per batch and checked the way `create` checks them.
+        wallets = Wallet.objects.only("status").in_bulk({tx.wallet_id for tx in txs})
+        is_wallet_active = IsWalletActive()
+        for position, tx in zip(positions, txs):
+            wallet = wallets.get(tx.wallet_id)
+            if wallet is None:
+                errors[position] = {"wallet": [_("Wallet does not exist.")]}
+            elif not is_wallet_active.has_object_permission(request, self, wallet):
+                errors[position] = {"wallet": [_("Wallet is not active.")]}
+
+        # Keep the batch all-or-nothing per wallet for the TXs rejected above.
+        rejected_wallets = {
+            tx.wallet_id for position, tx in zip(positions, txs) if position in errors
+        }
+        for position, tx in zip(positions, txs):
+            if tx.wallet_id in rejected_wallets and position not in errors:
+                errors[position] = [
+                    _("Rejected together with another TX of the same wallet.")
+                ]
+
+        accepted = [
+            (position, tx)
+            for position, tx in zip(positions, txs)
+            if tx.wallet_id not in rejected_wallets
+        ]
+        # Each wallet's group commits in a transaction of its own, so no wallet stays
+        # locked until the whole batch is written.
+        try:
+            tx_errors = TX.objects.bulk_create_per_wallet(
+                [tx for position, tx in accepted]
+            )
+        except ContentionError as e:
+            raise ServiceUnavailable(wait=settings.DATABASE_RETRY["RETRY_AFTER"]) from e
+        for index, error in tx_errors.items():
+            errors[accepted[index][0]] = (
+                error.message_dict if hasattr(error, "error_dict") else error.messages
+            )
+
+        error_objects = [
+            error_object
+            for position in sorted(errors)
+            for error_object in self._format_bulk_errors(position, errors[position])
+        ]
+        created = [
+            tx
+            for index, (position, tx) in enumerate(accepted)
+            if index not in tx_errors
+        ]
+        if not created and error_objects:
+            raise UnprocessableEntity(error_objects)
+
+        serializer = self.get_serializer(created, many=True)
+        data = {"results": serializer.data}
+        if error_objects:
+            data["meta"] = {"errors": error_objects}
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    @staticmethod
+    def _format_bulk_errors(position, errors):
+        """
+        Turns the errors of the TX at `position` into JSON:API error objects.
+        """
+        if not isinstance(errors, dict):
+            errors = {None: errors}
+
+        error_objects = []
+        for field, messages in errors.items():
+            # A TX has no balance attribute, a `BalanceError` is the amount's fault.
+            if field == "balance":
+                field = "amount"
+            pointer = f"/data/{position}"
+            if field not in (None, api_settings.NON_FIELD_ERRORS_KEY, NON_FIELD_ERRORS):
+                pointer = f"{pointer}/attributes/{field}"
+            for message in messages:
+                error_objects.append(
+                    {
+                        "detail": str(message),
+                        "status": str(status.HTTP_422_UNPROCESSABLE_ENTITY),
+                        "source": {"pointer": pointer},
+                    }
+                )
+        return error_objects
+
+
+class QueuedTXViewSet(
+    ReplicaReadMixin, AsyncReadMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet
+):
+    """
+    Reports whether a TX queued for write-behind ingestion was applied or rejected.
+    """
+
+    queryset = QueuedTX.objects.all()
+    serializer_class = QueuedTXSerializer
+    resource_name = "QueuedTX"
@@ -1,7 +1,7 @@
 import os
 from os.path import join
 from configurations import Configuration
-import psycopg2
+import psycopg
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -19,7 +19,6 @@ class Common(Configuration):
         "rest_framework_json_api",  # add json api compliance
         "rest_framework.authtoken",  # token authentication
         "django_filters",  # for filtering rest endpoints
-        "silk",  # for API troubleshooting
         # Your apps
         "broker.users",
         "broker.blockchains",
@@ -27,6 +26,8 @@ class Common(Configuration):
 
     # https://docs.djangoproject.com/en/2.0/topics/http/middleware/
     MIDDLEWARE = (
+        "broker.metrics.MetricsMiddleware",
+        "broker.profiling.SampledProfilingMiddleware",
         "django.middleware.security.SecurityMiddleware",
         "django.contrib.sessions.middleware.SessionMiddleware",
         "django.middleware.common.CommonMiddleware",
@@ -34,7 +35,6 @@ class Common(Configuration):
         "django.contrib.auth.middleware.AuthenticationMiddleware",
         "django.contrib.messages.middleware.MessageMiddleware",
         "django.middleware.clickjacking.XFrameOptionsMiddleware",
-        "silk.middleware.SilkyMiddleware",
     )
 
     ALLOWED_HOSTS = ["*"]
@@ -48,6 +48,14 @@ class Common(Configuration):
     ADMINS = (("Author", "mxyakovenko9@gmail.com"),)
 
     # Postgres
+    # Connections come from a psycopg pool per process, so uvicorn's thread pool shares
+    # a bounded set of them instead of keeping one persistent connection per thread.
+    # https://docs.djangoproject.com/en/5.1/ref/databases/#connection-pool
+    DATABASE_POOL = os.getenv("DJANGO_POSTGRES_POOL", "yes").lower() in (
+        "true",
+        "1",
+        "yes",
+    )
     DATABASES = {
         "default": {
             "ENGINE": "django.db.backends.postgresql",
@@ -56,13 +64,67 @@ class Common(Configuration):
             "PASSWORD": os.environ["DJANGO_POSTGRES_PASSWORD"],
             "HOST": os.environ["DJANGO_POSTGRES_HOST"],
             "PORT": int(os.getenv("DJANGO_POSTGRES_PORT", 5432)),
-            "CONN_MAX_AGE": int(os.getenv("DJANGO_POSTGRES_CONN_MAX_AGE", 600)),
-            "ATOMIC_REQUESTS": True,
+            # Persistent connections and pooling are mutually exclusive
+            "CONN_MAX_AGE": 0
+            if DATABASE_POOL
+            else int(os.getenv("DJANGO_POSTGRES_CONN_MAX_AGE", 600)),
+            # Reads run in autocommit, write actions open their own transactions,
+            # see `broker.views.AtomicWritesMixin`
+            "ATOMIC_REQUESTS": False,
             "OPTIONS": {
-                "isolation_level": psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED,
+                "isolation_level": psycopg.IsolationLevel.READ_COMMITTED,
+                "pool": {
+                    "min_size": int(os.getenv("DJANGO_POSTGRES_POOL_MIN_SIZE", 2)),
+                    "max_size": int(os.getenv("DJANGO_POSTGRES_POOL_MAX_SIZE", 10)),
+                    # Seconds a request waits for a free connection before failing
+                    "timeout": float(os.getenv("DJANGO_POSTGRES_POOL_TIMEOUT", 10)),
+                    "max_idle": float(os.getenv("DJANGO_POSTGRES_POOL_MAX_IDLE", 600)),
+                }
+                if DATABASE_POOL
+                else False,
             },
         }
     }
+    # A streaming replica of the primary, list and retrieve requests read from it.
+    # Locally it can point at the primary itself, tests then run it as a mirror.
+    if os.getenv("DJANGO_POSTGRES_REPLICA_HOST"):
+        DATABASES["replica"] = {
+            **DATABASES["default"],
+            "HOST": os.environ["DJANGO_POSTGRES_REPLICA_HOST"],
+            "PORT": int(
+                os.getenv("DJANGO_POSTGRES_REPLICA_PORT", DATABASES["default"]["PORT"])
+            ),
+            "TEST": {"MIRROR": "default"},
+        }
+    DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+    DATABASE_ROUTERS = ["broker.routers.PrimaryReplicaRouter"]
+    # Seconds a client keeps reading from the primary after a write, so it sees it
+    REPLICA_STICKY_SECONDS = int(os.getenv("DJANGO_REPLICA_STICKY_SECONDS", 5))
+    # Balance writes give up waiting for a row lock after LOCK_TIMEOUT and on a
+    # statement after STATEMENT_TIMEOUT milliseconds. Deadlocks, serialization
+    # failures and lock timeouts are retried up to RETRIES times, after a jittered
+    # backoff doubling from BACKOFF up to MAX_BACKOFF seconds. Then the request is
+    # answered 503 with a Retry-After of RETRY_AFTER seconds.
+    DATABASE_RETRY = {
+        "LOCK_TIMEOUT": int(os.getenv("DJANGO_DATABASE_LOCK_TIMEOUT", 500)),
+        "STATEMENT_TIMEOUT": int(os.getenv("DJANGO_DATABASE_STATEMENT_TIMEOUT", 5000)),
+        "RETRIES": int(os.getenv("DJANGO_DATABASE_RETRIES", 3)),
+        "BACKOFF": float(os.getenv("DJANGO_DATABASE_RETRY_BACKOFF", 0.02)),
+        "MAX_BACKOFF": float(os.getenv("DJANGO_DATABASE_RETRY_MAX_BACKOFF", 0.5)),
+        "RETRY_AFTER": int(os.getenv("DJANGO_DATABASE_RETRY_AFTER", 1)),
+    }
+
+    # Caches
+    # Without Redis every process has its own cache, which also keeps replica pins and
+    # cached tokens per process.
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["DJANGO_REDIS_URL"],
+        }
+        if os.getenv("DJANGO_REDIS_URL")
+        else {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
 
     # General
     APPEND_SLASH = False
@@ -189,28 +251,80 @@ class Common(Configuration):
                 "propagate": False,
             },
             "django.db.backends": {"handlers": ["console"], "level": "INFO"},
+            "broker.profiling": {
+                "handlers": ["console"],
+                "level": "INFO",
+                "propagate": False,
+            },
         },
     }
 
     # Custom user app
     AUTH_USER_MODEL = "users.User"
 
+    # In-process cache of authenticated tokens, backed by a shared cache when Redis is
+    # configured. Deactivations reach other processes' in-process entries after TIMEOUT.
+    TOKEN_AUTH_CACHE = {
+        "MAX_SIZE": int(os.getenv("DJANGO_TOKEN_CACHE_MAX_SIZE", 10000)),
+        "TIMEOUT": int(os.getenv("DJANGO_TOKEN_CACHE_TIMEOUT", 30)),
+        "CACHE_ALIAS": "default" if os.getenv("DJANGO_REDIS_URL") else None,
+    }
+
+    # Counts of paginated collections, see `broker.pagination.count_queryset`. Counts
+    # the planner estimates at ESTIMATE_THRESHOLD rows or more aren't run, exact
+    # counts of filtered collections are cached for CACHE_TIMEOUT seconds.
+    PAGINATION_COUNT = {
+        "ESTIMATE_THRESHOLD": int(
+            os.getenv("DJANGO_PAGINATION_COUNT_ESTIMATE_THRESHOLD", 10000)
+        ),
+        "CACHE_TIMEOUT": int(os.getenv("DJANGO_PAGINATION_COUNT_CACHE_TIMEOUT", 60)),
+        "CACHE_ALIAS": "default",
+    }
+
+    # Prometheus metrics at /metrics, see `broker.metrics`. Scrapes send TOKEN as a
+    # bearer token when it's set. Requests over QUERY_BUDGET queries are counted.
+    METRICS = {
+        "TOKEN": os.getenv("DJANGO_METRICS_TOKEN") or None,
+        "QUERY_BUDGET": int(os.getenv("DJANGO_METRICS_QUERY_BUDGET", 20)),
+    }
+
+    # Request profiles, see `broker.profiling.SampledProfilingMiddleware`. Requests are
+    # sampled at SAMPLE_RATE, or opted in by path prefix, token key or HEADER. HEADER
+    # is off by default and only opts in when it carries SECRET or one of TOKENS.
+    PROFILING = {
+        "SAMPLE_RATE": float(os.getenv("DJANGO_PROFILING_SAMPLE_RATE", 0)),
+        "PATHS": [p for p in os.getenv("DJANGO_PROFILING_PATHS", "").split(",") if p],
+        "TOKENS": [t for t in os.getenv("DJANGO_PROFILING_TOKENS", "").split(",") if t],
+        "HEADER": os.getenv("DJANGO_PROFILING_HEADER") or None,
+        "SECRET": os.getenv("DJANGO_PROFILING_SECRET") or None,
+        "MAX_QUERIES": int(os.getenv("DJANGO_PROFILING_MAX_QUERIES", 10)),
+        "BUFFER_SIZE": int(os.getenv("DJANGO_PROFILING_BUFFER_SIZE", 1000)),
+        "FLUSH_INTERVAL": float(os.getenv("DJANGO_PROFILING_FLUSH_INTERVAL", 5)),
+    }
+
+    # Upper bound for the number of TXs in one bulk ingestion document
+    TX_BULK_MAX_SIZE = int(os.getenv("DJANGO_TX_BULK_MAX_SIZE", 10000))
+
+    # Queue TXs posted to `/api/v1/transactions/` instead of applying them right away,
+    # `apply_queued_transactions` workers drain the queue
+    TX_WRITE_BEHIND = os.getenv("DJANGO_TX_WRITE_BEHIND", "no").lower() in (
+        "true",
+        "1",
+        "yes",
+    )
+
+    # Rows fetched per round trip of the server-side cursor of TX exports
+    TX_EXPORT_CHUNK_SIZE = int(os.getenv("DJANGO_TX_EXPORT_CHUNK_SIZE", 2000))
+
     # Django Rest Framework
     REST_FRAMEWORK = {
-        "DEFAULT_PAGINATION_CLASS": "rest_framework_json_api.pagination.JsonApiPageNumberPagination",
+        "DEFAULT_PAGINATION_CLASS": "broker.pagination.JsonApiEstimatedCountPagination",
         "PAGE_SIZE": int(os.getenv("DJANGO_PAGINATION_LIMIT", 10)),
         "EXCEPTION_HANDLER": "rest_framework_json_api.exceptions.exception_handler",
         "DATETIME_FORMAT": "%Y-%m-%dT%H:%M:%S%z",
-        "DEFAULT_PARSER_CLASSES": ("rest_framework_json_api.parsers.JSONParser",),
-        "DEFAULT_RENDERER_CLASSES": (
-            "rest_framework_json_api.renderers.JSONRenderer",
-            # If you're performance testing, you will want to use the browseable API
-            # without forms, as the forms can generate their own queries.
-            # If performance testing, enable:
-            # 'example.utils.BrowsableAPIRendererWithoutForms',
-            # Otherwise, to play around with the browseable API, enable:
-            "rest_framework_json_api.renderers.BrowsableAPIRenderer",
-        ),
+        "DEFAULT_PARSER_CLASSES": ("broker.parsers.JSONParser",),
+        # The browsable API is only negotiated in Development.
+        "DEFAULT_RENDERER_CLASSES": ("broker.renderers.JSONRenderer",),
         "DEFAULT_FILTER_BACKENDS": (
             "rest_framework_json_api.filters.QueryParameterValidationFilter",
             "rest_framework_json_api.filters.OrderingFilter",
@@ -223,8 +337,8 @@ class Common(Configuration):
             "rest_framework.permissions.IsAuthenticated",
         ],
         "DEFAULT_AUTHENTICATION_CLASSES": (
-            "rest_framework.authentication.SessionAuthentication",
-            "rest_framework.authentication.TokenAuthentication",
+            "broker.authentication.SessionAuthentication",
+            "broker.authentication.CachedTokenAuthentication",
         ),
         "TEST_REQUEST_RENDERER_CLASSES": (
             "rest_framework_json_api.renderers.JSONRenderer",
@@ -8,7 +8,21 @@ class Development(Common):
     DEBUG = True
 
     # Testing
-    INSTALLED_APPS = Common.INSTALLED_APPS
+    INSTALLED_APPS = Common.INSTALLED_APPS + ("silk",)  # for API troubleshooting
+    MIDDLEWARE = Common.MIDDLEWARE + ("silk.middleware.SilkyMiddleware",)
+
+    REST_FRAMEWORK = {
+        **Common.REST_FRAMEWORK,
+        "DEFAULT_RENDERER_CLASSES": Common.REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"]
+        + (
+            # If you're performance testing, you will want to use the browseable API
+            # without forms, as the forms can generate their own queries.
+            # If performance testing, enable:
+            # 'example.utils.BrowsableAPIRendererWithoutForms',
+            # Otherwise, to play around with the browseable API, enable:
+            "rest_framework_json_api.renderers.BrowsableAPIRenderer",
+        ),
+    }
 
     # Mail
     EMAIL_HOST = "localhost"
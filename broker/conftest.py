@@ -25,6 +25,13 @@ def enable_db_access_for_all_tests(db):
     pass
 
 
+@pytest.fixture(autouse=True)
+def read_from_primary(settings):
+    # The replica connection can't see the data of a test transaction, tests that read
+    # from the replica opt back in through `settings.DATABASE_REPLICAS`.
+    settings.DATABASE_REPLICAS = []
+
+
 @pytest.fixture()
 def default_user(db) -> User:
     return UserFactory()
@@ -0,0 +1,148 @@
+import random
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+
+from .metrics import db_given_up, db_retries
+
+# SQLSTATEs of conflicts with concurrent transactions, which running again resolves
+RETRYABLE_ERRORS = {
+    "40P01": "deadlock",
+    "40001": "serialization_failure",
+    "55P03": "lock_timeout",
+}
+# The SQLSTATE of a statement cancelled by `statement_timeout`. It isn't retried, a
+# statement that slow would most likely time out again.
+QUERY_CANCELED = "57014"
+
+
+class ContentionError(Exception):
+    """
+    Raised by `atomic_with_retries` when an operation still conflicted with
+    concurrent ones after its last retry, or ran into the statement timeout.
+    """
+
+    def __init__(self, operation: str, reason: str):
+        super().__init__(f"Gave up on {operation} after a {reason}.")
+        self.operation = operation
+        self.reason = reason
+
+
+def get_pool_stats():
+    """
+    Returns the connection pool counters of every database alias that uses a pool.
+
+    .. code:: json
+
+        {"default": {"size": 4, "available": 1, "checked_out": 3, "waiting": 0, ...}}
+
+    `timeouts` counts the requests that failed to get a connection, mostly because
+    none freed up within the pool `timeout`.
+    """
+    stats = {}
+    for alias in connections:
+        pool = getattr(connections[alias], "pool", None)
+        if pool is None:
+            continue
+
+        pool_stats = pool.get_stats()
+        size = pool_stats.get("pool_size", 0)
+        available = pool_stats.get("pool_available", 0)
+        stats[alias] = {
+            "min_size": pool_stats.get("pool_min", pool.min_size),
+            "max_size": pool_stats.get("pool_max", pool.max_size),
+            "size": size,
+            "available": available,
+            "checked_out": size - available,
+            "waiting": pool_stats.get("requests_waiting", 0),
+            "requests": pool_stats.get("requests_num", 0),
+            "wait_ms": pool_stats.get("requests_wait_ms", 0),
+            "timeouts": pool_stats.get("requests_errors", 0),
+        }
+    return stats
+
+
+def get_backoff(attempt: int) -> float:
+    """
+    Returns the seconds to sleep before retry number `attempt`: exponential up to
+    `DATABASE_RETRY["MAX_BACKOFF"]`, with full jitter so the transactions that
+    conflicted don't retry in lockstep.
+    """
+    config = settings.DATABASE_RETRY
+    ceiling = min(config["MAX_BACKOFF"], config["BACKOFF"] * 2 ** (attempt - 1))
+    return random.uniform(0, ceiling)
+
+
+def atomic_with_retries(
+    operation: str,
+    function,
+    using=None,
+    lock_timeout: int | None = None,
+    statement_timeout: int | None = None,
+):
+    """
+    Calls `function` in a transaction, or in a savepoint within one, and returns
+    what it returns.
+
+    Locks are waited for at most `lock_timeout` and statements run at most
+    `statement_timeout` milliseconds, `DATABASE_RETRY` has the defaults. When it
+    fails on a deadlock, a serialization failure or the lock timeout, it's rolled
+    back and called again after a backoff, at most `DATABASE_RETRY["RETRIES"]`
+    times. Then, or on the statement timeout, `ContentionError` is raised. Both are
+    counted in the metrics by `operation`.
+
+    In a savepoint, a retry keeps the locks taken before it and may run into the
+    same conflict again, it's most effective as the outermost transaction.
+    """
+    config = settings.DATABASE_RETRY
+    using = using or DEFAULT_DB_ALIAS
+    connection = connections[using]
+    # 0 turns a timeout off, only `None` falls back to the default.
+    if lock_timeout is None:
+        lock_timeout = config["LOCK_TIMEOUT"]
+    if statement_timeout is None:
+        statement_timeout = config["STATEMENT_TIMEOUT"]
+    timeouts = [f"{lock_timeout}ms", f"{statement_timeout}ms"]
+    attempt = 0
+    while True:
+        nested = connection.in_atomic_block
+        try:
+            with transaction.atomic(using=using):
+                # `SET LOCAL` lasts until the end of the transaction, or the rollback
+                # of the savepoint, so the previous values are restored on success.
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "WITH previous AS MATERIALIZED (SELECT "
+                        "current_setting('lock_timeout') AS lock_timeout, "
+                        "current_setting('statement_timeout') AS statement_timeout) "
+                        "SELECT lock_timeout, statement_timeout, "
+                        "set_config('lock_timeout', %s, true), "
+                        "set_config('statement_timeout', %s, true) FROM previous",
+                        timeouts,
+                    )
+                    previous = cursor.fetchone()[:2]
+                result = function()
+                if nested:
+                    with connection.cursor() as cursor:
+                        cursor.execute(
+                            "SELECT set_config('lock_timeout', %s, true), "
+                            "set_config('statement_timeout', %s, true)",
+                            previous,
+                        )
+                return result
+        except OperationalError as e:
+            sqlstate = getattr(e.__cause__, "sqlstate", None)
+            if sqlstate == QUERY_CANCELED:
+                db_given_up.labels(operation, "statement_timeout").inc()
+                raise ContentionError(operation, "statement timeout") from e
+            reason = RETRYABLE_ERRORS.get(sqlstate)
+            if reason is None:
+                raise
+            # A savepoint that failed to roll back leaves nothing to retry in.
+            if attempt >= config["RETRIES"] or connection.needs_rollback:
+                db_given_up.labels(operation, reason).inc()
+                raise ContentionError(operation, reason.replace("_", " ")) from e
+            attempt += 1
+            db_retries.labels(operation, reason).inc()
+            time.sleep(get_backoff(attempt))
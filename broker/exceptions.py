@@ -7,3 +7,23 @@ class UnprocessableEntity(APIException):
     status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
     default_detail = _("Content is not processable")
     default_code = "unprocessable_entity"
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = _("The resource changed since it was read")
+    default_code = "precondition_failed"
+
+
+class ServiceUnavailable(APIException):
+    """
+    `wait` is sent as the seconds of the `Retry-After` header.
+    """
+
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _("The service is busy, try again later")
+    default_code = "service_unavailable"
+
+    def __init__(self, detail=None, code=None, wait=None):
+        super().__init__(detail, code)
+        self.wait = wait
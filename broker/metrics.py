@@ -0,0 +1,215 @@
+"""
+Prometheus metrics of the requests served and of the database writes, exposed by
+`MetricsView` at `/metrics`.
+
+With several worker processes, set `PROMETHEUS_MULTIPROC_DIR` to an empty directory
+shared by them before they start. Every process then writes its samples there and
+`/metrics` serves the sum over all of them, whichever process answers the scrape.
+"""
+
+import os
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db import connections
+from django.http import HttpResponse
+from django.views import View
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+REQUEST_LABELS = ("view", "action", "method")
+
+request_duration = Histogram(
+    "broker_request_duration_seconds",
+    "Duration of requests, by view and action.",
+    REQUEST_LABELS,
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+requests = Counter(
+    "broker_requests",
+    "Requests, by view, action and response status code.",
+    REQUEST_LABELS + ("status",),
+)
+request_queries = Histogram(
+    "broker_request_queries",
+    "SQL queries run per request, on every database.",
+    REQUEST_LABELS,
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+request_query_duration = Histogram(
+    "broker_request_query_duration_seconds",
+    "Time per request spent running SQL queries.",
+    REQUEST_LABELS,
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+query_budget_exceeded = Counter(
+    "broker_request_query_budget_exceeded",
+    "Requests that ran more SQL queries than the budget of their view.",
+    REQUEST_LABELS,
+)
+balance_lock_wait = Histogram(
+    "broker_balance_lock_wait_seconds",
+    "Time `TXManager.create` spends updating the balance of a wallet, or of a slot "
+    "of a sharded one, most of it waiting for the row lock under contention.",
+    ["row"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+db_retries = Counter(
+    "broker_db_retries",
+    "Retries of database operations, by the conflict that failed the last attempt.",
+    ["operation", "reason"],
+)
+db_given_up = Counter(
+    "broker_db_given_up",
+    "Database operations given up on after their last retry, or on the statement "
+    "timeout.",
+    ["operation", "reason"],
+)
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+# Set for the duration of a request. Contexts are copied into the threads
+# `sync_to_async` runs the ORM in, with the same `QueryStats` object.
+query_stats: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+def count_query(execute, sql, params, many, context):
+    stats = query_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.count += 1
+        stats.duration += time.perf_counter() - start
+
+
+def install_query_counter(connection, **kwargs):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+connection_created.connect(install_query_counter)
+
+
+def get_labels(request) -> dict:
+    """
+    Labels a request with the viewset, or URL name, and action that served it.
+    """
+    match = request.resolver_match
+    method = request.method.lower()
+    if match is None:
+        return {"view": "unresolved", "action": method, "method": method}
+    view_class = getattr(match.func, "cls", None)
+    actions = getattr(match.func, "actions", None) or {}
+    return {
+        "view": view_class.__name__ if view_class else match.view_name,
+        "action": actions.get(method, method),
+        "method": method,
+    }
+
+
+class MetricsMiddleware:
+    """
+    Records the duration, status, and SQL queries of every request. Put it first,
+    so the time of the other middleware counts too.
+
+    A view's `query_budget`, or else `METRICS["QUERY_BUDGET"]`, is the number of
+    queries its requests should stay within. Requests over it are counted in
+    `broker_request_query_budget_exceeded_total`.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        # Connections opened before this module was imported didn't signal.
+        for connection in connections.all(initialized_only=True):
+            install_query_counter(connection)
+        stats = QueryStats()
+        token = query_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            query_stats.reset(token)
+        self.record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        stats = QueryStats()
+        token = query_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            query_stats.reset(token)
+        self.record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    @staticmethod
+    def record(request, response, stats, duration):
+        labels = get_labels(request)
+        request_duration.labels(**labels).observe(duration)
+        requests.labels(**labels, status=str(response.status_code)).inc()
+        request_queries.labels(**labels).observe(stats.count)
+        request_query_duration.labels(**labels).observe(stats.duration)
+
+        match = request.resolver_match
+        budget = getattr(
+            getattr(match.func, "cls", None) if match else None,
+            "query_budget",
+            None,
+        )
+        if budget is None:
+            budget = settings.METRICS["QUERY_BUDGET"]
+        if stats.count > budget:
+            query_budget_exceeded.labels(**labels).inc()
+
+
+def get_registry():
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+class MetricsView(View):
+    """
+    Serves the metrics in the Prometheus text format, summed over all worker
+    processes in multiprocess mode. With `METRICS["TOKEN"]` set, scrapes must send
+    it as a bearer token.
+    """
+
+    def get(self, request, *args, **kwargs):
+        token = settings.METRICS["TOKEN"]
+        if token and request.headers.get("Authorization") != f"Bearer {token}":
+            return HttpResponse(status=401, headers={"WWW-Authenticate": "Bearer"})
+        return HttpResponse(
+            generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST
+        )
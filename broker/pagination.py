@@ -0,0 +1,332 @@
+import hashlib
+import json
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param
+from rest_framework_json_api.pagination import JsonApiPageNumberPagination
+
+
+def is_unfiltered(queryset) -> bool:
+    """
+    Whether `queryset` has as many rows as the table of its model.
+    """
+    query = queryset.query
+    return not (
+        query.where
+        or query.distinct
+        or query.combinator
+        or query.group_by
+        or query.is_sliced
+        or query.extra
+    )
+
+
+def estimate_count(queryset) -> int | None:
+    """
+    Returns the planner's estimate of the rows of `queryset`, without reading them.
+
+    An unfiltered queryset is estimated from the `reltuples` statistics of its table,
+    summed over its partitions, anything else from the rows its `EXPLAIN` expects.
+    Returns `None` when the table was never analyzed.
+    """
+    connection = connections[queryset.db]
+    with connection.cursor() as cursor:
+        if is_unfiltered(queryset):
+            cursor.execute(
+                """
+                SELECT sum(c.reltuples)
+                FROM pg_partition_tree(%s::regclass) t
+                JOIN pg_class c ON c.oid = t.relid
+                WHERE t.isleaf AND c.reltuples >= 0
+                """,
+                [queryset.model._meta.db_table],
+            )
+            (rows,) = cursor.fetchone()
+            if rows is not None:
+                return round(rows)
+
+        sql, params = queryset.query.sql_with_params()
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        (plan,) = cursor.fetchone()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]["Plan Rows"]
+
+
+def get_count_cache_key(queryset) -> str:
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.sha256(f"{queryset.db}:{sql}:{params!r}".encode()).hexdigest()
+    return f"broker.pagination.count:{digest}"
+
+
+def count_queryset(queryset, exact: bool = False) -> tuple[int, bool]:
+    """
+    Returns the number of rows of `queryset`, and whether it's approximate.
+
+    Collections the planner estimates at `PAGINATION_COUNT["ESTIMATE_THRESHOLD"]`
+    rows or more get that estimate instead of a `COUNT(*)` reading all of them.
+    Filtered collections, whose estimates are the least reliable, first look up an
+    exact count cached for `PAGINATION_COUNT["CACHE_TIMEOUT"]` seconds, which may
+    be as stale. Only `exact` counts are never approximate.
+    """
+    options = settings.PAGINATION_COUNT
+    cache = caches[options["CACHE_ALIAS"]]
+    queryset = queryset.order_by()
+    key = get_count_cache_key(queryset)
+
+    if not exact:
+        if not is_unfiltered(queryset):
+            count = cache.get(key)
+            if count is not None:
+                return count, True
+        estimate = estimate_count(queryset)
+        if estimate is not None and estimate >= options["ESTIMATE_THRESHOLD"]:
+            return estimate, True
+
+    count = queryset.count()
+    cache.set(key, count, options["CACHE_TIMEOUT"])
+    return count, False
+
+
+class ApproximatePage(Page):
+    """
+    A page of an `EstimatedCountPaginator` with an approximate count, which tells
+    whether a following page exists from the rows it fetched instead.
+    """
+
+    def __init__(self, object_list, number, paginator, has_next_page):
+        super().__init__(object_list, number, paginator)
+        self.has_next_page = has_next_page
+
+    def has_next(self):
+        return self.has_next_page
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A paginator counting its collection with `count_queryset`.
+
+    Pages past an underestimated count can still be reached, and ones past an
+    overestimated count are empty, see `ApproximatePage`.
+    """
+
+    def __init__(self, object_list, per_page, exact=False, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.exact = exact
+        self.approximate = False
+
+    @cached_property
+    def count(self):
+        count, self.approximate = count_queryset(self.object_list, self.exact)
+        return count
+
+    def validate_number(self, number):
+        if not (self.count and self.approximate):
+            return super().validate_number(number)
+        # Pages past an approximate count are fetched all the same, see `page`.
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.error_messages["invalid_page"])
+        if number < 1:
+            raise EmptyPage(self.error_messages["min_page"])
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.approximate:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        # One row more than the page tells whether there is a following one.
+        rows = list(self.object_list[bottom : bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage(self.error_messages["no_results"])
+        return ApproximatePage(
+            rows[: self.per_page], number, self, len(rows) > self.per_page
+        )
+
+
+class JsonApiEstimatedCountPagination(JsonApiPageNumberPagination):
+    """
+    A JSON:API compatible page number pagination, which estimates the count of
+    large collections instead of reading all of their rows. For example:
+
+    .. code::
+
+        http://api.example.org/users/?page[number]=2&page[size]=100
+        http://api.example.org/users/?page[number]=2&page[count]=exact
+
+    `meta.pagination.approximate` tells whether `count`, and `pages` and the `last`
+    link with it, are estimated. `page[count]=exact` always counts the rows.
+    """
+
+    count_query_param = "page[count]"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        exact = request.query_params.get(self.count_query_param) == "exact"
+        self.django_paginator_class = partial(EstimatedCountPaginator, exact=exact)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data["meta"]["pagination"]["approximate"] = (
+            self.page.paginator.approximate
+        )
+        return response
+
+
+class JsonApiCursorPagination(CursorPagination):
+    """
+    A JSON:API compatible keyset pagination. For example:
+
+    .. code::
+
+        http://api.example.org/transactions/?page[size]=100
+        http://api.example.org/transactions/?page[cursor]=cD0wMTk4...&page[size]=100
+
+    Pages seek on the ordering field, the time-ordered UUID7 primary key by default,
+    instead of counting and skipping rows, so a deep page costs the same as the first.
+    `apaginate_queryset` fetches the same page with the async ORM.
+
+    The collection is only counted on request, `page[count]=estimate` or
+    `page[count]=exact`, into `meta.pagination` like `count_queryset` does.
+    """
+
+    cursor_query_param = "page[cursor]"
+    page_size_query_param = "page[size]"
+    count_query_param = "page[count]"
+    max_page_size = 100
+    ordering = "-id"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.seek_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        if self.count_mode is not None:
+            self.count = count_queryset(queryset, self.count_mode == "exact")
+        return self.build_page(list(page_queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.seek_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        if self.count_mode is not None:
+            self.count = await sync_to_async(count_queryset)(
+                queryset, self.count_mode == "exact"
+            )
+        return self.build_page([instance async for instance in page_queryset])
+
+    def seek_queryset(self, queryset, request, view=None):
+        """
+        Returns the unevaluated queryset of the requested page plus one row, which
+        tells whether a following page exists, or `None` when pagination is off.
+        """
+        self.request = request
+        self.count_mode = request.query_params.get(self.count_query_param)
+        self.count = None
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        # Cursor pagination always enforces an ordering.
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        # If we have a cursor with a fixed position then filter by that.
+        if current_position is not None:
+            order = self.ordering[0]
+            is_reversed = order.startswith("-")
+            order_attr = order.lstrip("-")
+
+            # Test for: (cursor reversed) XOR (queryset reversed)
+            if self.cursor.reverse != is_reversed:
+                kwargs = {order_attr + "__lt": current_position}
+            else:
+                kwargs = {order_attr + "__gt": current_position}
+
+            queryset = queryset.filter(**kwargs)
+
+        return queryset[offset : offset + self.page_size + 1]
+
+    def build_page(self, results):
+        """
+        Sets the page and the positions of its neighbours from the rows fetched for
+        the queryset returned by `seek_queryset`.
+        """
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        self.page = list(results[: self.page_size])
+
+        # Determine the position of the final item following the page.
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(
+                results[-1], self.ordering
+            )
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            # The query ordering was in reverse, so reverse the items again.
+            self.page = list(reversed(self.page))
+
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_first_link(self):
+        return remove_query_param(self.base_url, self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        response = {
+            "results": data,
+            "links": {
+                "first": self.get_first_link(),
+                "next": self.get_next_link(),
+                "prev": self.get_previous_link(),
+            },
+        }
+        if self.count is not None:
+            count, approximate = self.count
+            response["meta"] = {
+                "pagination": {"count": count, "approximate": approximate}
+            }
+        return Response(response)
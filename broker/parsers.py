@@ -0,0 +1,32 @@
+from decimal import Decimal
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.utils import json
+from rest_framework_json_api import parsers
+
+
+class JSONParser(parsers.JSONParser):
+    """
+    `rest_framework_json_api`'s parser, decoding the JSON numbers with a fraction or
+    an exponent to `Decimal` instead of `float`, so amounts sent as numbers keep
+    every digit.
+
+    The body is decoded in one go by the C scanner of the `json` module rather than
+    through a stream reader.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+
+        try:
+            content = stream.read().decode(encoding)
+            parse_constant = json.strict_constant if self.strict else None
+            result = json.loads(
+                content, parse_float=Decimal, parse_constant=parse_constant
+            )
+        except ValueError as exc:
+            raise ParseError("JSON parse error - %s" % str(exc))
+
+        return self.parse_data(result, parser_context)
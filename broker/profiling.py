@@ -0,0 +1,178 @@
+import atexit
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileBuffer:
+    """
+    A ring buffer of request profiles, flushed to the `broker.profiling` logger by a
+    background thread, and at exit, so requests never wait on the write. When
+    profiles come in faster than they are flushed, the oldest ones are dropped.
+    """
+
+    def __init__(self):
+        self._records = deque(maxlen=settings.PROFILING["BUFFER_SIZE"])
+        self._flusher = None
+        self._lock = threading.Lock()
+
+    def append(self, record):
+        self._records.append(record)
+        if self._flusher is None:
+            self._start_flusher()
+
+    def flush(self):
+        while True:
+            try:
+                record = self._records.popleft()
+            except IndexError:
+                return
+            logger.info(json.dumps(record, default=str))
+
+    def _start_flusher(self):
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._run_flusher, name="profile-flusher", daemon=True
+                )
+                self._flusher.start()
+                atexit.register(self.flush)
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(settings.PROFILING["FLUSH_INTERVAL"])
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Could not flush request profiles")
+
+
+profile_buffer = ProfileBuffer()
+
+
+class SampledProfilingMiddleware:
+    """
+    Profiles a sample of the requests: their duration, status and SQL queries.
+
+    A request is profiled when it is drawn at `PROFILING["SAMPLE_RATE"]`, its path
+    starts with one of `PROFILING["PATHS"]`, it authenticates with one of
+    `PROFILING["TOKENS"]` or it sends the `PROFILING["HEADER"]` header set to
+    `PROFILING["SECRET"]` or one of the tokens. Any other request only costs the draw
+    and a few lookups.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        reason = self.get_sample_reason(request)
+        if reason is None:
+            return self.get_response(request)
+
+        with RequestProfile(request, reason) as profile:
+            profile.response = self.get_response(request)
+        return profile.response
+
+    async def __acall__(self, request):
+        reason = self.get_sample_reason(request)
+        if reason is None:
+            return await self.get_response(request)
+
+        with RequestProfile(request, reason) as profile:
+            profile.response = await self.get_response(request)
+        return profile.response
+
+    @staticmethod
+    def get_sample_reason(request):
+        options = settings.PROFILING
+        value = options["HEADER"] and request.headers.get(options["HEADER"])
+        if value and (
+            (options["SECRET"] and constant_time_compare(value, options["SECRET"]))
+            or value in options["TOKENS"]
+        ):
+            return "header"
+        if options["PATHS"] and request.path.startswith(tuple(options["PATHS"])):
+            return "path"
+        if options["TOKENS"]:
+            keyword, _, key = request.headers.get("Authorization", "").partition(" ")
+            if keyword == "Token" and key in options["TOKENS"]:
+                return "token"
+        if options["SAMPLE_RATE"] and random.random() < options["SAMPLE_RATE"]:
+            return "sample"
+        return None
+
+
+class RequestProfile:
+    """
+    Collects the profile of one request, timing the SQL queries on every database
+    connection, and appends it to `profile_buffer` on exit.
+    """
+
+    def __init__(self, request, reason):
+        self.request = request
+        self.reason = reason
+        self.response = None
+        self.queries = []
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self._time_query))
+        self.started_at = timezone.now()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self._start
+        self._stack.close()
+
+        max_queries = settings.PROFILING["MAX_QUERIES"]
+        slowest = sorted(self.queries, key=lambda query: query["ms"], reverse=True)
+        resolver_match = getattr(self.request, "resolver_match", None)
+        profile_buffer.append(
+            {
+                "started_at": self.started_at.isoformat(),
+                "reason": self.reason,
+                "method": self.request.method,
+                "path": self.request.path,
+                "view": resolver_match.view_name if resolver_match else None,
+                "status": self.response.status_code if self.response else 500,
+                "ms": round(duration * 1000, 3),
+                "sql_count": len(self.queries),
+                "sql_ms": round(sum(query["ms"] for query in self.queries), 3),
+                "sql": slowest[:max_queries],
+            }
+        )
+
+    def _time_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(
+                {
+                    "sql": sql[:500],
+                    "ms": round((time.perf_counter() - start) * 1000, 3),
+                    "db": context["connection"].alias,
+                }
+            )
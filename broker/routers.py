@@ -0,0 +1,69 @@
+import hashlib
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+_replica_reads = ContextVar("replica_reads", default=False)
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends reads to a replica from `settings.DATABASE_REPLICAS` while replica reads
+    are turned on, see `use_replica_reads`, and everything else to the primary.
+
+    Writes, `select_for_update` included, always go to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if settings.DATABASE_REPLICAS and _replica_reads.get():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Also for instances read from a replica, which remember it in `_state.db`.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+def use_replica_reads():
+    """
+    Turns replica reads on for the current context. Returns the token to pass to
+    `reset_replica_reads`.
+    """
+    return _replica_reads.set(True)
+
+
+def reset_replica_reads(token):
+    _replica_reads.reset(token)
+
+
+def pin_to_primary(key):
+    """
+    Keeps the reads of the client identified by `key` on the primary for
+    `settings.REPLICA_STICKY_SECONDS`, so it reads its own writes.
+    """
+    cache.set(_pin_cache_key(key), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_pinned_to_primary(key):
+    return cache.get(_pin_cache_key(key), False)
+
+
+async def ais_pinned_to_primary(key):
+    return await cache.aget(_pin_cache_key(key), False)
+
+
+def _pin_cache_key(key):
+    # Auth tokens are credentials, keep them out of the cache keys.
+    return "replica-pin:" + hashlib.sha256(str(key).encode()).hexdigest()
@@ -0,0 +1,76 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+import pytest
+
+from broker.authentication import token_cache
+from broker.conftest import User
+
+
+@pytest.fixture(autouse=True)
+def empty_token_cache():
+    token_cache.clear()
+
+
+@pytest.mark.django_db
+def test_cached_token_saves_a_query(
+    authorized_api_client: APIClient, default_user: User
+):
+    url = reverse("user-detail", args=[default_user.pk])
+
+    with CaptureQueriesContext(connection) as queries:
+        response = authorized_api_client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    assert any("authtoken_token" in query["sql"] for query in queries)
+
+    with CaptureQueriesContext(connection) as queries:
+        response = authorized_api_client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    assert not any("authtoken_token" in query["sql"] for query in queries)
+
+
+@pytest.mark.django_db
+def test_deleted_token_is_no_longer_accepted(
+    authorized_api_client: APIClient,
+    default_user: User,
+    django_capture_on_commit_callbacks,
+):
+    url = reverse("user-detail", args=[default_user.pk])
+    assert authorized_api_client.get(url).status_code == status.HTTP_200_OK
+
+    token = default_user.auth_token
+    key = token.key
+    with django_capture_on_commit_callbacks(execute=True):
+        token.delete()
+        # Still cached until the deletion commits.
+        assert token_cache.get(key) is not None
+
+    response = authorized_api_client.get(url)
+    assert response.status_code in (
+        status.HTTP_401_UNAUTHORIZED,
+        status.HTTP_403_FORBIDDEN,
+    )
+    assert response.json()["errors"][0]["detail"] == "Invalid token."
+
+
+@pytest.mark.django_db
+def test_deactivated_user_is_no_longer_accepted(
+    authorized_api_client: APIClient,
+    default_user: User,
+    django_capture_on_commit_callbacks,
+):
+    url = reverse("user-detail", args=[default_user.pk])
+    assert authorized_api_client.get(url).status_code == status.HTTP_200_OK
+
+    default_user.is_active = False
+    with django_capture_on_commit_callbacks(execute=True):
+        default_user.save()
+
+    response = authorized_api_client.get(url)
+    assert response.status_code in (
+        status.HTTP_401_UNAUTHORIZED,
+        status.HTTP_403_FORBIDDEN,
+    )
+    assert response.json()["errors"][0]["detail"] == "User inactive or deleted."
@@ -0,0 +1,163 @@
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import OperationalError, connection, connections, transaction
+from django.urls import reverse
+from prometheus_client import REGISTRY
+from rest_framework import status
+from rest_framework.test import APIClient
+import psycopg
+import pytest
+
+from broker.blockchains.models import TX, Wallet
+from broker.blockchains.test.factories import WalletFactory
+from broker.conftest import User, fake
+from broker.db import ContentionError, atomic_with_retries
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.fixture()
+def fast_retries(settings):
+    settings.DATABASE_RETRY = {
+        **settings.DATABASE_RETRY,
+        "LOCK_TIMEOUT": 50,
+        "RETRIES": 2,
+        "BACKOFF": 0.001,
+    }
+    return settings
+
+
+@contextmanager
+def locked_wallet(wallet: Wallet):
+    """
+    Holds the wallet's row lock from another connection.
+    """
+    locked, release = threading.Event(), threading.Event()
+
+    def hold():
+        try:
+            with transaction.atomic():
+                Wallet.objects.select_for_update().get(pk=wallet.pk)
+                locked.set()
+                release.wait(10)
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    locked.wait(10)
+    try:
+        yield
+    finally:
+        release.set()
+        thread.join()
+
+
+def get_timeouts() -> tuple[str, str]:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT current_setting('lock_timeout'), "
+            "current_setting('statement_timeout')"
+        )
+        return cursor.fetchone()
+
+
+def test_deadlock_is_retried(fast_retries):
+    calls = []
+
+    def deadlock_once():
+        calls.append(get_timeouts())
+        if len(calls) == 1:
+            raise OperationalError() from psycopg.errors.DeadlockDetected()
+        return "done"
+
+    labels = {"operation": "test", "reason": "deadlock"}
+    retries = sample("broker_db_retries_total", **labels)
+    previous = get_timeouts()
+
+    assert atomic_with_retries("test", deadlock_once) == "done"
+
+    assert calls == [("50ms", "5s")] * 2
+    assert sample("broker_db_retries_total", **labels) == retries + 1
+    # Set for the savepoint only, the test's transaction is back to its timeouts.
+    assert get_timeouts() == previous
+
+
+def test_zero_turns_a_timeout_off(fast_retries):
+    assert atomic_with_retries("test", get_timeouts, lock_timeout=0) == ("0", "5s")
+
+
+def test_other_errors_are_not_retried(fast_retries):
+    calls = []
+
+    def fail():
+        calls.append(None)
+        raise OperationalError() from psycopg.errors.UndefinedTable()
+
+    with pytest.raises(OperationalError):
+        atomic_with_retries("test", fail)
+
+    assert len(calls) == 1
+
+
+def test_statement_timeout_gives_up_without_retrying(fast_retries):
+    def sleep():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_sleep(1)")
+
+    labels = {"operation": "test", "reason": "statement_timeout"}
+    given_up = sample("broker_db_given_up_total", **labels)
+
+    with pytest.raises(ContentionError):
+        atomic_with_retries("test", sleep, statement_timeout=20)
+
+    assert sample("broker_db_given_up_total", **labels) == given_up + 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_tx_creation_gives_up_on_a_wallet_locked_through_every_retry(
+    default_user: User, fast_retries
+):
+    wallet = WalletFactory(user=default_user, balance=Decimal("5.00"))
+    labels = {"operation": "tx.create", "reason": "lock_timeout"}
+    retries = sample("broker_db_retries_total", **labels)
+    given_up = sample("broker_db_given_up_total", **labels)
+
+    with locked_wallet(wallet):
+        with pytest.raises(ContentionError):
+            TX.objects.create(wallet=wallet, txid=fake.sha256(), amount=Decimal("1"))
+
+    assert sample("broker_db_retries_total", **labels) == retries + 2
+    assert sample("broker_db_given_up_total", **labels) == given_up + 1
+    assert not TX.objects.filter(wallet=wallet).exists()
+    assert Wallet.objects.get(pk=wallet.pk).balance == Decimal("5.00")
+
+
+@pytest.mark.django_db(transaction=True)
+def test_tx_creation_on_a_locked_wallet_answers_service_unavailable(
+    authorized_api_client: APIClient, default_user: User, fast_retries
+):
+    wallet = WalletFactory(user=default_user, balance=Decimal("5.00"))
+
+    with locked_wallet(wallet):
+        response = authorized_api_client.post(
+            reverse("tx-list"),
+            {
+                "data": {
+                    "type": "TX",
+                    "attributes": {
+                        "wallet": wallet.pk,
+                        "txid": fake.sha256(),
+                        "amount": "1",
+                    },
+                }
+            },
+        )
+
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response["Retry-After"] == "1"
+    assert not TX.objects.filter(wallet=wallet).exists()
@@ -0,0 +1,61 @@
+import json
+from pathlib import Path
+import subprocess
+import sys
+
+# Importing locust monkey-patches the standard library with gevent, so the listener
+# runs in a process of its own.
+RUN_LISTENER = """
+from argparse import Namespace
+import json
+import sys
+
+from locust.env import Environment
+
+import locustfile
+
+failures, report_json = int(sys.argv[1]), sys.argv[2]
+environment = Environment(
+    user_classes=[locustfile.HotWalletUser],
+    parsed_options=Namespace(
+        slo_config="locust-slo.toml",
+        report_json=report_json,
+        baseline_json=None,
+        num_users=1,
+    ),
+)
+for _ in range(200):
+    environment.stats.log_request("POST", "/api/v1/transactions/", 10, 100)
+for _ in range(failures):
+    environment.stats.log_error("POST", "/api/v1/transactions/", "503")
+locustfile.report_and_check_slos(environment)
+print(json.dumps(environment.process_exit_code))
+"""
+
+
+def run_listener(failures: int, tmp_path) -> tuple[int, dict]:
+    report_json = tmp_path / "report.json"
+    result = subprocess.run(
+        [sys.executable, "-c", RUN_LISTENER, str(failures), str(report_json)],
+        capture_output=True,
+        check=True,
+        cwd=Path(__file__).parents[2],
+        text=True,
+    )
+    return json.loads(result.stdout), json.loads(report_json.read_text())
+
+
+def test_failures_under_the_fail_ratio_slo_exit_with_zero(tmp_path):
+    # 1 of 200 requests, under the default fail_ratio of 0.01.
+    exit_code, report = run_listener(1, tmp_path)
+
+    assert report["total"]["failures"] == 1
+    assert report["slo_breaches"] == []
+    assert exit_code == 0
+
+
+def test_failures_over_the_fail_ratio_slo_exit_with_one(tmp_path):
+    exit_code, report = run_listener(10, tmp_path)
+
+    assert report["slo_breaches"] == ["Total: fail_ratio 0.05 breaches 0.01"]
+    assert exit_code == 1
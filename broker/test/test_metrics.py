@@ -0,0 +1,153 @@
+from decimal import Decimal
+
+from django.urls import reverse
+from prometheus_client import REGISTRY
+from prometheus_client.values import MultiProcessValue
+from rest_framework import status
+from rest_framework.test import APIClient
+import pytest
+
+from broker import metrics
+from broker.blockchains.models import TX
+from broker.blockchains.test.factories import WalletFactory
+from broker.conftest import User
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def post_tx(client: APIClient, wallet, amount: str):
+    return client.post(
+        reverse("tx-list"),
+        {
+            "data": {
+                "type": "TX",
+                "attributes": {
+                    "wallet": wallet.pk,
+                    "txid": "f" * 64,
+                    "amount": amount,
+                },
+            }
+        },
+    )
+
+
+@pytest.fixture()
+def metrics_settings(settings):
+    settings.METRICS = {**settings.METRICS, "TOKEN": None}
+    return settings
+
+
+@pytest.mark.django_db
+def test_requests_are_counted_by_viewset_action_and_status(
+    authorized_api_client: APIClient, default_user: User, metrics_settings
+):
+    labels = {"view": "WalletViewSet", "action": "list", "method": "get"}
+    requests = sample("broker_requests_total", **labels, status="200")
+    durations = sample("broker_request_duration_seconds_count", **labels)
+    queries = sample("broker_request_queries_sum", **labels)
+
+    response = authorized_api_client.get(reverse("wallet-list"))
+    assert response.status_code == status.HTTP_200_OK
+
+    assert sample("broker_requests_total", **labels, status="200") == requests + 1
+    assert sample("broker_request_duration_seconds_count", **labels) == durations + 1
+    assert sample("broker_request_queries_sum", **labels) > queries
+
+
+@pytest.mark.django_db
+def test_unprocessable_tx_is_counted_with_its_status(
+    authorized_api_client: APIClient, default_user: User, metrics_settings
+):
+    wallet = WalletFactory(user=default_user, balance=Decimal("1"))
+    labels = {"view": "TXViewSet", "action": "create", "method": "post"}
+    rejected = sample("broker_requests_total", **labels, status="422")
+
+    response = post_tx(authorized_api_client, wallet, "-2")
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    assert sample("broker_requests_total", **labels, status="422") == rejected + 1
+
+
+@pytest.mark.django_db
+def test_tx_creation_times_the_balance_update(
+    authorized_api_client: APIClient, default_user: User, metrics_settings
+):
+    wallet = WalletFactory(user=default_user, balance=Decimal("1"))
+    waits = sample("broker_balance_lock_wait_seconds_count", row="wallet")
+
+    response = post_tx(authorized_api_client, wallet, "0.5")
+    assert response.status_code == status.HTTP_201_CREATED
+    assert TX.objects.filter(wallet=wallet).exists()
+
+    assert sample("broker_balance_lock_wait_seconds_count", row="wallet") == waits + 1
+
+
+@pytest.mark.django_db
+def test_requests_over_the_query_budget_are_counted(
+    authorized_api_client: APIClient, default_user: User, metrics_settings
+):
+    metrics_settings.METRICS = {**metrics_settings.METRICS, "QUERY_BUDGET": 0}
+    labels = {"view": "WalletViewSet", "action": "list", "method": "get"}
+    exceeded = sample("broker_request_query_budget_exceeded_total", **labels)
+
+    authorized_api_client.get(reverse("wallet-list"))
+
+    assert (
+        sample("broker_request_query_budget_exceeded_total", **labels) == exceeded + 1
+    )
+
+
+@pytest.mark.django_db
+def test_metrics_are_served_in_the_prometheus_format(
+    authorized_api_client: APIClient, default_user: User, metrics_settings
+):
+    authorized_api_client.get(reverse("wallet-list"))
+
+    response = APIClient().get(reverse("metrics"))
+    assert response.status_code == status.HTTP_200_OK
+    assert response["Content-Type"].startswith("text/plain")
+    assert b'broker_requests_total{action="list"' in response.content
+
+
+def test_metrics_require_the_token_when_one_is_set(settings):
+    settings.METRICS = {**settings.METRICS, "TOKEN": "secret"}
+    client = APIClient()
+
+    response = client.get(reverse("metrics"))
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert response["WWW-Authenticate"] == "Bearer"
+
+    response = client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret")
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_multiprocess_metrics_sum_the_samples_of_all_processes(monkeypatch, tmp_path):
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    # Increments the counter of a request from two worker processes.
+    for pid in (1, 2):
+        value = MultiProcessValue(process_identifier=lambda pid=pid: pid)(
+            "counter",
+            "broker_requests",
+            "broker_requests_total",
+            ("view", "action", "method", "status"),
+            ("WalletViewSet", "list", "get", "200"),
+            "",
+        )
+        value.inc(3)
+
+    registry = metrics.get_registry()
+
+    assert (
+        registry.get_sample_value(
+            "broker_requests_total",
+            {
+                "view": "WalletViewSet",
+                "action": "list",
+                "method": "get",
+                "status": "200",
+            },
+        )
+        == 6
+    )
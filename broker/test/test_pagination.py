@@ -0,0 +1,125 @@
+from django.db import connection
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+import pytest
+
+from broker.blockchains.models import TX, Wallet
+from broker.blockchains.test.factories import TXFactory, WalletFactory
+from broker.conftest import User
+from broker.pagination import (
+    JsonApiEstimatedCountPagination,
+    count_queryset,
+    estimate_count,
+)
+
+
+@pytest.fixture
+def estimate_threshold(settings):
+    settings.PAGINATION_COUNT = {**settings.PAGINATION_COUNT, "ESTIMATE_THRESHOLD": 1}
+
+
+def analyze(model):
+    with connection.cursor() as cursor:
+        cursor.execute(f"ANALYZE {connection.ops.quote_name(model._meta.db_table)}")
+
+
+def paginate(queryset, query):
+    pagination = JsonApiEstimatedCountPagination()
+    request = Request(APIRequestFactory().get("/", query))
+    page = pagination.paginate_queryset(queryset, request)
+    return page, pagination.get_paginated_response([]).data
+
+
+@pytest.mark.django_db
+def test_page_number_pagination_counts_small_collections_exactly(
+    default_user: User,
+):
+    WalletFactory.create_batch(3, user=default_user)
+
+    page, data = paginate(Wallet.objects.order_by("id"), {"page[size]": 2})
+
+    assert len(page) == 2
+    assert data["meta"]["pagination"] == {
+        "page": 1,
+        "pages": 2,
+        "count": 3,
+        "approximate": False,
+    }
+
+
+@pytest.mark.django_db
+def test_page_number_pagination_estimates_large_collections(
+    default_user: User, estimate_threshold
+):
+    WalletFactory.create_batch(3, user=default_user)
+    analyze(Wallet)
+    # Not in the statistics until the table is analyzed again.
+    WalletFactory.create_batch(2, user=default_user)
+
+    page, data = paginate(Wallet.objects.order_by("id"), {"page[size]": 2})
+    assert data["meta"]["pagination"]["count"] == 3
+    assert data["meta"]["pagination"]["approximate"] is True
+    assert data["links"]["next"] is not None
+
+    # Pages past the estimate are reachable, and tell there is no following one.
+    page, data = paginate(
+        Wallet.objects.order_by("id"), {"page[size]": 2, "page[number]": 3}
+    )
+    assert len(page) == 1
+    assert data["links"]["next"] is None
+
+    page, data = paginate(
+        Wallet.objects.order_by("id"), {"page[size]": 2, "page[count]": "exact"}
+    )
+    assert data["meta"]["pagination"]["count"] == 5
+    assert data["meta"]["pagination"]["approximate"] is False
+    assert data["meta"]["pagination"]["pages"] == 3
+
+
+@pytest.mark.django_db
+def test_estimate_count_sums_the_partitions_of_unfiltered_tables(
+    default_user: User,
+):
+    wallet = WalletFactory(user=default_user)
+    TXFactory.create_batch(4, wallet=wallet)
+    analyze(TX)
+
+    assert estimate_count(TX.objects.all()) == 4
+    # Filtered querysets are estimated by the planner.
+    assert estimate_count(TX.objects.filter(wallet=wallet)) >= 1
+
+
+@pytest.mark.django_db
+def test_count_queryset_caches_the_exact_counts_of_filtered_querysets(
+    default_user: User,
+):
+    WalletFactory.create_batch(2, user=default_user)
+    queryset = Wallet.objects.owned_by(default_user)
+    assert count_queryset(queryset) == (2, False)
+
+    WalletFactory(user=default_user)
+    # Possibly stale until CACHE_TIMEOUT, so approximate.
+    assert count_queryset(queryset) == (2, True)
+    assert count_queryset(queryset, exact=True) == (3, False)
+    assert count_queryset(queryset) == (3, True)
+
+
+@pytest.mark.django_db
+def test_cursor_pagination_counts_on_request(
+    authorized_api_client: APIClient, default_user: User
+):
+    wallet = WalletFactory(user=default_user)
+    TXFactory.create_batch(3, wallet=wallet)
+
+    response = authorized_api_client.get(reverse("tx-list"), {"page[size]": 2})
+    assert response.status_code == status.HTTP_200_OK
+    assert "meta" not in response.json()
+
+    response = authorized_api_client.get(
+        reverse("tx-list"), {"page[size]": 2, "page[count]": "exact"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["meta"]["pagination"] == {"count": 3, "approximate": False}
+    assert len(response.json()["data"]) == 2
@@ -0,0 +1,113 @@
+import json
+import logging
+
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+import pytest
+
+from broker import profiling
+from broker.conftest import User
+
+
+@pytest.fixture()
+def profile_buffer(monkeypatch, settings):
+    settings.PROFILING = {
+        **settings.PROFILING,
+        "SAMPLE_RATE": 0,
+        "PATHS": [],
+        "TOKENS": [],
+        "HEADER": None,
+        "SECRET": None,
+    }
+    buffer = profiling.ProfileBuffer()
+    monkeypatch.setattr(profiling, "profile_buffer", buffer)
+    yield buffer
+    # Don't leave profiles to the flush at exit, pytest has closed its streams by then.
+    buffer._records.clear()
+
+
+@pytest.mark.django_db
+def test_unsampled_request_is_not_profiled(
+    authorized_api_client: APIClient, default_user: User, profile_buffer
+):
+    response = authorized_api_client.get(reverse("wallet-list"))
+    assert response.status_code == status.HTTP_200_OK
+
+    assert not profile_buffer._records
+
+
+@pytest.mark.django_db
+def test_request_opting_in_through_header_is_profiled(
+    authorized_api_client: APIClient, default_user: User, profile_buffer, settings
+):
+    # Off by default, the header is ignored whatever its value.
+    authorized_api_client.get(reverse("wallet-list"), HTTP_X_PROFILE="secret")
+    settings.PROFILING = {
+        **settings.PROFILING,
+        "HEADER": "X-Profile",
+        "SECRET": "secret",
+    }
+    authorized_api_client.get(reverse("wallet-list"), HTTP_X_PROFILE="1")
+    assert not profile_buffer._records
+
+    response = authorized_api_client.get(
+        reverse("wallet-list"), HTTP_X_PROFILE="secret"
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    [record] = profile_buffer._records
+    assert record["reason"] == "header"
+    assert record["view"] == "wallet-list"
+    assert record["status"] == status.HTTP_200_OK
+    assert record["sql_count"] >= 1
+    assert any("blockchains_wallet" in query["sql"] for query in record["sql"])
+
+
+@pytest.mark.django_db
+def test_header_opts_in_with_a_profiling_token_without_a_secret(
+    authorized_api_client: APIClient, default_user: User, profile_buffer, settings
+):
+    settings.PROFILING = {**settings.PROFILING, "HEADER": "X-Profile"}
+    authorized_api_client.get(reverse("wallet-list"), HTTP_X_PROFILE="1")
+    settings.PROFILING = {**settings.PROFILING, "TOKENS": ["profiling-token"]}
+    APIClient().get(reverse("wallet-list"), HTTP_X_PROFILE="profiling-token")
+
+    [record] = profile_buffer._records
+    assert record["reason"] == "header"
+
+
+@pytest.mark.django_db
+def test_requests_opting_in_through_path_or_token_are_profiled(
+    authorized_api_client: APIClient, default_user: User, profile_buffer, settings
+):
+    settings.PROFILING = {**settings.PROFILING, "PATHS": ["/api/v1/users/"]}
+    authorized_api_client.get(reverse("wallet-list"))
+    authorized_api_client.get(reverse("user-detail", args=[default_user.pk]))
+
+    settings.PROFILING = {**settings.PROFILING, "TOKENS": [default_user.auth_token.key]}
+    authorized_api_client.get(reverse("wallet-list"))
+
+    assert [record["reason"] for record in profile_buffer._records] == ["path", "token"]
+
+
+@pytest.mark.django_db
+def test_sampled_requests_are_flushed_to_the_log(
+    authorized_api_client: APIClient,
+    default_user: User,
+    profile_buffer,
+    settings,
+    caplog,
+):
+    settings.PROFILING = {**settings.PROFILING, "SAMPLE_RATE": 1}
+    logger = logging.getLogger("broker.profiling")
+    logger.addHandler(caplog.handler)
+    try:
+        authorized_api_client.get(reverse("wallet-list"))
+        profile_buffer.flush()
+    finally:
+        logger.removeHandler(caplog.handler)
+
+    [message] = caplog.messages
+    assert json.loads(message)["reason"] == "sample"
+    assert not profile_buffer._records
@@ -0,0 +1,101 @@
+from decimal import Decimal
+
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_json_api.renderers import JSONRenderer
+import pytest
+
+from broker.blockchains.models import TX, Wallet
+from broker.blockchains.test.factories import TXFactory, WalletFactory
+from broker.conftest import User, fake
+from broker.renderers import JSONRenderer as FastJSONRenderer
+
+
+def render_with_rest_framework_json_api(response):
+    renderer = JSONRenderer()
+    return renderer.render(
+        response.data, renderer.media_type, response.renderer_context
+    )
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "url_name,query",
+    [
+        ("tx-list", {}),
+        ("tx-list", {"fields[TX]": "amount,wallet"}),
+        ("wallet-list", {}),
+        ("wallet-list", {"fields[Wallet]": "label"}),
+    ],
+)
+def test_renderer_renders_the_documents_of_rest_framework_json_api(
+    authorized_api_client: APIClient, default_user: User, url_name: str, query: dict
+):
+    wallet = WalletFactory(user=default_user, label="Control \x1f “quoted” \\ é")
+    TXFactory.create_batch(3, wallet=wallet)
+
+    response = authorized_api_client.get(reverse(url_name), query)
+    assert response.status_code == status.HTTP_200_OK
+
+    # Built from a plan, not handed to the renderer of `rest_framework_json_api`.
+    assert FastJSONRenderer().build_document(response.data, response.renderer_context)
+    assert response.content == render_with_rest_framework_json_api(response)
+
+
+@pytest.mark.django_db
+def test_renderer_keeps_decimal_precision_and_escapes_line_separators(
+    authorized_api_client: APIClient, default_user: User
+):
+    wallet = WalletFactory(
+        user=default_user,
+        label="Line\u2028separator",
+        balance=Decimal("12345678.123456789012345678"),
+    )
+
+    response = authorized_api_client.get(reverse("wallet-detail", args=[wallet.pk]))
+    assert response.status_code == status.HTTP_200_OK
+
+    assert response.content == render_with_rest_framework_json_api(response)
+    assert b'"balance":"12345678.123456789012345678"' in response.content
+    assert b'"label":"Line\\u2028separator"' in response.content
+
+
+@pytest.mark.django_db
+def test_renderer_renders_errors(authorized_api_client: APIClient):
+    response = authorized_api_client.get(reverse("wallet-detail", args=[fake.uuid4()]))
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    assert response.json()["errors"][0]["status"] == "404"
+
+
+@pytest.mark.django_db
+def test_parser_reads_numbers_as_exact_decimals(
+    authorized_api_client: APIClient, default_user: User
+):
+    wallet = WalletFactory(user=default_user, balance=Decimal("1"))
+
+    response = authorized_api_client.generic(
+        "POST",
+        reverse("tx-list"),
+        '{"data": {"type": "TX", "attributes": {"wallet": "%s", "txid": "%s", '
+        '"amount": 0.123456789012345678}}}' % (wallet.pk, fake.sha256()),
+        content_type="application/vnd.api+json",
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+
+    assert TX.objects.get().amount == Decimal("0.123456789012345678")
+    assert Wallet.objects.get(pk=wallet.pk).balance == Decimal("1.123456789012345678")
+
+
+@pytest.mark.django_db
+def test_parser_rejects_out_of_range_numbers(
+    authorized_api_client: APIClient, default_user: User
+):
+    response = authorized_api_client.generic(
+        "POST",
+        reverse("tx-list"),
+        '{"data": {"type": "TX", "attributes": {"amount": NaN}}}',
+        content_type="application/vnd.api+json",
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
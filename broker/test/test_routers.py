@@ -0,0 +1,95 @@
+from django.conf import settings as django_settings
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+import pytest
+
+from broker.blockchains.models import Wallet
+from broker.blockchains.test.factories import WalletFactory
+from broker.conftest import User
+from broker.routers import (
+    PrimaryReplicaRouter,
+    is_pinned_to_primary,
+    reset_replica_reads,
+    use_replica_reads,
+)
+
+
+def test_router_reads_from_replica_only_when_turned_on(settings):
+    settings.DATABASE_REPLICAS = ["replica"]
+    router = PrimaryReplicaRouter()
+
+    assert router.db_for_read(Wallet) == "default"
+
+    token = use_replica_reads()
+    try:
+        assert router.db_for_read(Wallet) == "replica"
+        assert router.db_for_write(Wallet) == "default"
+    finally:
+        reset_replica_reads(token)
+
+    assert router.db_for_read(Wallet) == "default"
+    assert not router.allow_migrate("replica", "blockchains")
+
+
+@pytest.mark.django_db
+def test_write_pins_client_to_primary(
+    authorized_api_client: APIClient, default_user: User
+):
+    assert not is_pinned_to_primary(default_user.auth_token.key)
+
+    wallet = WalletFactory.build(user=default_user)
+    response = authorized_api_client.post(
+        reverse("wallet-list"),
+        {
+            "data": {
+                "type": "Wallet",
+                "attributes": {
+                    "label": wallet.label,
+                    "balance": wallet.balance,
+                    "user": default_user.pk,
+                    "status": wallet.status,
+                },
+            }
+        },
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+
+    assert is_pinned_to_primary(default_user.auth_token.key)
+
+
+@pytest.mark.skipif(
+    "replica" not in django_settings.DATABASES,
+    reason="DJANGO_POSTGRES_REPLICA_HOST is not set",
+)
+@pytest.mark.django_db(transaction=True, databases=["default", "replica"])
+def test_reads_go_to_replica_until_client_writes(
+    authorized_api_client: APIClient, default_user: User, settings
+):
+    settings.DATABASE_REPLICAS = ["replica"]
+    wallet = WalletFactory(user=default_user)
+
+    with CaptureQueriesContext(connections["replica"]) as replica_queries:
+        response = authorized_api_client.get(reverse("wallet-detail", args=[wallet.pk]))
+    assert response.status_code == status.HTTP_200_OK
+    assert replica_queries.captured_queries
+
+    response = authorized_api_client.patch(
+        reverse("wallet-detail", args=[wallet.pk]),
+        {
+            "data": {
+                "type": "Wallet",
+                "id": str(wallet.pk),
+                "attributes": {"label": "New"},
+            }
+        },
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    with CaptureQueriesContext(connections["replica"]) as replica_queries:
+        response = authorized_api_client.get(reverse("wallet-detail", args=[wallet.pk]))
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["data"]["attributes"]["label"] == "New"
+    assert not replica_queries.captured_queries
@@ -0,0 +1,191 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+import pytest
+
+from broker.blockchains.models import TX, TXManager, Wallet, WalletManager
+from broker.blockchains.test.factories import TXFactory, WalletFactory
+from broker.conftest import User, fake
+from broker.users.test.factories import UserFactory
+
+
+@pytest.mark.django_db
+def test_db_pool_status_reports_checked_out_connections():
+    admin = UserFactory(is_staff=True)
+    client = APIClient()
+    client.force_authenticate(admin)
+
+    response = client.get(reverse("db-pool-status"))
+    assert response.status_code == status.HTTP_200_OK
+
+    stats = response.json()["default"]
+    # The test transaction holds the connection of this thread.
+    assert stats["checked_out"] >= 1
+    assert stats["max_size"] == connection.settings_dict["OPTIONS"]["pool"]["max_size"]
+    assert {"waiting", "timeouts", "requests"} <= stats.keys()
+
+
+@pytest.mark.django_db
+def test_db_pool_status_is_for_staff_only(
+    authorized_api_client: APIClient, default_user: User
+):
+    response = authorized_api_client.get(reverse("db-pool-status"))
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+TRANSACTION_STATEMENTS = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE")
+
+
+@pytest.mark.django_db(transaction=True)
+def test_reads_run_without_transactions(
+    authorized_api_client: APIClient, default_user: User, settings
+):
+    # Silk stores its own records of the requests in transactions.
+    settings.MIDDLEWARE = [
+        middleware
+        for middleware in settings.MIDDLEWARE
+        if not middleware.startswith("silk.")
+    ]
+    wallet = WalletFactory(user=default_user, balance=Decimal("5.00"))
+    tx = TXFactory(wallet=wallet)
+    urls = [
+        reverse("wallet-list"),
+        reverse("wallet-detail", args=[wallet.pk]),
+        reverse("wallet-stats", args=[wallet.pk]),
+        reverse("wallet-transactions-list", kwargs={"wallet_pk": wallet.pk}),
+        reverse("tx-list"),
+        reverse("tx-detail", args=[tx.pk]),
+        reverse("user-detail", args=[default_user.pk]),
+    ]
+
+    for url in urls:
+        with CaptureQueriesContext(connection) as queries:
+            response = authorized_api_client.get(url)
+        assert response.status_code == status.HTTP_200_OK, url
+        assert queries.captured_queries, url
+        assert not [
+            query["sql"]
+            for query in queries
+            if query["sql"].startswith(TRANSACTION_STATEMENTS)
+        ], url
+
+
+@pytest.mark.django_db(transaction=True)
+def test_wallet_creation_is_atomic(
+    authorized_api_client: APIClient, default_user: User, monkeypatch
+):
+    monkeypatch.setattr(WalletManager, "reshard", fail)
+
+    with pytest.raises(RuntimeError):
+        authorized_api_client.post(
+            reverse("wallet-list"),
+            {
+                "data": {
+                    "type": "Wallet",
+                    "attributes": {
+                        "label": "Hot wallet",
+                        "balance": "10.00",
+                        "user": default_user.pk,
+                        "status": "A",
+                        "slot_count": 4,
+                    },
+                }
+            },
+        )
+
+    assert not Wallet.objects.exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_wallet_update_is_atomic(
+    authorized_api_client: APIClient, default_user: User, monkeypatch
+):
+    wallet = WalletFactory(user=default_user, label="Cold wallet")
+    monkeypatch.setattr(WalletManager, "reshard", fail)
+
+    with pytest.raises(RuntimeError):
+        authorized_api_client.patch(
+            reverse("wallet-detail", args=[wallet.pk]),
+            {
+                "data": {
+                    "type": "Wallet",
+                    "id": str(wallet.pk),
+                    "attributes": {"label": "Hot wallet", "slot_count": 4},
+                }
+            },
+        )
+
+    assert Wallet.objects.get(pk=wallet.pk).label == "Cold wallet"
+
+
+@pytest.mark.django_db(transaction=True)
+def test_bulk_tx_creation_is_atomic_per_wallet(
+    authorized_api_client: APIClient, default_user: User, monkeypatch
+):
+    wallets = WalletFactory.create_batch(2, user=default_user, balance=Decimal("5"))
+    create_group = TXManager._bulk_create_group
+    groups = []
+
+    def fail_second_group(self, wallet_id, txs):
+        groups.append(wallet_id)
+        create_group(self, wallet_id, txs)
+        if len(groups) == 2:
+            fail()
+
+    monkeypatch.setattr(TXManager, "_bulk_create_group", fail_second_group)
+
+    with pytest.raises(RuntimeError):
+        authorized_api_client.post(
+            reverse("tx-bulk-create"),
+            {
+                "data": [
+                    {
+                        "type": "TX",
+                        "attributes": {
+                            "wallet": str(wallet.pk),
+                            "txid": fake.sha256(),
+                            "amount": "1.00",
+                        },
+                    }
+                    for wallet in wallets
+                ]
+            },
+        )
+
+    # The first wallet's group committed on its own, the second was rolled back.
+    first, second = (str(wallet_id) for wallet_id in groups)
+    assert [str(tx.wallet_id) for tx in TX.objects.all()] == [first]
+    assert Wallet.objects.get(pk=first).balance == Decimal("6")
+    assert Wallet.objects.get(pk=second).balance == Decimal("5")
+
+
+@pytest.mark.django_db(transaction=True)
+def test_user_creation_is_atomic(monkeypatch):
+    monkeypatch.setattr(Token.objects, "create", fail)
+
+    with pytest.raises(RuntimeError):
+        APIClient().post(
+            reverse("user-list"),
+            {
+                "data": {
+                    "type": "User",
+                    "attributes": {
+                        "username": "satoshi",
+                        "password": "0ne-Secret-Password",
+                        "email": "satoshi@example.com",
+                    },
+                }
+            },
+        )
+
+    assert not get_user_model().objects.filter(username="satoshi").exists()
+
+
+def fail(*args, **kwargs):
+    raise RuntimeError("Failed halfway")
@@ -9,21 +9,30 @@ from rest_framework.authtoken import views
 from rest_framework.schemas import get_schema_view
 from rest_framework_json_api.schemas.openapi import SchemaGenerator
 
-from .blockchains.views import TXViewSet, WalletViewSet
+from .blockchains.views import QueuedTXViewSet, TXViewSet, WalletViewSet
+from .metrics import MetricsView
 from .users.views import UserViewSet
+from .views import DatabasePoolView
 
 
 router = DefaultRouter()
 router.register(r"users", UserViewSet)
 router.register(r"wallets", WalletViewSet)
 router.register(r"transactions", TXViewSet)
+router.register(r"transactions/queued", QueuedTXViewSet)
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/v1/", include(router.urls)),
+    path(
+        "api/v1/wallets/<str:wallet_pk>/transactions/",
+        TXViewSet.as_view({"get": "list"}),
+        name="wallet-transactions-list",
+    ),
     path("api/v1/auth/token/", views.obtain_auth_token),
+    path("api/v1/status/db-pool/", DatabasePoolView.as_view(), name="db-pool-status"),
+    path("metrics", MetricsView.as_view(), name="metrics"),
     path("api-auth/", include("rest_framework.urls", namespace="rest_framework")),
-    path("silk/", include("silk.urls", namespace="silk")),
     path(
         "docs/openapi.json",
         get_schema_view(
@@ -46,3 +55,6 @@ urlpatterns = [
     # http://www.django-rest-framework.org/api-guide/routers/#defaultrouter
     re_path(r"^$", RedirectView.as_view(url=reverse_lazy("api-root"), permanent=False)),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
+if "silk" in settings.INSTALLED_APPS:
+    urlpatterns.append(path("silk/", include("silk.urls", namespace="silk")))
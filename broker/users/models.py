@@ -1,11 +1,14 @@
 import uuid
-from django.db import models
+from functools import partial
+from django.db import models, transaction
 from django.conf import settings
 from django.dispatch import receiver
 from django.contrib.auth.models import AbstractUser
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from rest_framework.authtoken.models import Token
 
+from broker.authentication import token_cache
+
 
 class User(AbstractUser):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -18,3 +21,19 @@ class User(AbstractUser):
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     if created:
         Token.objects.create(user=instance)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_tokens(
+    sender, instance=None, created=False, using=None, **kwargs
+):
+    # Cached tokens carry a copy of their user, deactivation included. Dropped once
+    # committed, a request in between would cache the old user again.
+    if not created:
+        keys = Token.objects.filter(user=instance).values_list("key", flat=True)
+        transaction.on_commit(partial(token_cache.delete, *keys), using=using)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_cached_token(sender, instance=None, using=None, **kwargs):
+    transaction.on_commit(partial(token_cache.delete, instance.key), using=using)
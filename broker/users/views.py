@@ -1,10 +1,14 @@
 from rest_framework import viewsets, mixins
+
+from broker.views import AtomicWritesMixin, ReplicaReadMixin
 from .models import User
 from .permissions import IsUserOrCreatingAccountOrReadOnly
 from .serializers import CreateUserSerializer, UserSerializer
 
 
 class UserViewSet(
+    ReplicaReadMixin,
+    AtomicWritesMixin,
     mixins.CreateModelMixin,
     mixins.RetrieveModelMixin,
     mixins.UpdateModelMixin,
@@ -0,0 +1,414 @@
+import hashlib
+from functools import update_wrapper
+
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.core.exceptions import ValidationError
+from django.db import connections, router, transaction
+from django.http import Http404, HttpResponseNotModified
+from django.utils.http import parse_etags
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, permissions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .db import get_pool_stats
+from .exceptions import PreconditionFailed
+from .routers import (
+    ais_pinned_to_primary,
+    is_pinned_to_primary,
+    pin_to_primary,
+    reset_replica_reads,
+    use_replica_reads,
+)
+
+
+class AsyncReadMixin:
+    """
+    Serves `list` and `retrieve` natively when the viewset runs under ASGI.
+
+    Reads authenticate, query and paginate with the async ORM instead of occupying a
+    worker thread for the whole request. Every other action is handed to the regular
+    sync viewset, wrapped in a transaction only for a database that sets
+    `ATOMIC_REQUESTS`, which none does: writes open their own, see
+    `AtomicWritesMixin`. Under WSGI Django runs the whole view through
+    `async_to_sync` instead.
+    """
+
+    async_actions = ("list", "retrieve")
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        sync_view = super().as_view(actions, **initkwargs)
+        atomic_view = sync_view
+        for alias, settings_dict in connections.settings.items():
+            if settings_dict["ATOMIC_REQUESTS"]:
+                atomic_view = transaction.atomic(using=alias)(atomic_view)
+        atomic_view = sync_to_async(atomic_view)
+
+        async def view(request, *args, **kwargs):
+            actions = dict(sync_view.actions)
+            if "get" in actions and "head" not in actions:
+                actions["head"] = actions["get"]
+
+            if actions.get(request.method.lower()) not in cls.async_actions:
+                return await atomic_view(request, *args, **kwargs)
+
+            self = cls(**initkwargs)
+            self.action_map = actions
+            for method, action in actions.items():
+                setattr(self, method, getattr(self, action))
+            self.request = request
+            self.args = args
+            self.kwargs = kwargs
+            return await self.adispatch(request, *args, **kwargs)
+
+        update_wrapper(view, sync_view, updated=())
+        markcoroutinefunction(view)
+        # Transactions are left to `atomic_view`, Django can't wrap an async view.
+        view._non_atomic_requests = set(connections.settings)
+        view.cls = sync_view.cls
+        view.initkwargs = sync_view.initkwargs
+        view.actions = sync_view.actions
+        return csrf_exempt(view)
+
+    async def adispatch(self, request, *args, **kwargs):
+        """
+        The async counterpart of `APIView.dispatch` for the actions in `async_actions`.
+        """
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.ainitial(request, *args, **kwargs)
+            handler = getattr(self, f"a{self.action}")
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def ainitial(self, request, *args, **kwargs):
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+
+        neg = self.perform_content_negotiation(request)
+        request.accepted_renderer, request.accepted_media_type = neg
+
+        version, scheme = self.determine_version(request, *args, **kwargs)
+        request.version, request.versioning_scheme = version, scheme
+
+        await self.aperform_authentication(request)
+        self.check_permissions(request)
+        self.check_throttles(request)
+
+    async def aperform_authentication(self, request):
+        """
+        Authenticates the request up front, so accessing `request.user` later on
+        doesn't run the lazy, sync authentication of `Request`.
+        """
+        for authenticator in request.authenticators:
+            try:
+                if hasattr(authenticator, "aauthenticate"):
+                    user_auth_tuple = await authenticator.aauthenticate(request)
+                else:
+                    user_auth_tuple = await sync_to_async(authenticator.authenticate)(
+                        request
+                    )
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+
+            if user_auth_tuple is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth_tuple
+                return
+
+        request._not_authenticated()
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer(
+            [instance async for instance in queryset], many=True
+        )
+        return Response(serializer.data)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        instance = await self.aget_object()
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data)
+
+    async def aget_object(self):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        filter_kwargs = {self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        try:
+            obj = await queryset.aget(**filter_kwargs)
+        except (queryset.model.DoesNotExist, TypeError, ValueError, ValidationError):
+            raise Http404
+
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def apaginate_queryset(self, queryset):
+        if self.paginator is None:
+            return None
+        if hasattr(self.paginator, "apaginate_queryset"):
+            return await self.paginator.apaginate_queryset(
+                queryset, self.request, view=self
+            )
+        return await sync_to_async(self.paginator.paginate_queryset)(
+            queryset, self.request, view=self
+        )
+
+
+def etag_matches(header, etag, weak=True):
+    """
+    Tells whether the `If-None-Match` or `If-Match` header lists `etag`, comparing
+    weakly for the former and strongly for the latter.
+    """
+    etags = parse_etags(header)
+    if etags == ["*"]:
+        return True
+    if not weak:
+        return not etag.startswith("W/") and etag in etags
+    return etag.removeprefix("W/") in {tag.removeprefix("W/") for tag in etags}
+
+
+class AtomicWritesMixin:
+    """
+    Runs `perform_create`, `perform_update` and `perform_destroy` in a transaction
+    on the database the model is written to.
+
+    Requests don't run in a transaction of their own, reads are in autocommit. A
+    write holds its transaction, and its connection under a transaction pooler, only
+    while it writes, not while the request is authenticated or the response is
+    rendered. Goes before the mixins whose `perform_*` methods it wraps.
+    """
+
+    def get_write_atomic(self):
+        return transaction.atomic(using=router.db_for_write(self.queryset.model))
+
+    def perform_create(self, serializer):
+        with self.get_write_atomic():
+            super().perform_create(serializer)
+
+    def perform_update(self, serializer):
+        with self.get_write_atomic():
+            super().perform_update(serializer)
+
+    def perform_destroy(self, instance):
+        with self.get_write_atomic():
+            super().perform_destroy(instance)
+
+
+class ConditionalRequestMixin:
+    """
+    Tags `retrieve` and `list` responses with an ETag, and answers a request whose
+    `If-None-Match` lists it with 304 Not Modified, before anything is serialized.
+    An update whose `If-Match` doesn't list the object's ETag fails with 412
+    Precondition Failed.
+
+    Viewsets implement `get_etag(instance)`. `retrieve` looks the ETag up in
+    `get_etag_queryset()` first, which should fetch as little as possible. Object
+    permissions aren't checked for a 304, so the queryset has to be limited to
+    what the client may read. Goes before `AsyncReadMixin`.
+    """
+
+    etag = None
+
+    def get_etag(self, instance):
+        raise NotImplementedError
+
+    def get_etag_queryset(self):
+        return self.filter_queryset(self.get_queryset())
+
+    def get_page_etag(self, page):
+        digest = hashlib.sha256()
+        for instance in page:
+            digest.update(self.get_etag(instance).encode())
+        for link in (
+            self.paginator.get_next_link(),
+            self.paginator.get_previous_link(),
+        ):
+            digest.update(f" {link}".encode())
+        return f'"{digest.hexdigest()}"'
+
+    def get_current_etag(self):
+        """
+        Returns the current ETag of the requested object, or `None` when it doesn't
+        exist.
+        """
+        try:
+            instance = self._filter_etag_queryset().first()
+        except (TypeError, ValueError, ValidationError):
+            return None
+        return self.get_etag(instance) if instance is not None else None
+
+    async def aget_current_etag(self):
+        try:
+            instance = await self._filter_etag_queryset().afirst()
+        except (TypeError, ValueError, ValidationError):
+            return None
+        return self.get_etag(instance) if instance is not None else None
+
+    def _filter_etag_queryset(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        return self.get_etag_queryset().filter(
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match:
+            etag = self.get_current_etag()
+            if etag is not None and etag_matches(if_none_match, etag):
+                return self.not_modified(etag)
+        return super().retrieve(request, *args, **kwargs)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match:
+            etag = await self.aget_current_etag()
+            if etag is not None and etag_matches(if_none_match, etag):
+                return self.not_modified(etag)
+        return await super().aretrieve(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_page_response(request, page)
+
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            return self.get_page_response(request, page)
+
+        serializer = self.get_serializer(
+            [instance async for instance in queryset], many=True
+        )
+        return Response(serializer.data)
+
+    def get_page_response(self, request, page):
+        self.etag = self.get_page_etag(page)
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match and etag_matches(if_none_match, self.etag):
+            return self.not_modified(self.etag)
+
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def get_object(self):
+        instance = super().get_object()
+        self.etag = self.get_etag(instance)
+        return instance
+
+    async def aget_object(self):
+        instance = await super().aget_object()
+        self.etag = self.get_etag(instance)
+        return instance
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        self.etag = self.get_etag(serializer.instance)
+
+    def perform_update(self, serializer):
+        if_match = self.request.headers.get("If-Match")
+        if if_match and not etag_matches(if_match, self.etag, weak=False):
+            raise PreconditionFailed()
+        super().perform_update(serializer)
+        self.etag = self.get_etag(serializer.instance)
+
+    def not_modified(self, etag):
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        return response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.etag is not None and response.status_code in (200, 201):
+            response.setdefault("ETag", self.etag)
+        return response
+
+
+class ReplicaReadMixin:
+    """
+    Serves the actions in `replica_actions` from a read replica, see
+    `PrimaryReplicaRouter`.
+
+    A client that just wrote keeps reading from the primary for a short while, so it
+    doesn't miss its own writes on a lagging replica. Clients are told apart by their
+    auth token, or by their user for session authentication.
+    """
+
+    replica_actions = ("list", "retrieve")
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        key = self.get_sticky_key(request)
+        if self.action in self.replica_actions and not (
+            key is not None and is_pinned_to_primary(key)
+        ):
+            self._replica_reads_token = use_replica_reads()
+
+    async def ainitial(self, request, *args, **kwargs):
+        await super().ainitial(request, *args, **kwargs)
+        key = self.get_sticky_key(request)
+        if self.action in self.replica_actions and not (
+            key is not None and await ais_pinned_to_primary(key)
+        ):
+            self._replica_reads_token = use_replica_reads()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+
+        token = getattr(self, "_replica_reads_token", None)
+        if token is not None:
+            reset_replica_reads(token)
+            self._replica_reads_token = None
+
+        if (
+            request.method not in permissions.SAFE_METHODS
+            and response.status_code < 400
+        ):
+            key = self.get_sticky_key(request)
+            if key is not None:
+                pin_to_primary(key)
+        return response
+
+    def get_sticky_key(self, request):
+        token_key = getattr(request.auth, "key", None)
+        if token_key is not None:
+            return token_key
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return None
+
+
+class DatabasePoolView(APIView):
+    """
+    Reports the database connection pool counters of this process, see `get_pool_stats`.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+    renderer_classes = [JSONRenderer]
+
+    def get(self, request, *args, **kwargs):
+        return Response(get_pool_stats())
@@ -4,5 +4,9 @@ set -e
 # Run migrations
 uv run broker/wait_for_postgres.py && uv run manage.py migrate || exit 1
 
+# Every uvicorn worker writes its metrics here, `/metrics` serves their sum
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/broker-metrics}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 # Start the Django application
 uv run uvicorn --host 0.0.0.0 --port ${PORT:-8000} --access-log broker.asgi:application
@@ -1,32 +1,68 @@
+"""
+Load test scenarios of the API. Run one by naming its user class, all of them by
+naming none:
+
+    locust --headless -f locustfile.py -H http://127.0.0.1:8000 \
+        --users 50 --spawn-rate 10 --run-time 5m HotWalletUser
+
+Every headless run writes a JSON report of its p50/p95/p99 response times and
+throughput, tagged with the commit it ran against, and exits with code 1 when
+the SLOs of `locust-slo.toml` are breached. See docs/testing/locust.md.
+"""
+
 from datetime import datetime, timezone
+import json
+import logging
 import os
+from pathlib import Path
 import random
+import subprocess
+import tomllib
 
-from locust import HttpUser, task, between
+from gevent.lock import Semaphore
+from locust import HttpUser, between, constant, events, task
+from locust.runners import WorkerRunner
+from locust.stats import StatsEntry
 
+logger = logging.getLogger(__name__)
 
-class BlockchainUser(HttpUser):
-    wait_time = between(1, 4)
+JSON_API_HEADERS = {"Content-Type": "application/vnd.api+json"}
+PERCENTILES = {"p50": 0.5, "p95": 0.95, "p99": 0.99}
+# Requests named with it, like logging in, hash passwords and are left out of the
+# totals the SLOs are checked against.
+SETUP = "(setup)"
 
-    def on_start(self):
-        """
-        On start, log in and get a token.
-        """
-        slug = datetime.now(tz=timezone.utc).strftime("%Y%m%d%H%M%S")
+
+class ApiUser(HttpUser):
+    """
+    Creates a user of its own, through the superuser of DJANGO_SUPERUSER_USER, to
+    own the wallets it creates. Requests are made as that user, or as the superuser
+    with `as_superuser`, who sees and may write to every wallet.
+    """
+
+    abstract = True
+    scenario = None
+    as_superuser = False
+
+    def log_in(self, username: str, password: str):
         self.token: str = self.client.post(
             "/api/v1/auth/token/",
-            json={
-                "username": os.environ["DJANGO_SUPERUSER_USER"],
-                "password": os.environ["DJANGO_SUPERUSER_PASSWORD"],
-            },
+            json={"username": username, "password": password},
+            name=f"/api/v1/auth/token/ [POST] - Log In {SETUP}",
         ).json()["token"]
+        self.client.headers["Authorization"] = f"Token {self.token}"
+
+    def on_start(self):
+        slug = (
+            f"{datetime.now(tz=timezone.utc):%Y%m%d%H%M%S}_{random.randbytes(4).hex()}"
+        )
+        self.log_in(
+            os.environ["DJANGO_SUPERUSER_USER"], os.environ["DJANGO_SUPERUSER_PASSWORD"]
+        )
 
         self.user = self.client.post(
             "/api/v1/users/",
-            headers={
-                "Authorization": f"Token {self.token}",
-                "Content-Type": "application/vnd.api+json",
-            },
+            headers=JSON_API_HEADERS,
             json={
                 "data": {
                     "type": "User",
@@ -35,30 +71,28 @@ class BlockchainUser(HttpUser):
                         "password": "testpassword",
                         "first_name": "lo",
                         "last_name": "cust",
-                        "email": "testuser_{slug}@lo.cust",
+                        "email": f"testuser_{slug}@lo.cust",
                     },
                 }
             },
+            name=f"/api/v1/users/ [POST] - Create User {SETUP}",
         ).json()["data"]
-        print(f"testuser_{slug}: ", self.user["id"])
-
-    @task
-    def create_wallet(self):
-        label = f"Wallet {random.randint(0, 1000000)}"
-        balance = str(random.uniform(1, 1000))
+        self.wallets: list[str] = []
+        if not self.as_superuser:
+            self.log_in(f"testuser_{slug}", "testpassword")
 
-        self.client.post(
+    def create_wallet(self, balance: float | None = None) -> str | None:
+        response = self.client.post(
             "/api/v1/wallets/",
-            headers={
-                "Authorization": f"Token {self.token}",
-                "Content-Type": "application/vnd.api+json",
-            },
+            headers=JSON_API_HEADERS,
             json={
                 "data": {
                     "type": "Wallet",
                     "attributes": {
-                        "label": label,
-                        "balance": balance,
+                        "label": f"Wallet {random.randint(0, 1000000)}",
+                        "balance": str(
+                            random.uniform(1, 1000) if balance is None else balance
+                        ),
                         "user": self.user["id"],
                         "status": "A",
                     },
@@ -66,52 +100,375 @@ class BlockchainUser(HttpUser):
             },
             name="/api/v1/wallets/ [POST] - Create Wallet",
         )
+        if response.status_code != 201:
+            return None
+        wallet_id = response.json()["data"]["id"]
+        self.wallets.append(wallet_id)
+        return wallet_id
 
-    @task
-    def create_transaction(self):
-        # First, create a wallet to associate the transaction with
-        label = f"Wallet {random.randint(0, 1000000)}"
-        balance = str(random.uniform(1, 1000))
-
-        wallet_response = self.client.post(
-            "/api/v1/wallets/",
-            headers={
-                "Authorization": f"Token {self.token}",
-                "Content-Type": "application/vnd.api+json",
-            },
+    def create_transaction(self, wallet_id: str, amount: float | None = None):
+        self.client.post(
+            "/api/v1/transactions/",
+            headers=JSON_API_HEADERS,
             json={
                 "data": {
-                    "type": "Wallet",
+                    "type": "TX",
                     "attributes": {
-                        "label": label,
-                        "balance": balance,
-                        "user": self.user["id"],
-                        "status": "A",
+                        "wallet": wallet_id,
+                        "txid": f"0x{random.randbytes(32).hex()}",
+                        "amount": str(
+                            random.uniform(0, 100) if amount is None else amount
+                        ),
                     },
                 }
             },
-            name="/api/v1/wallets/ [POST] - Create Wallet",
+            name="/api/v1/transactions/ [POST] - Create Transaction",
+        )
+
+    def list_wallets(self):
+        self.client.get(
+            "/api/v1/wallets/", name="/api/v1/wallets/ [GET] - List Wallets"
+        )
+
+    def retrieve_wallet(self, wallet_id: str):
+        self.client.get(
+            f"/api/v1/wallets/{wallet_id}/",
+            name="/api/v1/wallets/[id]/ [GET] - Retrieve Wallet",
+        )
+
+    def list_wallet_transactions(self, wallet_id: str):
+        self.client.get(
+            f"/api/v1/wallets/{wallet_id}/transactions/",
+            params={"page[size]": 20},
+            name="/api/v1/wallets/[id]/transactions/ [GET] - List Wallet Transactions",
+        )
+
+    def wallet_stats(self, wallet_id: str):
+        self.client.get(
+            f"/api/v1/wallets/{wallet_id}/stats/",
+            params={"bucket": random.choice(("day", "week", "month"))},
+            name="/api/v1/wallets/[id]/stats/ [GET] - Wallet Stats",
+        )
+
+
+# Created once by the first `HotWalletUser`, shared by all of them.
+hot_wallets: list[str] = []
+hot_wallets_lock = Semaphore()
+
+
+class HotWalletUser(ApiUser):
+    """
+    Many users posting TXs to a few wallets, LOCUST_HOT_WALLETS of them, which
+    contend for the lock of each wallet's balance.
+    """
+
+    scenario = "hot_wallet"
+    as_superuser = True
+    wait_time = between(0, 0.5)
+
+    def on_start(self):
+        super().on_start()
+        with hot_wallets_lock:
+            while len(hot_wallets) < int(os.getenv("LOCUST_HOT_WALLETS", 5)):
+                wallet_id = self.create_wallet(balance=1000)
+                if wallet_id is None:
+                    break
+                hot_wallets.append(wallet_id)
+
+    @task(10)
+    def post_to_hot_wallet(self):
+        if hot_wallets:
+            self.create_transaction(random.choice(hot_wallets))
+
+    @task(1)
+    def read_hot_wallet(self):
+        if hot_wallets:
+            self.retrieve_wallet(random.choice(hot_wallets))
+
+
+class DashboardUser(ApiUser):
+    """
+    A dashboard polling the wallets of its user, their TXs and stats.
+    """
+
+    scenario = "dashboard"
+    wait_time = between(1, 3)
+
+    def on_start(self):
+        super().on_start()
+        for _ in range(int(os.getenv("LOCUST_DASHBOARD_WALLETS", 3))):
+            wallet_id = self.create_wallet()
+            if wallet_id is None:
+                continue
+            for _ in range(int(os.getenv("LOCUST_DASHBOARD_TXS", 20))):
+                self.create_transaction(wallet_id)
+
+    @task(3)
+    def poll_wallets(self):
+        self.list_wallets()
+
+    @task(3)
+    def poll_wallet(self):
+        if self.wallets:
+            self.retrieve_wallet(random.choice(self.wallets))
+
+    @task(2)
+    def poll_transactions(self):
+        if self.wallets:
+            self.list_wallet_transactions(random.choice(self.wallets))
+
+    @task(2)
+    def poll_stats(self):
+        if self.wallets:
+            self.wallet_stats(random.choice(self.wallets))
+
+
+class DeepPaginationUser(ApiUser):
+    """
+    Walks the TX list of the whole table, LOCUST_PAGINATION_DEPTH pages deep.
+    """
+
+    scenario = "deep_pagination"
+    as_superuser = True
+    wait_time = constant(1)
+
+    @task
+    def walk_transactions(self):
+        response = self.client.get(
+            "/api/v1/transactions/",
+            params={"page[size]": 100},
+            name="/api/v1/transactions/ [GET] - First Page",
         )
-        if wallet_response.status_code == 201:
-            wallet_id = wallet_response.json()["data"]["id"]
-            txid = f"0x{random.randbytes(32).hex()}"
-            amount = str(random.uniform(0, 100))
-
-            self.client.post(
-                "/api/v1/transactions/",
-                headers={
-                    "Authorization": f"Token {self.token}",
-                    "Content-Type": "application/vnd.api+json",
-                },
-                json={
-                    "data": {
-                        "type": "TX",
-                        "attributes": {
-                            "wallet": wallet_id,
-                            "txid": txid,
-                            "amount": amount,
-                        },
-                    }
-                },
-                name="/api/v1/transactions/ [POST] - Create Transaction",
+        for _ in range(int(os.getenv("LOCUST_PAGINATION_DEPTH", 20)) - 1):
+            if response.status_code != 200:
+                return
+            url = response.json()["links"]["next"]
+            if url is None:
+                return
+            response = self.client.get(
+                url, name="/api/v1/transactions/ [GET] - Following Page"
             )
+
+
+class MixedUser(ApiUser):
+    """
+    A production-like mix of about seven reads to three writes.
+    """
+
+    scenario = "mixed"
+    wait_time = between(1, 4)
+
+    def on_start(self):
+        super().on_start()
+        for _ in range(3):
+            self.create_wallet()
+
+    @task(20)
+    def read_wallets(self):
+        self.list_wallets()
+
+    @task(20)
+    def read_wallet(self):
+        if self.wallets:
+            self.retrieve_wallet(random.choice(self.wallets))
+
+    @task(15)
+    def read_transactions(self):
+        if self.wallets:
+            self.list_wallet_transactions(random.choice(self.wallets))
+
+    @task(10)
+    def read_stats(self):
+        if self.wallets:
+            self.wallet_stats(random.choice(self.wallets))
+
+    @task(5)
+    def read_all_transactions(self):
+        self.client.get(
+            "/api/v1/transactions/",
+            params={"page[size]": 20},
+            name="/api/v1/transactions/ [GET] - First Page",
+        )
+
+    @task(25)
+    def write_transaction(self):
+        if self.wallets:
+            self.create_transaction(random.choice(self.wallets))
+
+    @task(5)
+    def write_wallet(self):
+        self.create_wallet()
+
+
+@events.init_command_line_parser.add_listener
+def add_arguments(parser):
+    parser.add_argument(
+        "--slo-config",
+        default="locust-slo.toml",
+        help="TOML file of the SLOs checked at the end of the run.",
+    )
+    parser.add_argument(
+        "--report-json",
+        default="locust-reports/{scenario}-{commit}.json",
+        help="Where to write the JSON report, {scenario} and {commit} are filled in.",
+    )
+    parser.add_argument(
+        "--baseline-json",
+        help="A JSON report of an earlier run to compare this one with.",
+    )
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            cwd=Path(__file__).parent,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return os.getenv("GIT_COMMIT", "unknown")
+
+
+def get_scenario(environment) -> str:
+    return "+".join(sorted({user.scenario for user in environment.user_classes}))
+
+
+def summarize(entry) -> dict:
+    summary = {
+        "requests": entry.num_requests,
+        "failures": entry.num_failures,
+        "fail_ratio": entry.fail_ratio,
+        "rps": entry.total_rps,
+        "avg": entry.avg_response_time,
+    }
+    for name, percentile in PERCENTILES.items():
+        summary[name] = entry.get_response_time_percentile(percentile)
+    return summary
+
+
+def build_report(environment) -> dict:
+    stats = environment.stats
+    total = StatsEntry(stats, "Total", None, use_response_times_cache=False)
+    for (name, _), entry in stats.entries.items():
+        if not name.endswith(SETUP):
+            total.extend(entry)
+    return {
+        "scenario": get_scenario(environment),
+        "commit": get_commit(),
+        "host": environment.host,
+        "users": environment.parsed_options.num_users,
+        "started_at": datetime.fromtimestamp(
+            stats.start_time, tz=timezone.utc
+        ).isoformat(),
+        "duration": stats.total.last_request_timestamp - stats.start_time
+        if stats.total.last_request_timestamp
+        else 0,
+        "total": summarize(total),
+        "requests": {
+            f"{method} {name}": summarize(entry)
+            for (name, method), entry in sorted(stats.entries.items())
+        },
+    }
+
+
+def load_slos(path: str, scenario: str) -> dict:
+    """
+    Returns the SLOs of `scenario`: its table of the config merged over `default`.
+    """
+    try:
+        with open(path, "rb") as f:
+            config = tomllib.load(f)
+    except FileNotFoundError:
+        logger.warning("No SLO config at %s, no SLOs are checked.", path)
+        return {}
+    slos = {**config.get("default", {})}
+    scenario_slos = config.get(scenario, {})
+    requests = {**slos.pop("requests", {}), **scenario_slos.get("requests", {})}
+    slos.update(scenario_slos)
+    slos["requests"] = requests
+    return slos
+
+
+def check_slos(report: dict, slos: dict) -> list[str]:
+    """
+    Returns the SLOs `report` breaches. Response time SLOs are maximums in
+    milliseconds, `fail_ratio` is a maximum and `min_rps` a minimum.
+    """
+    breaches = []
+
+    def check(label, summary, thresholds):
+        for key, threshold in thresholds.items():
+            if key == "requests":
+                continue
+            if key == "min_rps":
+                value, breached = summary["rps"], summary["rps"] < threshold
+            else:
+                value, breached = summary[key], summary[key] > threshold
+            if breached:
+                breaches.append(f"{label}: {key} {value:g} breaches {threshold:g}")
+
+    check("Total", report["total"], slos)
+    for name, thresholds in slos.get("requests", {}).items():
+        for request, summary in report["requests"].items():
+            # Keyed by name, with or without the method.
+            if name in (request, request.split(" ", 1)[1]):
+                check(request, summary, thresholds)
+    return breaches
+
+
+def compare_reports(report: dict, baseline: dict) -> list[str]:
+    lines = [f"Compared with {baseline['commit']} ({baseline['scenario']}):"]
+    for request, summary in [("Total", report["total"]), *report["requests"].items()]:
+        before = (
+            baseline["total"]
+            if request == "Total"
+            else baseline["requests"].get(request)
+        )
+        if before is None:
+            continue
+        changes = ", ".join(
+            f"{key} {before[key]:g} -> {summary[key]:g}"
+            for key in ("p50", "p95", "p99", "rps")
+        )
+        lines.append(f"  {request}: {changes}")
+    return lines
+
+
+@events.quitting.add_listener
+def report_and_check_slos(environment, **kwargs):
+    if isinstance(environment.runner, WorkerRunner):
+        return
+    options = environment.parsed_options
+    report = build_report(environment)
+    report["slo_breaches"] = check_slos(
+        report, load_slos(options.slo_config, report["scenario"])
+    )
+
+    path = Path(options.report_json.format(**report))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2))
+    logger.info("Wrote the report of the run to %s.", path)
+
+    for name in ("Total", *report["requests"]):
+        summary = report["total"] if name == "Total" else report["requests"][name]
+        logger.info(
+            "%s: p50 %gms, p95 %gms, p99 %gms, %.1f req/s, %d failures",
+            name,
+            summary["p50"],
+            summary["p95"],
+            summary["p99"],
+            summary["rps"],
+            summary["failures"],
+        )
+    if options.baseline_json:
+        baseline = json.loads(Path(options.baseline_json).read_text())
+        for line in compare_reports(report, baseline):
+            logger.info(line)
+
+    for breach in report["slo_breaches"]:
+        logger.error("SLO breached, %s", breach)
+    # Set either way, locust would otherwise exit with 1 on any failed request and
+    # make the `fail_ratio` SLOs moot.
+    environment.process_exit_code = 1 if report["slo_breaches"] else 0